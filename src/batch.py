@@ -0,0 +1,192 @@
+from pathlib import Path
+import os
+import csv
+import json
+import time
+import logging
+import threading
+
+from escpos.exceptions import Error as EscposError
+
+# 進捗を通知する間隔（秒）
+BATCH_PROGRESS_INTERVAL = 0.5
+# 結果に保持する失敗行の上限（件数のみ数え続ける）
+BATCH_MAX_FAILURES_KEPT = 1000
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+def iter_rows(path):
+    """
+    CSV（1行目が見出し）またはJSONL（1行に1つのオブジェクト）のデータを1行ずつ読み込み\n
+    ファイル全体は読み込まないため、ファイルの大きさに関係なく一定のメモリで処理できます。
+
+    :param path: データファイルのパス（拡張子 .jsonl / .ndjson はJSONL、それ以外はCSV）
+    :return: (行番号, 値の辞書, 読み込みエラー, 読み込み位置(バイト))のイテレータ（エラーがない場合はNone）
+    :rtype: Iterator[tuple]
+    """
+    path = Path(path)
+    if path.suffix.lower() in (".jsonl", ".ndjson"):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            for row_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    values = json.loads(line)
+                except ValueError as e:
+                    yield row_number, None, ValueError(f"JSONとして読み込めません: {e}"), f.buffer.tell()
+                    continue
+                if not isinstance(values, dict):
+                    yield row_number, None, ValueError("1行に1つのオブジェクトが必要です"), f.buffer.tell()
+                    continue
+                yield row_number, values, None, f.buffer.tell()
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            for values in reader:
+                yield reader.line_num, values, None, f.buffer.tell()
+
+
+class BatchProgress:
+    """
+    一括印刷の進捗・結果
+    """
+    def __init__(self, total_bytes=0):
+        """
+        進捗の初期化
+
+        :param int total_bytes: データファイルの大きさ（進捗率の計算用）
+        """
+        self.started = time.perf_counter()
+        self.total_bytes = total_bytes
+        self.read_bytes = 0
+        self.processed = 0  # 処理した行数
+        self.printed = 0  # 印刷した行数
+        self.failed = 0  # 失敗した行数
+        self.failures = []  # (行番号, エラー内容)
+        self.cancelled = False
+
+    @property
+    def elapsed(self):
+        """
+        経過時間（秒）
+
+        :rtype: float
+        """
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_minute(self):
+        """
+        1分あたりの処理行数
+
+        :rtype: float
+        """
+        elapsed = self.elapsed
+        return self.processed * 60 / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def ratio(self):
+        """
+        進捗率（0.0～1.0、読み込んだファイルの位置から推定）
+
+        :rtype: float
+        """
+        return min(self.read_bytes / self.total_bytes, 1.0) if self.total_bytes else 0.0
+
+    def add_failure(self, row_number, message):
+        """
+        失敗した行を記録
+
+        :param int row_number: 行番号
+        :param str message: エラー内容
+        """
+        self.failed += 1
+        if len(self.failures) < BATCH_MAX_FAILURES_KEPT:
+            self.failures.append((row_number, message))
+        logger.warning(f"{row_number}行目: {message}")
+
+    def summary(self):
+        """
+        進捗の要約
+
+        :rtype: str
+        """
+        return (f"{self.processed}行処理 (印刷 {self.printed} / 失敗 {self.failed}) "
+                f"{self.ratio:.0%} {self.rows_per_minute:.0f}行/分")
+
+
+class BatchPrintJob:
+    """
+    データファイルの各行をテンプレートに差し込み、1つの接続で続けて印刷するクラス\n
+    行ごとのエラー（値の不足・バーコードの不正・送信エラー）は記録して次の行へ進みます。
+    """
+    def __init__(self, handler, template, source, progress_callback=None, cancel_event=None):
+        """
+        一括印刷の初期化
+
+        :param handler: PrinterHandler
+        :param template: コンパイル済みテンプレート（template.compile_templateの戻り値）
+        :param source: データファイル（CSVまたはJSONL）のパス
+        :param progress_callback: 進捗の通知先（BatchProgressを引数に呼び出し、印刷スレッドから呼ばれる）
+        :param cancel_event: 中止用のイベント（threading.Event）
+        """
+        self.handler = handler
+        self.template = template
+        self.source = Path(source)
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event or threading.Event()
+
+    def run(self):
+        """
+        一括印刷を実行
+
+        :return: 結果
+        :rtype: BatchProgress
+        """
+        progress = BatchProgress(total_bytes=os.path.getsize(self.source))
+        last_notified = 0.0
+        rows = iter_rows(self.source)
+        try:
+            for row_number, values, error, position in rows:
+                if self.cancel_event.is_set():
+                    progress.cancelled = True
+                    break
+                progress.processed += 1
+                progress.read_bytes = position
+                if error is None:
+                    try:
+                        data = self.template.render(self.handler, values)
+                    except Exception as e:
+                        error = e
+                if error is not None:
+                    progress.add_failure(row_number, str(error))
+                else:
+                    try:
+                        # 接続は共有の接続を使い回し、切断されていた場合は次の行で接続し直す
+                        self.handler.send(data, self.template.logos)
+                        progress.printed += 1
+                    except (OSError, EscposError) as e:
+                        progress.add_failure(row_number, f"送信エラー: {e}")
+
+                now = time.perf_counter()
+                if now - last_notified >= BATCH_PROGRESS_INTERVAL:
+                    last_notified = now
+                    self._notify(progress)
+        finally:
+            rows.close()
+        if not progress.cancelled:
+            progress.read_bytes = progress.total_bytes
+        self._notify(progress)
+        logger.info(f"一括印刷: {progress.summary()} {progress.elapsed:.1f}秒")
+        return progress
+
+    def _notify(self, progress):
+        """
+        進捗を通知
+
+        :param BatchProgress progress: 進捗
+        """
+        if self.progress_callback is not None:
+            self.progress_callback(progress)
@@ -0,0 +1,204 @@
+from pathlib import Path
+import sys
+import json
+import time
+import argparse
+
+from PIL import Image, ImageDraw
+
+from bench_render_modes import APP_CONFIG_FILE, default_config
+from document import blocks_from_text
+from escpos_emulator import EmulatorServer
+from printer import PrinterHandler, TextTagParser
+from raster_renderer import ReceiptRasterizer
+import glyph_cache
+
+"""
+印刷経路の通しベンチマーク
+代表的な文書をタグ解析・印刷データ生成・送信の段階ごとに計測し、ローカルのエミュレータへ送信します。
+印刷データ生成は、グリフキャッシュ・文字セルのキャッシュを空にした状態（cold）と、使い回した状態（warm）を別に計測します。
+保存済みの基準値と比較して、遅くなった段階・バイト数が変わった文書を表示します。
+
+使い方: python bench_print_path.py [--repeat 5] [--save-baseline] [--tolerance 0.2] [--print-speed 0]
+"""
+
+# 基準値の保存先（計測環境ごとに異なるため、キャッシュフォルダに保存）
+BENCH_BASELINE_FILE = Path(__file__).resolve().parent / "../cache/bench_print_path.json"
+# 送信完了後、エミュレータが最後のバイトを受け取るまで待つ上限（秒）
+RECEIVE_WAIT_SECONDS = 30
+
+# ベンチマーク用の文書（タグ記法のテキスト, 画像の高さ（ドット、0は画像なし））
+WORKLOADS = {
+    "plain": ("\n".join(f"商品{i:02d}　　　　　　　　¥{i * 110:>6,}" for i in range(30)), 0),
+    "emoji_kanji": ("<ALIGN:CENTER>🍣🍺 本日のおすすめ 🍜🍰\n<ALIGN:LEFT>"
+                    + "\n".join("𠮷野家の𩸽定食 😀👍🏽 ありがとう🙇" for _ in range(10)), 0),
+    "barcodes": ("<QR:https://example.com/receipt/12345>\n<ITF:12345678901231>\n<EAN13:4901234567894>\n"
+                 "<C39:ABC-1234>\n<C128:MiniCapturePrint-128>", 0),
+    "tall_image": ("", 2400),
+    "mixed": ("<ALIGN:CENTER>領収書\n<HR>\n<ALIGN:LEFT>"
+              + "\n".join(f"ホットコーヒー☕ x{i}　　¥{i * 380:>5,}" for i in range(1, 8))
+              + "\n<HR>\n<ALIGN:RIGHT>合計 ¥10,640\n<ALIGN:CENTER><QR:https://example.com/r/98765>\nまたのご来店をお待ちしております", 480),
+}
+
+
+def make_image(height):
+    """
+    計測用の画像（幅いっぱいのグラデーションと図形）を作成
+
+    :param int height: 画像の高さ（ドット）
+    :rtype: Image.Image
+    """
+    image = Image.linear_gradient("L").resize((512, height))
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 120):
+        draw.ellipse((40, y + 10, 472, y + 110), outline=0, width=6)
+    return image.convert("1")
+
+
+def reset_caches(cold):
+    """
+    計測前にキャッシュを空にする（コンパイル済み印刷データは毎回、グリフ・文字セルはcoldの場合のみ）
+
+    :param bool cold: グリフキャッシュ・文字セルのキャッシュも空にするかどうか
+    """
+    with PrinterHandler._compiled_cache_lock:
+        PrinterHandler._compiled_cache.clear()  # キャッシュを使わずに毎回生成
+        PrinterHandler._compiled_cache_bytes = 0
+    if cold:
+        glyph_cache.shared_cache().clear()
+        with ReceiptRasterizer._cell_cache_lock:
+            ReceiptRasterizer._cell_cache.clear()
+
+
+def measure(handler, server, text, image, cold=False):
+    """
+    文書1件の段階ごとの時間・バイト数を計測
+
+    :param handler: PrinterHandler（エミュレータに接続）
+    :param server: EmulatorServer
+    :param str text: タグ記法のテキスト
+    :param image: 印刷する画像（ない場合はNone）
+    :param bool cold: グリフ・文字セルのキャッシュを空にしてから計測するかどうか
+    :return: 計測結果
+    :rtype: dict
+    """
+    reset_caches(cold)
+    started = time.perf_counter()
+    commands = TextTagParser(blocks=blocks_from_text(text)).parse() if text else []
+    parsed = time.perf_counter()
+    data = handler.compile(commands, image, enable_text_print=bool(text), enable_image_print=image is not None,
+                           should_cut_paper=True)
+    rendered = time.perf_counter()
+    received_before = sum(session.received_bytes for session in server.sessions)
+    handler.send(data)
+    # エミュレータが最後のバイトを受け取るまで（印刷ボタンから最後のバイトまで）
+    deadline = rendered + RECEIVE_WAIT_SECONDS
+    while sum(session.received_bytes for session in server.sessions) - received_before < len(data):
+        if time.perf_counter() > deadline:
+            raise TimeoutError("エミュレータが印刷データを受け取れません")
+        time.sleep(0.0005)
+    finished = time.perf_counter()
+    return {
+        "bytes": len(data),
+        "writes": handler.connection.last_send.syscalls,
+        "parse_ms": (parsed - started) * 1000,
+        "render_ms": (rendered - parsed) * 1000,
+        "transmit_ms": (finished - rendered) * 1000,
+        "total_ms": (finished - started) * 1000,
+    }
+
+
+def run(repeat, print_speed, config_file):
+    """
+    すべての文書を計測（段階ごとに最小値を採用、キャッシュを空にした計測と使い回した計測を交互に実行）
+
+    :param int repeat: 繰り返し回数
+    :param float print_speed: エミュレータで模擬する印字速度（mm/秒、0で制限なし）
+    :param config_file: アプリの設定ファイルのパス
+    :return: 文書ごとの計測結果
+    :rtype: dict
+    """
+    server = EmulatorServer(port=0, print_speed=print_speed).start()
+    handler = PrinterHandler("127.0.0.1", config=default_config(config_file), port=server.address[1])
+    results = {}
+    try:
+        for name, (text, image_height) in WORKLOADS.items():
+            image = make_image(image_height) if image_height else None
+            cold_runs, runs = [], []
+            for _ in range(repeat):
+                cold_runs.append(measure(handler, server, text, image, cold=True))
+                runs.append(measure(handler, server, text, image))
+            result = {key: min(run[key] for run in runs) for key in runs[0]}
+            result["cold_render_ms"] = min(run["render_ms"] for run in cold_runs)
+            result["cold_total_ms"] = min(run["total_ms"] for run in cold_runs)
+            result["jobs_per_minute"] = 60000 / result["total_ms"] if result["total_ms"] else 0.0
+            results[name] = result
+    finally:
+        handler.connection.close()
+        server.stop()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    基準値と比較して、遅くなった段階・バイト数の変化を列挙
+
+    :param dict results: 計測結果
+    :param dict baseline: 基準値
+    :param float tolerance: 許容する遅れの割合（0.2で20%）
+    :return: 問題の説明のリスト
+    :rtype: list[str]
+    """
+    problems = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["bytes"] != base["bytes"]:
+            problems.append(f"{name}: バイト数が変わりました {base['bytes']:,} → {result['bytes']:,}")
+        for key in ("parse_ms", "render_ms", "cold_render_ms", "transmit_ms", "total_ms", "cold_total_ms"):
+            if key not in base:
+                continue  # 以前の形式の基準値にない項目
+            # 1ms未満の差は計測の揺らぎとして無視
+            if result[key] > base[key] * (1 + tolerance) and result[key] - base[key] >= 1.0:
+                problems.append(f"{name}: {key} が遅くなりました {base[key]:.1f} → {result[key]:.1f}")
+    return problems
+
+
+def print_results(results, baseline):
+    """
+    計測結果を表形式で表示（基準値がある場合は合計時間の増減も表示）
+
+    :param dict results: 計測結果
+    :param dict baseline: 基準値
+    """
+    print(f"{'文書':<12}{'バイト数':>10}{'書込回数':>8}{'解析(ms)':>10}{'生成(ms)':>10}{'生成cold':>10}{'送信(ms)':>10}{'合計(ms)':>10}{'件/分':>8}{'基準比':>8}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        ratio = f"{result['total_ms'] / base['total_ms']:.0%}" if base and base["total_ms"] else "-"
+        print(f"{name:<12}{result['bytes']:>10,}{result['writes']:>8}{result['parse_ms']:>10.1f}{result['render_ms']:>10.1f}"
+              f"{result['cold_render_ms']:>10.1f}{result['transmit_ms']:>10.1f}{result['total_ms']:>10.1f}{result['jobs_per_minute']:>8.0f}{ratio:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="印刷経路の通しベンチマーク")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数")
+    parser.add_argument("--print-speed", type=float, default=0, help="エミュレータで模擬する印字速度(mm/秒、0で制限なし)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="基準値から許容する遅れの割合")
+    parser.add_argument("--baseline", type=Path, default=BENCH_BASELINE_FILE, help="基準値のファイル")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果を基準値として保存")
+    parser.add_argument("--config", type=Path, default=APP_CONFIG_FILE, help="アプリの設定ファイル（フォント構成を合わせる）")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.print_speed, args.config)
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    print_results(results, baseline)
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"基準値を保存しました: {args.baseline.resolve()}")
+        sys.exit(0)
+    problems = compare(results, baseline, args.tolerance)
+    for problem in problems:
+        print(f"退行: {problem}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,135 @@
+from pathlib import Path
+import argparse
+import time
+
+from config import ConfigHandler, build_tm88iv_config
+from printer import PrinterHandler
+
+"""
+テキスト印字方式（標準 / 一括ラスター）の比較ベンチマーク
+プリンタへは送信せず、コンパイル結果のバイト数・時間と、推定の転送時間・印字時間を比較します。
+
+使い方: python bench_render_modes.py [--repeat 5] [--link-mbps 100] [--print-speed 200]
+"""
+
+# srcディレクトリ（フォントなどの相対パスの基準）
+SRC_DIR = Path(__file__).resolve().parent
+# アプリの設定ファイル
+APP_CONFIG_FILE = SRC_DIR / "../config/config.json"
+# TM-T88IVの縦方向の解像度（ドット/mm、180dpi）
+DOTS_PER_MM = 180 / 25.4
+# 標準印字の1行の送り量（ドット、1/6インチ）
+NATIVE_LINE_DOTS = 30
+
+# ベンチマーク用の文書（TextTagParserの出力形式）
+WORKLOADS = {
+    "plain": [("row", b"\x1b\x61\x00", {})] + [
+        command for i in range(20)
+        for command in (("jp2", f"商品{i:02d}　　　　　　　　¥{i * 110:>6,}", {"bflg": True}), ("jp2", "\n", {"bflg": True}))
+    ],
+    "emoji_kanji": [("row", b"\x1b\x61\x01", {}),
+                    ("jp2", "🍣🍺 本日のおすすめ 🍜🍰", {"bflg": True, "dw": True, "dh": True}),
+                    ("jp2", "\n", {"bflg": True}),
+                    ("row", b"\x1b\x61\x00", {})] + [
+        command for _ in range(10)
+        for command in (("jp2", "𠮷野家の𩸽定食 😀👍🏽 ありがとう🙇", {"bflg": True}), ("jp2", "\n", {"bflg": True}))
+    ],
+    "mixed": [("row", b"\x1b\x61\x01", {}),
+              ("jp2", "領収書", {"bflg": True, "dw": True, "dh": True}),
+              ("jp2", "\n", {"bflg": True}),
+              ("row", b"\x1b\x61\x00", {}),
+              ("jp2", "─────────────────────", {"bflg": True}),
+              ("jp2", "\n", {"bflg": True}),
+              ("jp2", "合計 ¥1,234 ☕", {"bflg": True, "underline": True}),
+              ("jp2", "\n", {"bflg": True}),
+              ("qr", "https://example.com/receipt/12345", {}),
+              ("jp2", "またのご来店をお待ちしております", {"bflg": True, "wbreverse": True}),
+              ("jp2", "\n", {"bflg": True})],
+}
+
+
+def default_config(config_file=APP_CONFIG_FILE):
+    """
+    アプリと同じ構成（フォント・絵文字の描画設定）のTM88IVクラス用設定
+
+    :param config_file: アプリの設定ファイルのパス（存在しない場合は既定の設定）
+    :rtype: dict
+    """
+    config = ConfigHandler(config_file, on_error=print)
+    tm88iv_config = build_tm88iv_config(config, SRC_DIR)
+    tm88iv_config.pop("icon_file", None)  # GUI用のファイルは不要
+    return tm88iv_config
+
+
+def estimate_paper_dots(handler, commands):
+    """
+    印字される紙の長さ（ドット）を推定
+
+    :param handler: PrinterHandler
+    :param commands: コマンドのリスト
+    :rtype: int
+    """
+    if handler.render_mode == "raster":
+        return sum(segment.height for kind, segment in handler.rasterizer.render(commands) if kind == "image")
+    dots = 0
+    for arg_type, arg_command, arg_dict in commands:
+        if arg_type == "jp2":
+            dots += arg_command.count("\n") * NATIVE_LINE_DOTS * (2 if arg_dict.get("dh") else 1)
+    return dots
+
+
+def run(repeat, link_mbps, print_speed, config_file):
+    """
+    ベンチマークを実行して結果を表示
+
+    :param int repeat: 繰り返し回数（最小値を採用）
+    :param float link_mbps: 推定に使う回線速度（Mbps）
+    :param float print_speed: 推定に使う印字速度（mm/秒）
+    :param config_file: アプリの設定ファイルのパス
+    """
+    config = default_config(config_file)
+    print(f"{'文書':<12}{'方式':<8}{'バイト数':>10}{'書込回数':>8}{'生成(ms)':>10}{'転送(ms)':>10}{'印字(ms)':>10}")
+    for name, commands in WORKLOADS.items():
+        for mode in ("native", "raster"):
+            handler = PrinterHandler("127.0.0.1", config=config, render_mode=mode)
+            best = None
+            for _ in range(repeat):
+                PrinterHandler._compiled_cache.clear()  # キャッシュを使わずに毎回生成
+                PrinterHandler._compiled_cache_bytes = 0
+                started = time.perf_counter()
+                data = handler.compile(commands, enable_text_print=True)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            writes = count_writes(handler, commands)
+            transmit = len(data) * 8 / (link_mbps * 1_000_000)
+            paper = estimate_paper_dots(handler, commands) / DOTS_PER_MM / print_speed
+            print(f"{name:<12}{mode:<8}{len(data):>10,}{writes:>8}{best * 1000:>10.1f}{transmit * 1000:>10.2f}{paper * 1000:>10.0f}")
+
+
+def count_writes(handler, commands):
+    """
+    印字方式ごとのプリンタへの書き込み回数（コンパイルせずに出力した場合）
+
+    :param handler: PrinterHandler
+    :param commands: コマンドのリスト
+    :rtype: int
+    """
+    writes = []
+    # コンパイル時の取り込みと同じロックで、他のスレッドの出力と混ざらないようにする
+    with PrinterHandler._output_lock:
+        handler.tm_print._raw = writes.append
+        try:
+            handler._emit_commands(commands, None, True, False)
+        finally:
+            del handler.tm_print._raw
+    return len(writes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="テキスト印字方式の比較ベンチマーク")
+    parser.add_argument("--repeat", type=int, default=5, help="繰り返し回数")
+    parser.add_argument("--link-mbps", type=float, default=100.0, help="推定に使う回線速度(Mbps)")
+    parser.add_argument("--print-speed", type=float, default=200.0, help="推定に使う印字速度(mm/秒)")
+    parser.add_argument("--config", type=Path, default=APP_CONFIG_FILE, help="アプリの設定ファイル（フォント構成を合わせる）")
+    args = parser.parse_args()
+    run(args.repeat, args.link_mbps, args.print_speed, args.config)
@@ -1,18 +1,72 @@
 from pathlib import Path
-from tkinter import messagebox
 import json
 import os
 
+
+def show_error_dialog(message):
+    """
+    エラーダイアログを表示（GUIを使わない起動でtkinterを読み込まないよう、表示時に読み込む）
+
+    :param str message: エラーメッセージ
+    """
+    from tkinter import messagebox
+    messagebox.showerror("エラー", message)
+
+
+def build_tm88iv_config(config, src_dir):
+    """
+    アプリの設定からTM88IVクラス用設定（フォントファイル・絵文字設定）を作成
+
+    :param config: アプリの設定（ConfigHandler）
+    :param src_dir: srcディレクトリのパス
+    :return: TM88IVクラス用設定
+    :rtype: dict
+    """
+    src_dir = Path(src_dir)
+    tm88iv_config = {
+        "emoji_font_file": src_dir / "../fonts/OpenMoji-black-glyf.ttf",  # 絵文字フォント
+        "kanji_font_file": src_dir / "../fonts/NotoSansCJKjp-Medium.otf", # 日本語フォント
+        "fallback_font_file_p01": src_dir / "../fonts/unifont_jp-17.0.03.otf",   # フォールバックフォント Unifont (BMP)
+        "fallback_font_file_p2": src_dir / "../fonts/unifont_upper-17.0.03.otf", # フォールバックフォント Unifont (SIP)
+        "fallback_jigmo_file_p01": src_dir / "../fonts/jigmo.ttf",  # フォールバックフォント Jigmo Plane 0 (BMP) & Plane 1 (SMP)
+        "fallback_jigmo_file_p2": src_dir / "../fonts/jigmo2.ttf",  # フォールバックフォント Jigmo Plane 2 (SIP)
+        "fallback_jigmo_file_p3": src_dir / "../fonts/jigmo3.ttf",  # フォールバックフォント JigmoPlane 3 (TIP)
+        # TM88IVクラスの引数ではないけど、ファイルチェックの関係上含める
+        "icon_file": src_dir / "minicaptureprint.ico"  # アイコンファイル
+    }
+
+    # 絵文字フォント変更有効化している場合は、設定からフォントファイルと描画設定を取得して設定
+    if config.get("printer_emoji_font_enabled", False):
+        tm88iv_config["emoji_font_file"] = src_dir / "../fonts" / config.get("printer_emoji_font","OpenMoji-black-glyf.ttf")
+        tm88iv_config["emoji_font_size"] = config.get("printer_emoji_font_size", 20)  # 絵文字フォントサイズ
+        tm88iv_config["emoji_font_adjust_x"] = config.get("printer_emoji_font_adjust_x",0) # 絵文字フォントのX座標調整
+        tm88iv_config["emoji_font_adjust_y"] = config.get("printer_emoji_font_adjust_y",0) # 絵文字フォントのX座標調整
+    return tm88iv_config
+
+
+def missing_files(tm88iv_config):
+    """
+    TM88IVクラス用設定のうち、存在しないファイルを取得
+
+    :param dict tm88iv_config: TM88IVクラス用設定
+    :return: 存在しないファイルのパスのリスト
+    :rtype: list
+    """
+    return [path for key, path in tm88iv_config.items() if "_file" in key and not os.path.exists(path)]
+
+
 class ConfigHandler:
     """
     設定ファイルを読み書きするクラス
     """
-    def __init__(self, config_file=Path("../config/config.json")):
+    def __init__(self, config_file=Path("../config/config.json"), on_error=None):
         """
         設定ファイルを読み書きするクラス
 
         :param config_file: 設定ファイルのパス（Pathオブジェクト推奨）
+        :param on_error: エラーの通知先（省略時はエラーダイアログを表示）
         """
+        self.on_error = on_error or show_error_dialog
         # 文字列で渡された場合もPathに変換
         self.config_file = config_file if isinstance(config_file, Path) else Path(config_file)
         self.config_file = self.config_file.resolve()  # 絶対パスに変換
@@ -33,10 +87,10 @@ class ConfigHandler:
             with open(self.config_file, "r", encoding="utf-8") as f:
                 return json.load(f)
         except FileNotFoundError:
-            messagebox.showerror("エラー", f"設定ファイル '{self.config_file}' が見つかりません。")
+            self.on_error(f"設定ファイル '{self.config_file}' が見つかりません。")
             return {}
         except json.JSONDecodeError:
-            messagebox.showerror("エラー", f"設定ファイル '{self.config_file}' の形式が正しくありません。")
+            self.on_error(f"設定ファイル '{self.config_file}' の形式が正しくありません。")
             return {}
 
     def save_config(self):
@@ -51,7 +105,7 @@ class ConfigHandler:
             with open(self.config_file, "w", encoding="utf-8") as f:
                 json.dump(self.config, f, indent=4, ensure_ascii=False)
         except Exception as e:
-            messagebox.showerror("エラー", f"設定ファイルの保存中にエラーが発生しました:\n{e}")
+            self.on_error(f"設定ファイルの保存中にエラーが発生しました:\n{e}")
 
     def get(self, key, default=None):
         """
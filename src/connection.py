@@ -0,0 +1,431 @@
+from contextlib import contextmanager
+import os
+import time
+import socket
+import struct
+import logging
+import threading
+
+import timing
+
+# 接続を保持する時間（秒、印刷がないまま経過したら切断し、他の端末からの印刷を妨げない）
+CONNECTION_IDLE_TIMEOUT = 60
+# TCPキープアライブ：無通信から確認を始めるまでの秒数
+KEEPALIVE_IDLE = 10
+# TCPキープアライブ：確認の間隔（秒）
+KEEPALIVE_INTERVAL = 5
+# TCPキープアライブ：応答がない場合に切断とみなす回数
+KEEPALIVE_COUNT = 3
+# 送信単位（バイト、この大きさごとにソケットへ書き込み、進捗通知・中止確認を行う）
+SEND_CHUNK_BYTES = 64 * 1024
+# ソケットの送信バッファの大きさ（バイト、大きい画像でも書き込みが細切れにならないよう拡大）
+SOCKET_SEND_BUFFER_BYTES = 256 * 1024
+# プリンタの初期化コマンド（ESC @）
+ESC_POS_INITIALIZE = b"\x1b\x40"
+# リアルタイムステータス送信コマンド（DLE EOT n）
+ESC_POS_REALTIME_STATUS = b"\x10\x04"
+# リアルタイムステータスの応答待ち時間（秒）
+STATUS_RESPONSE_TIMEOUT = 2
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+class SendStats:
+    """
+    1回の送信の実績（送信バイト数・システムコール数・所要時間）
+    """
+    def __init__(self, total_bytes):
+        """
+        送信の実績の初期化
+
+        :param int total_bytes: 送信するバイト数
+        """
+        self.total_bytes = total_bytes
+        self.sent_bytes = 0
+        self.syscalls = 0  # ソケットへの書き込み（send）の回数
+        self.flushes = 0  # 送信単位ごとの書き込みの回数
+        self.seconds = 0.0
+        self.zero_copy = False  # ファイルからsendfileで送信したかどうか（書き込み回数は記録しない）
+
+    @property
+    def throughput(self):
+        """
+        送信速度（バイト/秒）
+
+        :rtype: float
+        """
+        return self.sent_bytes / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        """
+        実績の要約
+
+        :rtype: str
+        """
+        if self.zero_copy:
+            return (f"{self.seconds * 1000:.1f}ms {self.sent_bytes}/{self.total_bytes}バイト "
+                    f"ファイルから送信 ({self.throughput / 1024:.0f}KB/s)")
+        return (f"{self.seconds * 1000:.1f}ms {self.sent_bytes}/{self.total_bytes}バイト "
+                f"書き込み {self.syscalls}回 (送信単位 {self.flushes}回)")
+
+
+class PrinterConnection:
+    """
+    プリンタとの接続を保持するクラス\n
+    印刷のたびに接続し直さず、キープアライブ付きの接続を使い回します。
+    送信前に接続の状態を確認し、アイドル中の切断やプリンタの再起動後は自動で接続し直します。
+    複数のスレッドからの送信はロックで順番に処理します。
+    """
+    def __init__(self, tm_print, idle_timeout=CONNECTION_IDLE_TIMEOUT, chunk_bytes=SEND_CHUNK_BYTES,
+                 send_buffer_bytes=SOCKET_SEND_BUFFER_BYTES):
+        """
+        接続管理の初期化
+
+        :param tm_print: プリンタオブジェクト（python-escposのNetwork）
+        :param idle_timeout: 接続を保持する時間（秒、0の場合は送信ごとに切断）
+        :param int chunk_bytes: 送信単位（バイト）
+        :param int send_buffer_bytes: ソケットの送信バッファの大きさ（バイト）
+        """
+        self.tm_print = tm_print
+        self.idle_timeout = idle_timeout
+        self.chunk_bytes = chunk_bytes
+        self.send_buffer_bytes = send_buffer_bytes
+        self.lock = threading.RLock()
+        self.connects = 0  # 接続した回数
+        self.reuses = 0  # 接続を使い回した回数
+        self.status = None  # 状態監視による最新の状態（status_monitor.PrinterStatus、未確認の場合はNone）
+        self.last_send = None  # 直前の送信の実績（SendStats）
+        self.total_bytes = 0  # 送信したバイト数の合計
+        self.total_syscalls = 0  # ソケットへの書き込み回数の合計
+        self._idle_timer = None
+
+    @contextmanager
+    def session(self):
+        """
+        接続を確保して占有するコンテキストマネージャ（複数回の送信をまとめる場合）
+
+        :return: 接続済みのプリンタオブジェクト
+        """
+        with self.lock:
+            self._cancel_idle_timer()
+            self.ensure_open()
+            try:
+                yield self.tm_print
+            finally:
+                self._schedule_idle_close()
+
+    def send(self, data, progress_callback=None, cancel_event=None):
+        """
+        バイト列を送信（送信を始める前に失敗した場合は1回だけ接続し直して再送）\n
+        送信単位ごとに書き込み、その都度進捗の通知・中止の確認を行います。
+        書き込み回数・所要時間はlast_sendに記録します。
+
+        :param bytes data: ESC/POSのバイト列
+        :param progress_callback: 進捗の通知先（送信済みバイト数, 全体のバイト数を引数に呼び出し）
+        :param cancel_event: 中止用のイベント（threading.Event）
+        :return: 送信を完了したかどうか（中止した場合はFalse）
+        :rtype: bool
+        """
+        if self.status is not None and self.status.blocked:
+            # プリンタの応答で印刷できない状態が分かっている場合は、送信のタイムアウトを待たずに失敗させる
+            # （問い合わせで接続できなかっただけの場合は、復帰している可能性があるため送信を試みる）
+            raise ConnectionError(f"{self.tm_print.host}:{self.tm_print.port} は印刷できない状態です（{self.status.describe()}）")
+        started = time.perf_counter()
+        stats = SendStats(len(data))
+        self.last_send = stats
+        view = memoryview(data)
+        try:
+            with self.session(), timing.stage("send", nbytes=len(data)):
+                retried = False
+                while stats.sent_bytes < len(data):
+                    if cancel_event is not None and cancel_event.is_set():
+                        logger.info(f"送信を中止しました: {stats.sent_bytes}/{len(data)}バイト")
+                        return False
+                    end = min(stats.sent_bytes + self.chunk_bytes, len(data))
+                    while stats.sent_bytes < end:
+                        try:
+                            written = self.tm_print._device.send(view[stats.sent_bytes:end])
+                        except OSError as e:
+                            if stats.sent_bytes or retried:
+                                raise  # 途中まで送信済みの場合は再送すると重複して印刷されるため中断
+                            logger.warning(f"送信に失敗したため接続し直します: {e}")
+                            self._reconnect()
+                            retried = True
+                            continue
+                        stats.sent_bytes += written
+                        stats.syscalls += 1
+                    stats.flushes += 1
+                    if progress_callback is not None:
+                        progress_callback(stats.sent_bytes, len(data))
+        finally:
+            stats.seconds = time.perf_counter() - started
+            self.total_bytes += stats.sent_bytes
+            self.total_syscalls += stats.syscalls
+        logger.info(f"送信: {stats.summary()} (接続 {self.connects}回 / 再利用 {self.reuses}回)")
+        return True
+
+    def send_file(self, path):
+        """
+        ファイルの内容をそのまま送信（書き出し済みの印刷データの再生用）
+
+        ファイルの内容をPython側に読み込まず、OSが対応している場合はsendfileでカーネル内で直接ソケットへ送ります
+        （対応していない場合は通常の書き込みで送信）。進捗の通知・途中での中止はできません。
+
+        :param path: 送信するファイルのパス
+        :return: 送信の実績
+        :rtype: SendStats
+        """
+        if self.status is not None and self.status.blocked:
+            raise ConnectionError(f"{self.tm_print.host}:{self.tm_print.port} は印刷できない状態です（{self.status.describe()}）")
+        stats = SendStats(os.path.getsize(path))
+        stats.zero_copy = True
+        self.last_send = stats
+        started = time.perf_counter()
+        try:
+            with open(path, "rb") as f, self.session(), timing.stage("send_file", nbytes=stats.total_bytes):
+                stats.sent_bytes = self.tm_print._device.sendfile(f)
+                stats.flushes = 1
+        finally:
+            stats.seconds = time.perf_counter() - started
+            self.total_bytes += stats.sent_bytes
+        logger.info(f"送信: {stats.summary()} (接続 {self.connects}回 / 再利用 {self.reuses}回)")
+        return stats
+
+    def query_status(self, requests=(1, 2, 3, 4)):
+        """
+        リアルタイムステータス（DLE EOT n）を問い合わせ\n
+        送信中は待たずにNoneを返却します（状態監視のスレッドが印刷を妨げないため）。
+        接続を保持している場合はその接続で問い合わせ、アイドル切断までの時間は延長しません。
+        保持していない場合は問い合わせ用に短時間だけ接続して切断します（他の端末からの印刷を妨げないため）。
+
+        :param requests: 問い合わせるステータスの種類（n）
+        :return: 種類ごとの応答（1バイトの値）のリスト（送信中の場合はNone）
+        :rtype: list[int]
+        """
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            if self.is_healthy():
+                return self._query_on(self.tm_print._device, requests)
+            address = (self.tm_print.host, int(self.tm_print.port))
+            with socket.create_connection(address, timeout=STATUS_RESPONSE_TIMEOUT) as sock:
+                return self._query_on(sock, requests)
+        finally:
+            self.lock.release()
+
+    def _query_on(self, sock, requests):
+        """
+        ソケットでリアルタイムステータスを問い合わせ（タイムアウトは問い合わせ中のみ変更）
+
+        :param sock: ソケット
+        :param requests: 問い合わせるステータスの種類（n）
+        :return: 種類ごとの応答（1バイトの値）のリスト
+        :rtype: list[int]
+        """
+        timeout = sock.gettimeout()
+        sock.settimeout(STATUS_RESPONSE_TIMEOUT)
+        try:
+            self._discard_received(sock)
+            responses = []
+            for n in requests:
+                sock.sendall(ESC_POS_REALTIME_STATUS + bytes([n]))
+                response = sock.recv(1)
+                if not response:
+                    raise ConnectionError("プリンタ側から切断されました")
+                responses.append(response[0])
+            return responses
+        finally:
+            sock.settimeout(timeout)
+
+    @staticmethod
+    def _discard_received(sock):
+        """
+        受信済みで未読のデータを読み捨て（前回の問い合わせの遅れた応答などを応答と取り違えないため）
+
+        :param sock: ソケット
+        """
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            while sock.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+        finally:
+            sock.settimeout(timeout)
+
+    def reset(self):
+        """
+        送信を中止した後にプリンタを初期化\n
+        未送信のデータを破棄して切断し、接続し直して初期化コマンドを送信します。
+        """
+        with self.lock:
+            self._cancel_idle_timer()
+            sock = self.tm_print._device
+            if sock:
+                try:
+                    # SO_LINGER 0 で閉じると、OSのバッファに残っている未送信のデータを破棄して即座に切断
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                    sock.close()
+                except OSError:
+                    pass
+                self.tm_print._device = False
+            self._reconnect()
+            self.tm_print._device.sendall(ESC_POS_INITIALIZE)
+            self._schedule_idle_close()
+            logger.info("プリンタを初期化しました")
+
+    def ensure_open(self):
+        """
+        接続を確保（未接続・切断済みの場合は接続し直す）
+        """
+        with self.lock:
+            if self.is_healthy():
+                self.reuses += 1
+                return
+            self._reconnect()
+
+    def is_healthy(self):
+        """
+        接続が使える状態かを確認（受信データを読み捨てずに覗き見て、切断を検出）
+
+        :rtype: bool
+        """
+        sock = self.tm_print._device
+        if not sock:
+            return False
+        try:
+            sock.setblocking(False)
+            try:
+                return sock.recv(1, socket.MSG_PEEK) != b""  # 空の場合はプリンタ側から切断済み
+            except BlockingIOError:
+                return True  # 受信データなし（接続中）
+            finally:
+                sock.settimeout(self.tm_print.timeout)
+        except OSError:
+            return False
+
+    def close(self):
+        """
+        接続を切断
+        """
+        with self.lock, timing.stage("close"):
+            self._cancel_idle_timer()
+            self.tm_print.close()
+
+    def _reconnect(self):
+        """
+        接続し直す（接続時間をログに出力）
+        """
+        started = time.perf_counter()
+        with timing.stage("connect"):
+            self.tm_print.close()
+            self.tm_print.open()
+            self._tune_socket(self.tm_print._device)
+            self._enable_keepalive(self.tm_print._device)
+        self.connects += 1
+        logger.info(f"接続: {self.tm_print.host}:{self.tm_print.port} {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def _tune_socket(self, sock):
+        """
+        ソケットを送信向けに設定\n
+        送信データは印刷ジョブ単位でまとめて書き込むため、Nagleアルゴリズムを無効にして
+        末尾の小さな書き込みがプリンタの遅延ACKを待たないようにし、送信バッファを拡大します。
+
+        :param sock: ソケット
+        """
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.send_buffer_bytes:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer_bytes)
+        sock.settimeout(self.tm_print.timeout)
+
+    @staticmethod
+    def _enable_keepalive(sock):
+        """
+        TCPキープアライブを有効化（OSが対応している設定のみ）
+
+        :param sock: ソケット
+        """
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVAL)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_COUNT)
+        elif hasattr(socket, "SIO_KEEPALIVE_VALS"):
+            # Windows
+            sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, KEEPALIVE_IDLE * 1000, KEEPALIVE_INTERVAL * 1000))
+
+    def _schedule_idle_close(self):
+        """
+        アイドル時間の経過後に切断するよう予約
+        """
+        self._cancel_idle_timer()
+        if not self.idle_timeout:
+            self.tm_print.close()
+            return
+        self._idle_timer = threading.Timer(self.idle_timeout, self._close_if_idle)
+        self._idle_timer.daemon = True
+        self._idle_timer.start()
+
+    def _cancel_idle_timer(self):
+        """
+        切断の予約を取り消し
+        """
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _close_if_idle(self):
+        """
+        アイドル時間が経過したら切断（送信中の場合は何もしない）
+        """
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            self._idle_timer = None
+            self.tm_print.close()
+            logger.debug("アイドル時間が経過したため切断しました")
+        finally:
+            self.lock.release()
+
+
+# プリンタオブジェクトごとの接続（プロセス内で共有）
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def shared_connection(tm_print, idle_timeout=CONNECTION_IDLE_TIMEOUT):
+    """
+    プリンタオブジェクトの共有接続を取得（初回のみ作成）
+
+    :param tm_print: プリンタオブジェクト
+    :param idle_timeout: 接続を保持する時間（秒）
+    :rtype: PrinterConnection
+    """
+    with _connections_lock:
+        connection = _connections.get(id(tm_print))
+        if connection is None:
+            connection = PrinterConnection(tm_print, idle_timeout)
+            _connections[id(tm_print)] = connection
+        connection.idle_timeout = idle_timeout
+        return connection
+
+
+def shared_connections():
+    """
+    すべての共有接続を取得（統計の表示用）
+
+    :rtype: list[PrinterConnection]
+    """
+    with _connections_lock:
+        return list(_connections.values())
+
+
+def close_all():
+    """
+    すべての共有接続を切断（アプリ終了時）
+    """
+    with _connections_lock:
+        for connection in _connections.values():
+            connection.close()
@@ -0,0 +1,168 @@
+from pathlib import Path
+import os
+import logging
+import threading
+import unicodedata
+
+# 幅テーブルの保存先
+WIDTH_TABLE_FILE = Path(__file__).resolve().parent / "../cache/width_table.bin"
+# 幅テーブルの形式バージョン（形式や幅の規則を変えたら上げる）
+WIDTH_TABLE_FORMAT_VERSION = 1
+# 2段テーブルのブロックサイズ（コードポイント数）
+WIDTH_TABLE_BLOCK = 256
+# Unicodeのコードポイント数
+UNICODE_CODEPOINTS = 0x110000
+# 印字時に横幅が2倍になるタグ
+WIDE_PRINT_TAGS = ("bold", "four")
+# TM-T88IVの1行の桁数（フォントA 12×24=42桁、漢字フォント 24×24=21桁）
+PRINTER_LINE_COLUMNS = 21 * 2
+
+logger = logging.getLogger(__name__)
+
+# 展開済みの幅テーブル（コードポイント -> 桁数）
+_table = None
+_table_lock = threading.Lock()
+
+
+def _char_width_uncached(cp):
+    """
+    コードポイントの桁数を判定（テーブル作成用）\n
+    全角・半角の判定はこれまでの行番号欄と同じく曖昧幅(A)を全角として扱います。
+
+    :param int cp: コードポイント
+    :return: 桁数（結合文字・書式文字は0、全角は2、その他は1）
+    :rtype: int
+    """
+    ch = chr(cp)
+    if unicodedata.category(ch) in ("Mn", "Me", "Cf"):
+        return 0
+    return 2 if unicodedata.east_asian_width(ch) in ("W", "F", "A") else 1
+
+
+def build_table():
+    """
+    全コードポイントの幅テーブルを2段テーブルとして作成
+
+    :return: (1段目: ブロックごとの2段目の番号, 2段目: 重複を除いたブロックの連結)
+    :rtype: tuple[bytes, bytes]
+    """
+    stage1 = bytearray()
+    blocks = {}
+    stage2 = bytearray()
+    for base in range(0, UNICODE_CODEPOINTS, WIDTH_TABLE_BLOCK):
+        block = bytes(_char_width_uncached(cp) for cp in range(base, base + WIDTH_TABLE_BLOCK))
+        number = blocks.get(block)
+        if number is None:
+            number = len(blocks)
+            blocks[block] = number
+            stage2 += block
+        stage1.append(number)
+    return bytes(stage1), bytes(stage2)
+
+
+def _header():
+    """
+    テーブルファイルのヘッダ（形式バージョンとUnicodeのバージョン）
+
+    :rtype: bytes
+    """
+    return f"WIDTH{WIDTH_TABLE_FORMAT_VERSION}:{unicodedata.unidata_version}\n".encode("ascii")
+
+
+def _read_table_file(table_file):
+    """
+    保存済みの2段テーブルを読み込み（存在しない、バージョンが異なる、または途中で切れている・壊れている場合はNone）
+
+    :rtype: tuple[bytes, bytes]
+    """
+    try:
+        with open(table_file, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    header = _header()
+    if not data.startswith(header):
+        return None
+    body = data[len(header):]
+    stage1_size = UNICODE_CODEPOINTS // WIDTH_TABLE_BLOCK
+    stage1, stage2 = body[:stage1_size], body[stage1_size:]
+    # 1段目はブロック数分、2段目はブロック単位で、1段目が参照するブロックをすべて含むこと
+    if (len(stage1) != stage1_size or not stage2 or len(stage2) % WIDTH_TABLE_BLOCK != 0
+            or max(stage1) >= len(stage2) // WIDTH_TABLE_BLOCK or max(stage2) > 2):
+        logger.warning(f"幅テーブルが壊れているため作成し直します: {table_file}")
+        return None
+    return stage1, stage2
+
+
+def _write_table_file(table_file, stage1, stage2):
+    """
+    2段テーブルを保存（一時ファイルに書き込んでから置き換え）
+    """
+    table_file = Path(table_file)
+    table_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = table_file.with_suffix(table_file.suffix + ".tmp")
+    with open(tmp_file, "wb") as f:
+        f.write(_header() + stage1 + stage2)
+    os.replace(tmp_file, table_file)
+
+
+def load(table_file=WIDTH_TABLE_FILE):
+    """
+    幅テーブルを読み込み（保存済みのものがなければ作成して保存）\n
+    起動時に1度呼び出しておくと、以降の幅計算は1文字につき配列参照1回になります。
+
+    :param table_file: 幅テーブルの保存先
+    :return: 展開済みの幅テーブル
+    :rtype: bytes
+    """
+    global _table
+    with _table_lock:
+        if _table is not None:
+            return _table
+        tables = _read_table_file(table_file)
+        if tables is None:
+            tables = build_table()
+            try:
+                _write_table_file(table_file, *tables)
+            except OSError as e:
+                logger.warning(f"幅テーブルを保存できません: {e}")
+        stage1, stage2 = tables
+        # 2段テーブルを1段に展開（約1.1MB）
+        _table = b"".join(stage2[n * WIDTH_TABLE_BLOCK:(n + 1) * WIDTH_TABLE_BLOCK] for n in stage1)
+        return _table
+
+
+def char_width(ch):
+    """
+    文字の桁数
+
+    :param str ch: 対象の文字
+    :return: 桁数（全角は2、半角は1、結合文字は0）
+    :rtype: int
+    """
+    return (_table or load())[ord(ch)]
+
+
+def text_width(s):
+    """
+    文字列の桁数（画面表示上の幅）
+
+    :param str s: 対象の文字列
+    :return: 桁数（全角文字は2、半角文字は1として計算）
+    :rtype: int
+    """
+    table = _table or load()
+    return sum(table[ord(ch)] for ch in s)
+
+
+def printed_width(s, tags=()):
+    """
+    装飾タグを考慮した印字上の桁数（横倍角・4倍角は2倍）
+
+    :param str s: 対象の文字列
+    :param tags: テキストウィジェットのタグ
+    :return: 印字上の桁数
+    :rtype: int
+    """
+    multiplier = 2 if any(tag in tags for tag in WIDE_PRINT_TAGS) else 1
+    return text_width(s) * multiplier
@@ -0,0 +1,120 @@
+from pathlib import Path
+import os
+import re
+import json
+
+# 文書ファイルの形式バージョン
+DOCUMENT_FORMAT_VERSION = 1
+
+BARCODE_TAGS = {
+    "QR":    {"pattern": r"<QR:(.+?)>",    "tag": "qr_tag",   "bg": "#e8fce8", "fg": "#006600"},
+    "ITF":   {"pattern": r"<ITF:(.+?)>",   "tag": "itf_tag",  "bg": "#f4e8ff", "fg": "#6a1b9a"},
+    "EAN13": {"pattern": r"<EAN13:(.+?)>", "tag": "ean_tag",  "bg": "#eeeeee", "fg": "#222222"},
+    "C39":   {"pattern": r"<C39:(.+?)>",   "tag": "c39_tag",  "bg": "#e7f0fa", "fg": "#004488"},
+    "C128":  {"pattern": r"<C128:(.+?)>",  "tag": "c128_tag", "bg": "#fff3e0", "fg": "#a63d00"},
+    # ロゴ（画像はlogosフォルダ、バーコードと同じく1行を占める）
+    "LOGO":  {"pattern": r"<LOGO:(.+?)>",  "tag": "logo_tag", "bg": "#fffde7", "fg": "#8d6e00"},
+}
+
+# 色付け用タグ（配置用タグとは分離）
+CUSTOM_TAGS = {
+    "HR": {"pattern": r"<HR>", "tag": "hr_tag", "bg": "#E0E0E0", "fg": "#757575"},
+    "ALIGN_CENTER_COLOR": {"pattern": r"<ALIGN:CENTER>", "tag": "align_center_color", "bg": "#90CAF9", "fg": "#1976D2"},
+    "ALIGN_LEFT_COLOR":   {"pattern": r"<ALIGN:LEFT>",   "tag": "align_left_color",   "bg": "#A5D6A7", "fg": "#388E3C"},
+    "ALIGN_RIGHT_COLOR":  {"pattern": r"<ALIGN:RIGHT>",  "tag": "align_right_color",  "bg": "#FFE0B2", "fg": "#BF360C"},
+}
+
+# 行頭の配置指定と配置用タグの対応
+ALIGN_PATTERN = r"^<ALIGN:(LEFT|CENTER|RIGHT)>"
+ALIGN_TAGS = {"LEFT": "align_left", "CENTER": "align_center", "RIGHT": "align_right"}
+
+
+def blocks_from_text(text):
+    """
+    タグ記法のテキストから行ごとのタグブロックを作成（テキストウィジェットを使わずに解析する場合）\n
+    画面上でタグを付けた場合と同じく、配置・水平線・バーコード・ロゴのタグを付与します。
+    文字装飾（倍角・アンダーラインなど）はテキストに表れないため付与されません。
+
+    :param str text: タグ記法のテキスト
+    :return: 行ごとの(文字列, タグ)のリスト（TextTagParserの入力形式）
+    :rtype: list[list[tuple]]
+    """
+    results = []
+    lines = text.split("\n")
+    current_align = ALIGN_TAGS["LEFT"]  # デフォルトは左寄せ
+    for lineno, line in enumerate(lines):
+        char_tags = [[] for _ in line]
+        # 行頭の色付け用タグ
+        for tag_info in CUSTOM_TAGS.values():
+            if line.startswith(tag_info["pattern"]):
+                for tags in char_tags[:len(tag_info["pattern"])]:
+                    tags.append(tag_info["tag"])
+                break
+        # 配置（次の指定があるまで継続）
+        match = re.match(ALIGN_PATTERN, line)
+        if match:
+            current_align = ALIGN_TAGS[match.group(1)]
+        for tags in char_tags:
+            tags.append(current_align)
+        # バーコード・ロゴ
+        for bc in BARCODE_TAGS.values():
+            for match in re.finditer(bc["pattern"], line):
+                for tags in char_tags[match.start():match.end()]:
+                    tags.append(bc["tag"])
+
+        segments = [(char, tuple(tags)) for char, tags in zip(line, char_tags)]
+        if lineno < len(lines) - 1:
+            segments.append(("\n", ()))
+        results.append(compress_segments(segments))
+    return results
+
+
+def compress_segments(segments):
+    """
+    連続する同じタグの文字を1つのブロックにまとめる（改行は常に単独のブロック）
+
+    :param segments: (文字, タグ)のリスト
+    :return: 圧縮された(文字列, タグ)のリスト
+    :rtype: list[tuple]
+    """
+    compressed = []
+    for char, tags in segments:
+        if compressed and char != "\n" and compressed[-1][0] != "\n" and compressed[-1][1] == tags:
+            compressed[-1] = (compressed[-1][0] + char, tags)
+        else:
+            compressed.append((char, tags))
+    return compressed
+
+
+def save_document(path, blocks):
+    """
+    タグブロックを文書ファイル（JSON）に保存（一時ファイルに書き込んでから置き換え）
+
+    :param path: 保存先のパス
+    :param blocks: 行ごとの(文字列, タグ)のリスト
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        "version": DOCUMENT_FORMAT_VERSION,
+        "lines": [[[text, list(tags)] for text, tags in line] for line in blocks],
+    }
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_document(path):
+    """
+    文書ファイル（JSON）からタグブロックを読み込み
+
+    :param path: 文書ファイルのパス
+    :return: 行ごとの(文字列, タグ)のリスト
+    :rtype: list[list[tuple]]
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != DOCUMENT_FORMAT_VERSION:
+        raise ValueError(f"未対応の文書ファイルです: {path}")
+    return [[(text, tuple(tags)) for text, tags in line] for line in data["lines"]]
@@ -129,6 +129,14 @@ def main_task():
     else:
         print("[SKIP] Jigmo.ttf Jigmo2.ttf Jigmo3.ttf は既に存在します")
 
+    # フォント収録文字インデックス（フォールバックフォントの選択用）
+    try:
+        from font_index import build_index
+        print("[INDEX] フォント収録文字インデックスを作成中")
+        build_index(FONTS_DIR)
+    except Exception as e:
+        print(f"[WARN] フォント収録文字インデックスを作成できませんでした: {e}")
+
     print("[完了] すべてのファイルが準備されました。")
 
 # 実行
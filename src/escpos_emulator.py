@@ -0,0 +1,799 @@
+from collections import Counter
+from pathlib import Path
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+import display_width
+
+"""
+ESC/POSプリンタ エミュレータ
+TM-T88IVの代わりにTCPで印刷データを受け取り、テキスト・漢字・バーコード・ラスター画像・カットを解釈して
+用紙のイメージをPNGで保存します。受信バイト数・コマンド数・時間を記録し、回線速度・印字速度を模擬できます。
+
+使い方: python escpos_emulator.py [--port 9100] [--output ../cache/emulator] [--link-kbps 0] [--print-speed 0]
+"""
+
+# 印字幅（ドット、80mm紙・180dpi）
+EMULATOR_PAPER_WIDTH = 512
+# 縦方向の解像度（ドット/mm、180dpi）
+DOTS_PER_MM = 180 / 25.4
+# 標準の改行量（ドット、1/6インチ）
+DEFAULT_LINE_SPACING = 30
+# 文字の大きさ（ドット、フォントA：半角12×24・全角24×24）
+CHAR_WIDTH = 12
+CHAR_HEIGHT = 24
+# 受信の単位（バイト、回線速度の模擬の細かさ）
+RECEIVE_CHUNK_BYTES = 4096
+# 印字が受信に遅れてよい時間（秒、これを超えると受信を止めてプリンタの受信バッファが埋まった状態を模擬）
+PRINT_BUFFER_SECONDS = 0.2
+# DLE EOT n への応答（正常・オンライン・用紙あり）
+REALTIME_STATUS = {1: 0x16, 2: 0x12, 3: 0x12, 4: 0x12}
+# 表示用フォント（fontsフォルダの漢字フォント、ない場合はPillowの標準フォント）
+EMULATOR_FONT_FILE = Path(__file__).resolve().parent / "../fonts/NotoSansCJKjp-Medium.otf"
+
+ESC, GS, FS, DLE = 0x1B, 0x1D, 0x1C, 0x10
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+class EscPosDecoder:
+    """
+    ESC/POSのバイト列を解釈して用紙のイメージを作成するクラス\n
+    受信した順にfeedで渡すと、コマンドの途中で分割されていても続きを待って解釈します。
+    """
+    def __init__(self, paper_width=EMULATOR_PAPER_WIDTH, respond=None, nv_graphics=None):
+        """
+        デコーダの初期化
+
+        :param int paper_width: 印字幅（ドット）
+        :param respond: プリンタからの応答の送信先（バイト列を引数に呼び出し、DLE EOTの応答に使用）
+        :param dict nv_graphics: NVグラフィックスの保存先（キーコード → 画像、接続をまたいで保持する場合に指定）
+        """
+        self.paper_width = paper_width
+        self.respond = respond
+        self.nv_graphics = nv_graphics if nv_graphics is not None else {}
+        self.pending = bytearray()
+        self.counts = Counter()  # コマンドごとの回数
+        self.pages = []  # カットごとの用紙のイメージ
+        self.rows = []  # 現在の用紙の行イメージ
+        self.printed_dots = 0  # 送った紙の長さ（ドット）
+        self.font = self._load_font()
+        self._reset_modes()
+        self.fragments = []  # 現在の行の(イメージ)のリスト
+        self.qr_data = b""
+        self.stored_graphics = None  # GS ( L で保存したラスター画像
+
+    def _reset_modes(self):
+        """
+        印字モードを初期状態に戻す（ESC @）
+        """
+        self.align = 0
+        self.width_mul = 1
+        self.height_mul = 1
+        self.underline = False
+        self.reverse = False
+        self.kanji = False
+        self.line_spacing = DEFAULT_LINE_SPACING
+        self.user_chars = {}  # ESC & で定義した半角の外字
+        self.user_chars_enabled = False
+        self.kanji_user_chars = {}  # FS 2 で定義した全角の外字
+        self.barcode_height = 162
+        self.barcode_hri = 0
+
+    @staticmethod
+    def _load_font():
+        """
+        表示用フォントを読み込み
+
+        :rtype: ImageFont.FreeTypeFont
+        """
+        try:
+            return ImageFont.truetype(str(EMULATOR_FONT_FILE), CHAR_HEIGHT - 2)
+        except OSError:
+            return ImageFont.load_default(CHAR_HEIGHT - 2)
+
+    def feed(self, data):
+        """
+        受信したバイト列を解釈（最後のコマンドが途中で切れている場合は続きを待つ）
+
+        :param bytes data: 受信したバイト列
+        """
+        self.pending += data
+        position = 0
+        while position < len(self.pending):
+            consumed = self._decode_one(position, final=False)
+            if consumed == 0:
+                break  # コマンドの途中
+            position += consumed
+        del self.pending[:position]
+
+    def finish(self):
+        """
+        受信を終了し、残りのデータ・印字途中の行を用紙に出力
+
+        :return: カットごとの用紙のイメージ
+        :rtype: list[Image.Image]
+        """
+        position = 0
+        while position < len(self.pending):
+            consumed = self._decode_one(position, final=True)
+            position += consumed or len(self.pending) - position
+        self.pending.clear()
+        self._flush_line(force=False)
+        if self.rows:
+            self._cut()
+        return self.pages
+
+    def _decode_one(self, position, final):
+        """
+        1つのコマンド（または連続する文字）を解釈
+
+        :param int position: 解釈を始める位置
+        :param bool final: 受信を終了したかどうか（途中で切れた文字列も出力）
+        :return: 解釈したバイト数（コマンドの途中の場合は0）
+        :rtype: int
+        """
+        data = self.pending
+        byte = data[position]
+        if byte >= 0x20:
+            end = position
+            while end < len(data) and data[end] >= 0x20:
+                end += 1
+            if end == len(data) and not final:
+                return 0  # 文字列の続き（全角文字の途中かもしれない）を待つ
+            self._text(bytes(data[position:end]))
+            return end - position
+        if byte == 0x0A:
+            self.counts["LF"] += 1
+            self._flush_line(force=True)
+            return 1
+        if byte == ESC:
+            return self._decode_esc(position)
+        if byte == GS:
+            return self._decode_gs(position)
+        if byte == FS:
+            return self._decode_fs(position)
+        if byte == DLE:
+            return self._decode_dle(position)
+        self.counts[f"0x{byte:02X}"] += 1
+        return 1
+
+    def _need(self, position, length):
+        """
+        コマンドの長さ分のデータを受信済みかどうか
+
+        :rtype: bool
+        """
+        return position + length <= len(self.pending)
+
+    def _decode_esc(self, position):
+        """
+        ESCで始まるコマンドを解釈
+
+        :return: 解釈したバイト数（コマンドの途中の場合は0）
+        :rtype: int
+        """
+        data = self.pending
+        if not self._need(position, 2):
+            return 0
+        command = chr(data[position + 1])
+        name = f"ESC {command}"
+        length = {"@": 2, "2": 2, "L": 2, "S": 2, "c": 4, "$": 4, "\\": 4, "p": 5, "W": 10}.get(command, 3)
+        if command == "*":
+            if not self._need(position, 5):
+                return 0
+            m, columns = data[position + 2], data[position + 3] | data[position + 4] << 8
+            length = 5 + columns * (3 if m in (32, 33) else 1)
+        elif command == "&":
+            length = self._user_chars_length(position)
+        elif command == "D":
+            if 0 not in data[position + 2:]:
+                return 0
+            length = data.index(0, position + 2) - position + 1
+        if not self._need(position, length):
+            return 0
+        self.counts[name] += 1
+        arg = data[position + 2] if length >= 3 else 0
+        if command == "@":
+            self._flush_line(force=False)
+            self._reset_modes()
+        elif command == "a":
+            self.align = arg % 48 if arg >= 48 else arg
+        elif command == "!":
+            self.width_mul = 2 if arg & 0x20 else 1
+            self.height_mul = 2 if arg & 0x10 else 1
+            self.underline = bool(arg & 0x80)
+        elif command == "-":
+            self.underline = arg in (1, 2, 49, 50)
+        elif command == "3":
+            self.line_spacing = arg
+        elif command == "2":
+            self.line_spacing = DEFAULT_LINE_SPACING
+        elif command == "d":
+            self._flush_line(force=True)
+            self._feed_dots(max(arg - 1, 0) * self.line_spacing)
+        elif command == "J":
+            self._flush_line(force=False)
+            self._feed_dots(arg)
+        elif command == "%":
+            self.user_chars_enabled = bool(arg & 1)
+        elif command == "&":
+            self._define_user_chars(position)
+        elif command == "*":
+            self._column_image(position)
+        return length
+
+    def _decode_gs(self, position):
+        """
+        GSで始まるコマンドを解釈
+
+        :return: 解釈したバイト数（コマンドの途中の場合は0）
+        :rtype: int
+        """
+        data = self.pending
+        if not self._need(position, 3):
+            return 0
+        command = chr(data[position + 1])
+        arg = data[position + 2]
+        name = f"GS {command}"
+        length = {"L": 4, "W": 4, "P": 4, "$": 4, "\\": 4}.get(command, 3)
+        if command == "V":
+            length = 3 if arg in (0, 1, 48, 49) else 4
+        elif command == "v":
+            if not self._need(position, 8):
+                return 0
+            width_bytes = data[position + 4] | data[position + 5] << 8
+            height = data[position + 6] | data[position + 7] << 8
+            length = 8 + width_bytes * height
+            name = "GS v 0"
+        elif command == "(":
+            if not self._need(position, 5):
+                return 0
+            length = 5 + (data[position + 3] | data[position + 4] << 8)
+            name = f"GS ( {chr(arg)}"
+        elif command == "8":
+            if not self._need(position, 7):
+                return 0
+            length = 7 + int.from_bytes(data[position + 3:position + 7], "little")
+            name = f"GS 8 {chr(arg)}"
+        elif command == "k":
+            if arg <= 6:
+                if 0 not in data[position + 3:]:
+                    return 0
+                length = data.index(0, position + 3) - position + 1
+            else:
+                if not self._need(position, 4):
+                    return 0
+                length = 4 + data[position + 3]
+        elif command == "*":
+            if not self._need(position, 4):
+                return 0
+            length = 4 + arg * data[position + 3] * 8
+        if not self._need(position, length):
+            return 0
+        self.counts[name] += 1
+        if command == "!":
+            self.width_mul = (arg >> 4 & 0x07) + 1
+            self.height_mul = (arg & 0x07) + 1
+        elif command == "B":
+            self.reverse = bool(arg & 1)
+        elif command == "h":
+            self.barcode_height = arg
+        elif command == "H":
+            self.barcode_hri = arg % 48 if arg >= 48 else arg
+        elif command == "V":
+            self._flush_line(force=False)
+            self._cut()
+        elif command == "v":
+            self._flush_line(force=False)
+            width_bytes = data[position + 4] | data[position + 5] << 8
+            height = data[position + 6] | data[position + 7] << 8
+            self._place_block(self._raster(bytes(data[position + 8:position + length]), width_bytes, height))
+        elif command == "(":
+            self._decode_gs_paren(chr(arg), bytes(data[position + 5:position + length]))
+        elif command == "8":
+            self._decode_gs_paren(chr(arg), bytes(data[position + 7:position + length]))
+        elif command == "k":
+            self._barcode(position, length)
+        return length
+
+    def _decode_gs_paren(self, function, payload):
+        """
+        GS ( （GS 8）で始まる機能コマンド（QRコード・グラフィックス）を解釈
+
+        :param str function: 機能（"k"：2次元コード、"L"：グラフィックス）
+        :param bytes payload: パラメータ（pL pH以降）
+        """
+        if function == "k" and len(payload) >= 3 and payload[0] == 49:
+            fn = payload[1]
+            if fn == 80:
+                self.qr_data = payload[3:]  # 保存
+            elif fn == 81:
+                self._flush_line(force=False)
+                self._place_block(self._symbol("QR", self.qr_data.decode("utf-8", "replace"), 160, 160))
+        elif function == "L" and len(payload) >= 2:
+            fn = payload[1]
+            if fn == 112 and len(payload) >= 10:
+                width = payload[6] | payload[7] << 8
+                height = payload[8] | payload[9] << 8
+                self.stored_graphics = self._raster(payload[10:], (width + 7) // 8, height)
+            elif fn in (2, 50) and self.stored_graphics is not None:
+                self._flush_line(force=False)
+                self._place_block(self.stored_graphics)
+                self.stored_graphics = None
+            elif fn == 66 and len(payload) >= 4:
+                # NVグラフィックスの削除（キーコード指定）
+                self.nv_graphics.pop(payload[2:4], None)
+            elif fn == 67 and len(payload) >= 11:
+                # NVグラフィックスの登録（ラスター形式）
+                width = payload[6] | payload[7] << 8
+                height = payload[8] | payload[9] << 8
+                self.nv_graphics[payload[3:5]] = self._raster(payload[11:], (width + 7) // 8, height)
+            elif fn == 69 and len(payload) >= 4 and payload[2:4] in self.nv_graphics:
+                # NVグラフィックスの印字
+                self._flush_line(force=False)
+                self._place_block(self.nv_graphics[payload[2:4]])
+
+    def _decode_fs(self, position):
+        """
+        FSで始まるコマンド（漢字）を解釈
+
+        :return: 解釈したバイト数（コマンドの途中の場合は0）
+        :rtype: int
+        """
+        data = self.pending
+        if not self._need(position, 2):
+            return 0
+        command = chr(data[position + 1])
+        length = {"&": 2, ".": 2, "S": 4, "?": 4, "p": 4, "2": 4 + 72}.get(command, 3)
+        if command == "(":
+            if not self._need(position, 5):
+                return 0
+            length = 5 + (data[position + 3] | data[position + 4] << 8)
+        if not self._need(position, length):
+            return 0
+        self.counts[f"FS {command}"] += 1
+        arg = data[position + 2] if length >= 3 else 0
+        if command == "&":
+            self.kanji = True
+        elif command == ".":
+            self.kanji = False
+        elif command == "!":
+            self.width_mul = 2 if arg & 0x04 else 1
+            self.height_mul = 2 if arg & 0x08 else 1
+            self.underline = bool(arg & 0x80)
+        elif command == "-":
+            self.underline = arg in (1, 2, 49, 50)
+        elif command == "2":
+            code = bytes(data[position + 2:position + 4])
+            self.kanji_user_chars[code] = self._column_glyph(bytes(data[position + 4:position + length]), 24, 3)
+        return length
+
+    def _decode_dle(self, position):
+        """
+        DLEで始まるリアルタイムコマンドを解釈（DLE EOT には正常な状態を応答）
+
+        :return: 解釈したバイト数（コマンドの途中の場合は0）
+        :rtype: int
+        """
+        data = self.pending
+        if not self._need(position, 3):
+            return 0
+        command, arg = data[position + 1], data[position + 2]
+        length = 3
+        if command == 0x14:  # DLE DC4
+            length = {1: 5, 2: 5, 7: 5, 8: 10}.get(arg, 3)
+        if not self._need(position, length):
+            return 0
+        if command == 0x04:
+            self.counts["DLE EOT"] += 1
+            if self.respond is not None:
+                self.respond(bytes([REALTIME_STATUS.get(arg, 0x12)]))
+        else:
+            self.counts[f"DLE 0x{command:02X}"] += 1
+        return length
+
+    def _text(self, data):
+        """
+        文字列を現在の行に追加
+
+        :param bytes data: 文字のバイト列（漢字モードではShift_JIS）
+        """
+        if self.kanji:
+            self.counts["kanji"] += len(data)
+            position = 0
+            while position < len(data):
+                lead = data[position]
+                if (0x81 <= lead <= 0x9F or 0xE0 <= lead <= 0xFC) and position + 1 < len(data):
+                    code = data[position:position + 2]
+                    glyph = self.kanji_user_chars.get(code)
+                    self.fragments.append(glyph.resize((glyph.width * self.width_mul, glyph.height * self.height_mul))
+                                          if glyph is not None else self._glyph(code.decode("cp932", "replace")))
+                    position += 2
+                else:
+                    self.fragments.append(self._glyph(data[position:position + 1].decode("cp932", "replace")))
+                    position += 1
+            return
+        self.counts["text"] += len(data)
+        for code in data:
+            glyph = self.user_chars.get(code) if self.user_chars_enabled else None
+            if glyph is not None:
+                self.fragments.append(glyph.resize((glyph.width * self.width_mul, glyph.height * self.height_mul)))
+            else:
+                self.fragments.append(self._glyph(bytes([code]).decode("cp932", "replace")))
+
+    def _glyph(self, char):
+        """
+        1文字分のイメージを作成（倍角・アンダーライン・反転を反映）
+
+        :param str char: 文字
+        :rtype: Image.Image
+        """
+        cell_width = CHAR_WIDTH * display_width.char_width(char) or CHAR_WIDTH
+        image = Image.new("1", (cell_width, CHAR_HEIGHT), 1)
+        draw = ImageDraw.Draw(image)
+        draw.text((0, 0), char, font=self.font, fill=0)
+        if self.underline:
+            draw.line((0, CHAR_HEIGHT - 2, cell_width, CHAR_HEIGHT - 2), fill=0, width=2)
+        if self.reverse:
+            image = ImageChops.invert(image)
+        if self.width_mul > 1 or self.height_mul > 1:
+            image = image.resize((cell_width * self.width_mul, CHAR_HEIGHT * self.height_mul))
+        return image
+
+    def _barcode(self, position, length):
+        """
+        GS k のバーコードを出力（内容を枠付きで表示）
+
+        :param int position: コマンドの位置
+        :param int length: コマンドの長さ
+        """
+        data = self.pending
+        m = data[position + 2]
+        content = data[position + 3:position + length - 1] if m <= 6 else data[position + 4:position + length]
+        names = {0: "UPC-A", 2: "EAN13", 4: "CODE39", 5: "ITF", 67: "EAN13", 69: "CODE39", 70: "ITF", 73: "CODE128"}
+        self._flush_line(force=False)
+        self._place_block(self._symbol(names.get(m, f"BARCODE{m}"), bytes(content).decode("ascii", "replace"),
+                                       self.paper_width * 3 // 4, max(self.barcode_height, 24)))
+
+    def _symbol(self, kind, content, width, height):
+        """
+        バーコード・QRコードの代わりに、種類と内容を書いた枠を作成
+
+        :rtype: Image.Image
+        """
+        image = Image.new("1", (width, height + CHAR_HEIGHT), 1)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((0, 0, width - 1, height - 1), outline=0, width=3)
+        draw.text((6, 4), f"[{kind}]", font=self.font, fill=0)
+        draw.text((0, height), content[:width // CHAR_WIDTH], font=self.font, fill=0)
+        return image
+
+    @staticmethod
+    def _raster(data, width_bytes, height):
+        """
+        ラスター形式（1ビット＝1ドット、1が黒）のデータをイメージに変換
+
+        :rtype: Image.Image
+        """
+        data = data.ljust(width_bytes * height, b"\x00")
+        return Image.frombytes("1", (width_bytes * 8, height), data, "raw", "1;I")
+
+    @staticmethod
+    def _column_glyph(data, width, height_bytes):
+        """
+        縦方向のビットイメージ形式（1列ごとに上からheight_bytesバイト）のデータをイメージに変換
+
+        :rtype: Image.Image
+        """
+        image = Image.new("1", (width, height_bytes * 8), 1)
+        pixels = image.load()
+        for x in range(min(width, len(data) // height_bytes)):
+            for row in range(height_bytes):
+                value = data[x * height_bytes + row]
+                for bit in range(8):
+                    if value & (0x80 >> bit):
+                        pixels[x, row * 8 + bit] = 0
+        return image
+
+    def _user_chars_length(self, position):
+        """
+        ESC & の長さを計算（定義する文字ごとに列数と列データが続く）
+
+        :return: コマンドの長さ（途中の場合は受信済みを超える値）
+        :rtype: int
+        """
+        data = self.pending
+        if not self._need(position, 5):
+            return 5
+        height_bytes, first, last = data[position + 2], data[position + 3], data[position + 4]
+        length = 5
+        for _ in range(first, last + 1):
+            if not self._need(position, length + 1):
+                return length + 1
+            length += 1 + data[position + length] * height_bytes
+        return length
+
+    def _define_user_chars(self, position):
+        """
+        ESC & の外字を保存
+        """
+        data = self.pending
+        height_bytes, first, last = data[position + 2], data[position + 3], data[position + 4]
+        offset = position + 5
+        for code in range(first, last + 1):
+            columns = data[offset]
+            self.user_chars[code] = self._column_glyph(bytes(data[offset + 1:offset + 1 + columns * height_bytes]),
+                                                       columns, height_bytes)
+            offset += 1 + columns * height_bytes
+
+    def _column_image(self, position):
+        """
+        ESC * のビットイメージを現在の行に追加
+        """
+        data = self.pending
+        m, columns = data[position + 2], data[position + 3] | data[position + 4] << 8
+        height_bytes = 3 if m in (32, 33) else 1
+        self.fragments.append(self._column_glyph(bytes(data[position + 5:position + 5 + columns * height_bytes]),
+                                                 columns, height_bytes))
+
+    def _flush_line(self, force):
+        """
+        現在の行を用紙に出力
+
+        :param bool force: 空行でも改行量分の紙を送るかどうか（LFの場合）
+        """
+        if not self.fragments:
+            if force:
+                self._feed_dots(self.line_spacing)
+            return
+        width = sum(fragment.width for fragment in self.fragments)
+        content_height = max(fragment.height for fragment in self.fragments)
+        line = Image.new("1", (width, max(content_height, self.line_spacing)), 1)
+        x = 0
+        for fragment in self.fragments:
+            # 文字の下端をそろえ、改行量の残りは行の下の余白にする
+            line.paste(fragment, (x, content_height - fragment.height))
+            x += fragment.width
+        self.fragments = []
+        self._place_block(line)
+
+    def _place_block(self, image):
+        """
+        行・画像を配置（左寄せ・中央寄せ・右寄せ）して用紙に追加
+
+        :param Image.Image image: 配置するイメージ
+        """
+        row = Image.new("1", (self.paper_width, image.height), 1)
+        image = image.crop((0, 0, min(image.width, self.paper_width), image.height))
+        x = {0: 0, 1: (self.paper_width - image.width) // 2, 2: self.paper_width - image.width}.get(self.align, 0)
+        row.paste(image, (x, 0))
+        self.rows.append(row)
+        self.printed_dots += image.height
+
+    def _feed_dots(self, dots):
+        """
+        紙を送る（空白を追加）
+
+        :param int dots: 送る量（ドット）
+        """
+        if dots > 0:
+            self.rows.append(Image.new("1", (self.paper_width, dots), 1))
+            self.printed_dots += dots
+
+    def _cut(self):
+        """
+        用紙をカット（ここまでを1枚の用紙のイメージにまとめる）
+        """
+        height = sum(row.height for row in self.rows)
+        page = Image.new("1", (self.paper_width, max(height, 1)), 1)
+        y = 0
+        for row in self.rows:
+            page.paste(row, (0, y))
+            y += row.height
+        self.pages.append(page)
+        self.rows = []
+
+
+class EmulatorSession:
+    """
+    1回の接続で受信した内容と実績（受信バイト数・コマンド数・時間）
+    """
+    def __init__(self, number, peer):
+        """
+        接続の実績の初期化
+
+        :param int number: 接続の番号
+        :param peer: 接続元のアドレス
+        """
+        self.number = number
+        self.peer = peer
+        self.received_bytes = 0
+        self.receives = 0  # recvの回数
+        self.connected_at = time.perf_counter()
+        self.first_byte_at = None
+        self.last_byte_at = None
+        self.closed_at = None
+        self.counts = Counter()
+        self.pages = []
+        self.printed_dots = 0
+
+    @property
+    def transfer_seconds(self):
+        """
+        最初のバイトから最後のバイトまでの時間（秒）
+
+        :rtype: float
+        """
+        if self.first_byte_at is None:
+            return 0.0
+        return self.last_byte_at - self.first_byte_at
+
+    def to_dict(self):
+        """
+        記録用の辞書
+
+        :rtype: dict
+        """
+        transfer = self.transfer_seconds
+        return {
+            "session": self.number,
+            "peer": f"{self.peer[0]}:{self.peer[1]}",
+            "received_bytes": self.received_bytes,
+            "receives": self.receives,
+            "transfer_ms": round(transfer * 1000, 3),
+            "connected_ms": round(((self.closed_at or time.perf_counter()) - self.connected_at) * 1000, 3),
+            "throughput_kbps": round(self.received_bytes * 8 / transfer / 1000, 1) if transfer > 0 else None,
+            "pages": len(self.pages),
+            "paper_mm": round(self.printed_dots / DOTS_PER_MM, 1),
+            "commands": dict(self.counts.most_common()),
+        }
+
+
+class EmulatorServer:
+    """
+    ESC/POSプリンタ エミュレータのTCPサーバー\n
+    接続ごとに受信したデータを解釈し、カットごとの用紙をPNG、実績をJSONで保存します。
+    """
+    def __init__(self, host="127.0.0.1", port=9100, output_dir=None, link_kbps=0, print_speed=0,
+                 paper_width=EMULATOR_PAPER_WIDTH):
+        """
+        エミュレータの初期化
+
+        :param str host: 待ち受けるアドレス
+        :param int port: 待ち受けるポート番号（0の場合は空いているポート）
+        :param output_dir: PNG・JSONの保存先（Noneの場合は保存しない）
+        :param float link_kbps: 模擬する回線速度（kbps、0の場合は制限なし）
+        :param float print_speed: 模擬する印字速度（mm/秒、0の場合は制限なし）
+        :param int paper_width: 印字幅（ドット）
+        """
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.link_kbps = link_kbps
+        self.print_speed = print_speed
+        self.paper_width = paper_width
+        self.sessions = []
+        self.nv_graphics = {}  # NVグラフィックス（接続をまたいで保持）
+        self.lock = threading.Lock()
+        self.server_socket = socket.create_server((host, port))
+        self.address = self.server_socket.getsockname()
+        self._thread = None
+
+    def start(self):
+        """
+        別スレッドで待ち受けを開始
+
+        :return: 自身
+        :rtype: EmulatorServer
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="escpos-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        待ち受けを終了
+        """
+        self.server_socket.close()
+
+    def serve_forever(self):
+        """
+        接続を待ち受け、接続ごとに受信用のスレッドを開始
+        """
+        logger.info(f"エミュレータ: {self.address[0]}:{self.address[1]} で待ち受けます")
+        while True:
+            try:
+                client, peer = self.server_socket.accept()
+            except OSError:
+                break  # 終了
+            with self.lock:
+                session = EmulatorSession(len(self.sessions) + 1, peer)
+                self.sessions.append(session)
+            threading.Thread(target=self._handle, args=(client, session), daemon=True).start()
+
+    def _handle(self, client, session):
+        """
+        1回の接続を処理（受信・解釈・速度の模擬・保存）
+
+        :param client: 接続したソケット
+        :param EmulatorSession session: 接続の実績
+        """
+        decoder = EscPosDecoder(self.paper_width, respond=client.sendall, nv_graphics=self.nv_graphics)
+        with client:
+            while True:
+                try:
+                    data = client.recv(RECEIVE_CHUNK_BYTES)
+                except OSError:
+                    break
+                if not data:
+                    break
+                now = time.perf_counter()
+                if session.first_byte_at is None:
+                    session.first_byte_at = now
+                session.last_byte_at = now
+                session.received_bytes += len(data)
+                session.receives += 1
+                decoder.feed(data)
+                self._throttle(session, decoder)
+        session.closed_at = time.perf_counter()
+        session.pages = decoder.finish()
+        session.counts = decoder.counts
+        session.printed_dots = decoder.printed_dots
+        self._save(session)
+        result = session.to_dict()
+        logger.info(f"エミュレータ: 接続{session.number} {result['received_bytes']}バイト {result['transfer_ms']}ms "
+                    f"用紙{result['pages']}枚 {result['paper_mm']}mm コマンド {result['commands']}")
+
+    def _throttle(self, session, decoder):
+        """
+        回線速度・印字速度を模擬（受信を待たせて送信側にプリンタと同じ待ちを発生させる）
+
+        :param EmulatorSession session: 接続の実績
+        :param EscPosDecoder decoder: デコーダ
+        """
+        elapsed = time.perf_counter() - session.first_byte_at
+        wait = 0.0
+        if self.link_kbps:
+            wait = max(wait, session.received_bytes * 8 / (self.link_kbps * 1000) - elapsed)
+        if self.print_speed:
+            printing = decoder.printed_dots / DOTS_PER_MM / self.print_speed
+            wait = max(wait, printing - elapsed - PRINT_BUFFER_SECONDS)
+        if wait > 0:
+            time.sleep(wait)
+
+    def _save(self, session):
+        """
+        用紙のイメージ（PNG）と実績（JSON）を保存
+
+        :param EmulatorSession session: 接続の実績
+        """
+        if self.output_dir is None:
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for index, page in enumerate(session.pages, start=1):
+            page.save(self.output_dir / f"session_{session.number:04d}_{index:02d}.png")
+        with open(self.output_dir / f"session_{session.number:04d}.json", "w", encoding="utf-8") as f:
+            json.dump(session.to_dict(), f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ESC/POSプリンタ エミュレータ")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=9100, help="待ち受けるポート番号")
+    parser.add_argument("--output", type=Path, default=Path(__file__).resolve().parent / "../cache/emulator", help="PNG・JSONの保存先")
+    parser.add_argument("--link-kbps", type=float, default=0, help="模擬する回線速度(kbps、0で制限なし)")
+    parser.add_argument("--print-speed", type=float, default=0, help="模擬する印字速度(mm/秒、0で制限なし。TM-T88IVは最大200)")
+    parser.add_argument("--paper-width", type=int, default=EMULATOR_PAPER_WIDTH, help="印字幅(ドット)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    server = EmulatorServer(args.host, args.port, args.output, args.link_kbps, args.print_speed, args.paper_width)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,244 @@
+from pathlib import Path
+import os
+import sys
+import json
+import logging
+
+# フォント収録文字インデックスのファイル名（fontsフォルダに格納）
+FONT_INDEX_FILE_NAME = "font_coverage.json"
+# インデックスの形式バージョン（形式を変えたら上げる）
+FONT_INDEX_FORMAT_VERSION = 1
+# フォントファイルの拡張子
+FONT_FILE_SUFFIXES = (".ttf", ".otf", ".ttc")
+# Unicodeのコードポイント数
+UNICODE_CODEPOINTS = 0x110000
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+def _file_stamp(path):
+    """
+    フォントファイルの識別情報（サイズ・更新日時）
+
+    :param path: フォントファイルのパス
+    :return: (サイズ, 更新日時)
+    :rtype: tuple
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def extract_ranges(font_file):
+    """
+    フォントのcmapから収録コードポイントの範囲表を作成(fontToolsを使用)
+
+    :param font_file: フォントファイルのパス
+    :return: [開始, 終了] のリスト（終了を含む）
+    :rtype: list[list[int]]
+    """
+    from fontTools.ttLib import TTFont  # インデックス作成時のみ必要
+
+    with TTFont(font_file, lazy=True, fontNumber=0) as font:
+        codepoints = sorted(font.getBestCmap() or {})
+    ranges = []
+    for cp in codepoints:
+        if ranges and ranges[-1][1] == cp - 1:
+            ranges[-1][1] = cp
+        else:
+            ranges.append([cp, cp])
+    return ranges
+
+
+def build_index(fonts_dir, index_file=None):
+    """
+    fontsフォルダ内の全フォントの収録文字インデックスを作成して保存\n
+    既存インデックスのうちフォントファイルが変わっていないものは再利用します。
+
+    :param fonts_dir: fontsフォルダのパス
+    :param index_file: インデックスファイルのパス（省略時はfontsフォルダ内）
+    :return: インデックスの内容
+    :rtype: dict
+    """
+    fonts_dir = Path(fonts_dir)
+    index_file = Path(index_file) if index_file else fonts_dir / FONT_INDEX_FILE_NAME
+    previous = _read_index_file(index_file).get("fonts", {})
+
+    fonts = {}
+    for font_file in sorted(fonts_dir.iterdir()):
+        if font_file.suffix.lower() not in FONT_FILE_SUFFIXES:
+            continue
+        size, mtime_ns = _file_stamp(font_file)
+        entry = previous.get(font_file.name)
+        if entry and entry.get("size") == size and entry.get("mtime_ns") == mtime_ns:
+            fonts[font_file.name] = entry
+            continue
+        logger.info(f"{font_file.name} の収録文字を抽出")
+        fonts[font_file.name] = {"size": size, "mtime_ns": mtime_ns, "ranges": extract_ranges(font_file)}
+
+    index = {"version": FONT_INDEX_FORMAT_VERSION, "fonts": fonts}
+    tmp_file = index_file.with_suffix(index_file.suffix + ".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_file, index_file)
+    return index
+
+
+def _read_index_file(index_file):
+    """
+    インデックスファイルを読み込み（存在しない、または形式が異なる場合は空の辞書）
+
+    :param index_file: インデックスファイルのパス
+    :rtype: dict
+    """
+    try:
+        with open(index_file, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != FONT_INDEX_FORMAT_VERSION:
+        return {}
+    return index
+
+
+class FontCoverageIndex:
+    """
+    フォールバックフォントの収録文字インデックス\n
+    コードポイントから使用するフォントを1回の配列参照で決定します。
+    jptext2で描画する場合は文字列に必要なフォントだけをTM88IVに渡し（PrinterHandler._font_printer）、
+    一括ラスター印字（ReceiptRasterizer）では文字ごとのフォントの選択に使います。
+    """
+    def __init__(self, font_chain, index):
+        """
+        収録文字インデックスの初期化
+
+        :param font_chain: (設定キー, フォントファイルのパス) の優先順リスト
+        :param dict index: build_indexで作成したインデックスの内容
+        """
+        self.font_chain = list(font_chain)
+        # コードポイントごとのフォント番号（0は該当なし、1以降はfont_chainの位置+1）
+        self._table = bytearray(UNICODE_CODEPOINTS)
+        fonts = index.get("fonts", {})
+        # 優先順位の低いフォントから書き込み、優先順位の高いフォントで上書き
+        for number in range(len(self.font_chain), 0, -1):
+            _, font_file = self.font_chain[number - 1]
+            entry = fonts.get(Path(font_file).name)
+            if entry is None:
+                continue
+            for start, end in entry["ranges"]:
+                self._table[start:end + 1] = bytes((number,)) * (end + 1 - start)
+
+    @classmethod
+    def load(cls, config, index_file=None, rebuild=True):
+        """
+        TM88IVクラス用設定のフォント構成に合わせてインデックスを読み込み\n
+        フォントファイルが更新されている場合は再作成します。
+
+        :param dict config: TM88IVクラス用設定
+        :param index_file: インデックスファイルのパス（省略時は漢字フォントと同じフォルダ）
+        :param bool rebuild: インデックスが古い場合に再作成するかどうか
+        :return: 収録文字インデックス（作成できない場合はNone）
+        :rtype: FontCoverageIndex
+        """
+        font_chain = font_chain_from_config(config)
+        if not font_chain:
+            return None
+        fonts_dir = Path(font_chain[0][1]).parent
+        index_file = Path(index_file) if index_file else fonts_dir / FONT_INDEX_FILE_NAME
+        index = _read_index_file(index_file)
+        if not cls._is_current(index, font_chain):
+            if not rebuild:
+                return None
+            try:
+                index = build_index(fonts_dir, index_file)
+            except Exception as e:
+                logger.warning(f"フォント収録文字インデックスを作成できません: {e}")
+                return None
+        return cls(font_chain, index)
+
+    @staticmethod
+    def _is_current(index, font_chain):
+        """
+        インデックスが全フォントの現在のファイルに対応しているかを判定
+
+        :rtype: bool
+        """
+        fonts = index.get("fonts", {})
+        for _, font_file in font_chain:
+            entry = fonts.get(Path(font_file).name)
+            try:
+                if entry is None or (entry["size"], entry["mtime_ns"]) != _file_stamp(font_file):
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def font_for(self, cp):
+        """
+        コードポイントを収録している最優先のフォントを取得
+
+        :param int cp: コードポイント
+        :return: (設定キー, フォントファイルのパス)（どのフォントにもない場合はNone）
+        :rtype: tuple
+        """
+        number = self._table[cp]
+        return self.font_chain[number - 1] if number else None
+
+    def font_for_cluster(self, cluster):
+        """
+        表示単位（絵文字シーケンス等）の先頭文字を収録している最優先のフォントを取得
+
+        :param str cluster: 表示単位の文字列
+        :return: (設定キー, フォントファイルのパス)（どのフォントにもない場合はNone）
+        :rtype: tuple
+        """
+        return self.font_for(ord(cluster[0])) if cluster else None
+
+    def required_fonts(self, text):
+        """
+        文字列の印字に必要なフォントの設定キーを取得
+
+        :param str text: 対象の文字列
+        :return: 設定キーの集合
+        :rtype: set[str]
+        """
+        numbers = {self._table[ord(ch)] for ch in text}
+        return {self.font_chain[number - 1][0] for number in numbers if number}
+
+
+# プロセス共有の収録文字インデックス（フォント構成ごと）
+_shared_indexes = {}
+
+
+def shared_index(config):
+    """
+    フォント構成ごとにプロセスで共有する収録文字インデックスを取得
+
+    :param dict config: TM88IVクラス用設定
+    :return: 収録文字インデックス（作成できない場合はNone）
+    :rtype: FontCoverageIndex
+    """
+    chain_key = tuple((key, str(value)) for key, value in font_chain_from_config(config))
+    if chain_key not in _shared_indexes:
+        _shared_indexes[chain_key] = FontCoverageIndex.load(config)
+    return _shared_indexes[chain_key]
+
+
+def font_chain_from_config(config):
+    """
+    TM88IVクラス用設定からフォントの優先順リストを作成（設定の記述順）
+
+    :param dict config: TM88IVクラス用設定
+    :return: (設定キー, フォントファイルのパス) のリスト
+    :rtype: list[tuple]
+    """
+    return [(key, value) for key, value in (config or {}).items()
+            if "_file" in key and Path(value).suffix.lower() in FONT_FILE_SUFFIXES]
+
+
+# インデックス作成（download_tool.pyから、または単体で実行）
+if __name__ == "__main__":
+    logging.basicConfig(format="[INDEX] %(message)s")
+    target_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).resolve().parent.parent / "fonts"
+    build_index(target_dir)
+    print("[完了] フォント収録文字インデックスを作成しました。")
@@ -0,0 +1,67 @@
+from pathlib import Path
+from PIL import ImageFont
+import logging
+import threading
+
+
+class FontManager:
+    """
+    プロセス全体で共有するフォント管理クラス\n
+    サイズごとのImageFontをキャッシュして払い出します（一括ラスター印字のレンダラーが使用）。
+    TM88IVのjptext2が使うフォントはTM88IVが自身で読み込むため、ここでは管理しません
+    （TM88IVのオブジェクトはPrinterHandlerで共有し、読み込みは初回のみ）。
+    """
+    def __init__(self):
+        """
+        フォント管理クラスの初期化
+        """
+        self._fonts = {}  # (フォントファイルのパス, サイズ, フェイス番号) -> ImageFont
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+    def font(self, font_file, size, index=0):
+        """
+        サイズ指定のフォントを取得（同じフォント・サイズは同じインスタンスを返却）\n
+        フォントはパス指定でFreeTypeに開かせるため、ファイルの内容をPython側でメモリに複製しません。
+
+        :param font_file: フォントファイルのパス
+        :param int size: フォントサイズ
+        :param int index: フェイス番号（.ttcの場合）
+        :return: フォント
+        :rtype: ImageFont.FreeTypeFont
+        """
+        path = str(Path(font_file).resolve())
+        key = (path, int(size), index)
+        with self._lock:
+            font = self._fonts.get(key)
+        if font is not None:
+            return font
+        font = ImageFont.truetype(path, int(size), index=index)
+        with self._lock:
+            return self._fonts.setdefault(key, font)
+
+    def close(self):
+        """
+        すべてのフォントを解放
+        """
+        with self._lock:
+            self._fonts.clear()
+
+
+# プロセス共有のフォント管理
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+
+def shared_manager():
+    """
+    プロセス共有のフォント管理を取得
+
+    :rtype: FontManager
+    """
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = FontManager()
+        return _shared_manager
@@ -0,0 +1,253 @@
+from collections import OrderedDict
+from pathlib import Path
+import os
+import pickle
+import logging
+import threading
+
+# グリフキャッシュのメモリ上限（バイト）の初期値
+GLYPH_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# 永続化ファイルの形式バージョン（形式を変えたら上げる）
+GLYPH_CACHE_FORMAT_VERSION = 3
+
+# 絵文字シーケンスを構成する結合用コードポイント
+ZWJ = 0x200D
+KEYCAP = 0x20E3
+VARIATION_SELECTORS = range(0xFE00, 0xFE10)
+SKIN_TONE_MODIFIERS = range(0x1F3FB, 0x1F400)
+TAG_CHARACTERS = range(0xE0020, 0xE0080)
+REGIONAL_INDICATORS = range(0x1F1E6, 0x1F200)
+
+
+class GlyphCache:
+    """
+    jptext2でフォント描画される文字を含む呼び出しのESC/POS出力をキャッシュするクラス(LRU)
+    """
+    def __init__(self, max_bytes=GLYPH_CACHE_MAX_BYTES, cache_file=None):
+        """
+        グリフキャッシュの初期化
+
+        :param int max_bytes: メモリ上限（バイト）
+        :param cache_file: 永続化ファイルのパス（Noneの場合は永続化しない）
+        """
+        self.max_bytes = max_bytes
+        self.cache_file = Path(cache_file) if cache_file else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        # 保存中の書き込みを1つに限るロック（印刷キューのプリンタごとのスレッドから同時に呼ばれるため、一時ファイルを共有しない）
+        self._save_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+    def get(self, key):
+        """
+        キャッシュからグリフを取得
+
+        :param key: キャッシュキー
+        :return: ESC/POSのバイト列（存在しない場合はNone）
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """
+        グリフをキャッシュに追加（上限を超えた分は古いものから破棄）
+
+        :param key: キャッシュキー
+        :param bytes data: ESC/POSのバイト列
+        """
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            self._evict()
+            self._dirty = True
+
+    def _evict(self):
+        """
+        メモリ上限を超えた分を古いものから破棄（ロック取得済みで呼び出すこと）
+        """
+        while self._size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def clear(self):
+        """
+        キャッシュを空にする（ベンチマークでキャッシュのない状態を計測する場合など、ヒット数・ミス数はそのまま）
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._dirty = True
+
+    def stats(self):
+        """
+        キャッシュの統計情報を取得
+
+        :return: 件数、使用量、ヒット数、ミス数、ヒット率の辞書
+        :rtype: dict
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    def load(self):
+        """
+        永続化ファイルからキャッシュを読み込み\n
+        ファイルが存在しない、または形式が異なる場合は何もしません。
+        """
+        if self.cache_file is None or not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, "rb") as f:
+                version, entries = pickle.load(f)
+        except Exception as e:
+            self.logger.warning(f"グリフキャッシュの読み込みに失敗しました: {e}")
+            return
+        if version != GLYPH_CACHE_FORMAT_VERSION:
+            return
+        with self._lock:
+            for key, data in entries:
+                self._entries[key] = data
+                self._size += len(data)
+            self._evict()
+        self.logger.info(f"グリフキャッシュを読み込みました: {len(self._entries)}件")
+
+    def save(self):
+        """
+        キャッシュを永続化ファイルへ保存（変更がない場合は何もしない）\n
+        一時ファイルへ書き込んでから置き換えるため、途中で終了しても既存ファイルは壊れません。
+        複数のスレッドから呼ばれた場合は順番に保存します（後から呼んだ側は先の保存で変更がなくなっていれば何もしない）。
+        """
+        if self.cache_file is None:
+            return
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                entries = list(self._entries.items())
+                self._dirty = False
+            try:
+                self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = self.cache_file.with_suffix(self.cache_file.suffix + ".tmp")
+                with open(tmp_file, "wb") as f:
+                    pickle.dump((GLYPH_CACHE_FORMAT_VERSION, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_file, self.cache_file)
+            except Exception as e:
+                with self._lock:
+                    self._dirty = True  # 次の保存で再試行
+                self.logger.warning(f"グリフキャッシュの保存に失敗しました: {e}")
+
+
+# プロセス共有のグリフキャッシュ
+_shared_cache = None
+
+
+def configure(max_bytes=GLYPH_CACHE_MAX_BYTES, cache_file=None):
+    """
+    プロセス共有のグリフキャッシュを設定（永続化ファイルがあれば読み込み）
+
+    :param int max_bytes: メモリ上限（バイト）
+    :param cache_file: 永続化ファイルのパス（Noneの場合は永続化しない）
+    :return: グリフキャッシュ
+    :rtype: GlyphCache
+    """
+    global _shared_cache
+    _shared_cache = GlyphCache(max_bytes=max_bytes, cache_file=cache_file)
+    _shared_cache.load()
+    return _shared_cache
+
+
+def shared_cache():
+    """
+    プロセス共有のグリフキャッシュを取得（未設定の場合はメモリのみで作成）
+
+    :rtype: GlyphCache
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = GlyphCache()
+    return _shared_cache
+
+
+def needs_font_rendering(ch):
+    """
+    文字がプリンタ内蔵フォントで印字できず、フォント描画が必要かを判定
+
+    :param str ch: 対象の文字
+    :rtype: bool
+    """
+    if ch == "\n":
+        return False
+    try:
+        ch.encode("cp932")
+        return False
+    except UnicodeEncodeError:
+        return True
+
+
+def split_clusters(text):
+    """
+    文字列を表示単位（絵文字の結合シーケンスを1単位とする）に分割
+
+    :param str text: 対象の文字列
+    :return: 表示単位のリスト
+    :rtype: list[str]
+    """
+    clusters = []
+    joining = False  # 直前がZWJの場合は次の文字も結合
+    for ch in text:
+        cp = ord(ch)
+        if clusters and (joining or cp == ZWJ or cp == KEYCAP or cp in VARIATION_SELECTORS
+                         or cp in SKIN_TONE_MODIFIERS or cp in TAG_CHARACTERS):
+            clusters[-1] += ch
+        elif (clusters and cp in REGIONAL_INDICATORS and len(clusters[-1]) == 1
+              and ord(clusters[-1]) in REGIONAL_INDICATORS):
+            clusters[-1] += ch  # 国旗（地域指示記号のペア）
+        else:
+            clusters.append(ch)
+        joining = cp == ZWJ
+    return clusters
+
+
+def split_for_glyph_cache(text):
+    """
+    文字列を内蔵フォントで印字できる連続部分と、フォント描画が必要な表示単位に分割
+
+    :param str text: 対象の文字列
+    :return: (文字列, フォント描画が必要か) のリスト
+    :rtype: list[tuple[str, bool]]
+    """
+    chunks = []
+    plain = ""
+    for cluster in split_clusters(text):
+        if any(needs_font_rendering(ch) for ch in cluster):
+            if plain:
+                chunks.append((plain, False))
+                plain = ""
+            chunks.append((cluster, True))
+        else:
+            plain += cluster
+    if plain:
+        chunks.append((plain, False))
+    return chunks
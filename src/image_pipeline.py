@@ -0,0 +1,246 @@
+from functools import lru_cache
+from PIL import Image, ImageEnhance, ImageOps, ImageFilter
+import numpy as np
+
+import timing
+
+# プリンタの画像最大幅
+PRINTER_IMAGE_MAX_WIDTH = 512
+
+# ハイブリッドディザリングのエッジ検出フィルタ
+FILTER_MAP = {
+    "FIND_EDGES": ImageFilter.FIND_EDGES,
+    "EDGE_ENHANCE": ImageFilter.EDGE_ENHANCE,
+    "EDGE_ENHANCE_MORE": ImageFilter.EDGE_ENHANCE_MORE,
+    "CONTOUR": ImageFilter.CONTOUR,
+    "EMBOSS": ImageFilter.EMBOSS,
+    #"SHARPEN": ImageFilter.SHARPEN,
+    #"SMOOTH": ImageFilter.SMOOTH,
+    "SMOOTH_MORE": ImageFilter.SMOOTH_MORE,
+    "DETAIL": ImageFilter.DETAIL,
+    "BLUR": ImageFilter.BLUR,
+    #"GaussianBlur": ImageFilter.GaussianBlur,
+    #"UnsharpMask": ImageFilter.UnsharpMask,
+    #"GaussianBlur": ImageFilter.GaussianBlur,
+    #"BoxBlur": ImageFilter.BoxBlur,
+    #"MedianFilter": ImageFilter.MedianFilter,
+}
+
+
+# Bayer マトリックスを生成
+@lru_cache(maxsize=4)
+def bayer_matrix(n):
+    """
+    Bayer マトリックスを生成
+
+    :param int n: マトリクスのサイズ（2, 4, 8 のいずれか）
+    :return: Bayer マトリックス
+    :rtype: numpy.ndarray
+    :raises ValueError: 未対応のサイズの場合
+    """
+    if n == 1:
+        return np.array([[0]])
+    elif n in (2, 4, 8):
+        smaller_matrix = bayer_matrix(n // 2)
+        return np.block([
+            [4 * smaller_matrix, 4 * smaller_matrix + 2],
+            [4 * smaller_matrix + 3, 4 * smaller_matrix + 1]
+        ]) / (n * n)
+    else:
+        raise ValueError("bayer_matrix: 未対応のサイズです（2, 4, 8 のみ対応）")
+
+
+# random マトリックスを生成
+@lru_cache(maxsize=100)
+def random_matrix(n, seed=0):
+    """
+    random マトリックスを生成
+
+    :param int n: マトリクスのサイズ（2, 4, 8 のいずれか）
+    :param int seed: 乱数シード値
+    :return: 正規化されたランダムマトリックス
+    :rtype: numpy.ndarray
+    """
+    np.random.seed(seed)  # 再現性のためにシードを固定
+    matrix = np.random.rand(n, n)
+    flat = matrix.flatten()
+    ranks = flat.argsort().argsort()  # ランク化（0〜n^2-1）
+    normalized = ranks.reshape((n, n)) / (n * n)
+    return normalized
+
+
+# clusterd マトリックスを生成
+@lru_cache(maxsize=4)
+def clustered_matrix(n):
+    """
+    クラスターマトリックスを生成
+
+    :param int n: マトリクスのサイズ（2, 4, 8 のいずれか）
+    :return: クラスターマトリックス
+    :rtype: numpy.ndarray
+    :raises ValueError: 未対応のサイズの場合（2, 4, 8 のみ対応）
+    """
+    # 4x4クラスタマトリクス（Ulichney の方式ベース）
+    base_4x4 = np.array([
+        [12,  5,  6, 13],
+        [ 4,  0,  1,  7],
+        [11,  3,  2,  8],
+        [15, 10,  9, 14]
+    ]) / 16.0
+
+    # 8x8クラスタマトリクス（Ulichney の方式ベース）
+    base_8x8 = np.array([
+        [36, 16, 28, 48, 37, 17, 29, 49],
+        [12,  0,  4, 20, 13,  1,  5, 21],
+        [44, 24, 32, 52, 45, 25, 33, 53],
+        [ 8,  2,  6, 22,  9,  3,  7, 23],
+        [40, 18, 30, 50, 41, 19, 31, 51],
+        [14, 10,  6, 26, 15, 11,  7, 27],
+        [46, 26, 34, 54, 47, 27, 35, 55],
+        [10,  6,  8, 24, 11,  7,  9, 25]
+    ]) / 64.0
+
+    if n == 4:
+        return base_4x4
+    elif n == 8:
+        return base_8x8
+    elif n == 2:
+        return np.array([[0, 2], [3, 1]]) / 4.0
+    else:
+        raise ValueError("clustered_matrix: 未対応のサイズです（2, 4, 8 のみ対応）")
+
+
+def hybrid_dithering(image, edge_threshold=128, dither_type=0, matrix_size=4, filter_type="FIND_EDGES", filter_enabled=True, random_seed=0):
+    """
+    ハイブリッドディザリングを適用
+
+    :param image: 入力画像（Pillow Image オブジェクト）
+    :param edge_threshold: 2値化のしきい値
+    :param matrix_size: マトリックスのサイズ
+    :return: ハイブリッドディザリング後の画像
+    :raises ValueError: matrix_sizeが2のべき乗でない場合
+    """
+    # matrix_size確認
+    if matrix_size & (matrix_size - 1) != 0:
+        raise ValueError("hybrid_dithering: matrix_sizeは2のべき乗で無ければいけない")
+
+    # グレースケールに変換
+    image = image.convert("L")
+    width, height = image.size
+
+    if filter_enabled:
+        # フィルタの設定を取得
+        config_edge_detection = FILTER_MAP.get(filter_type, ImageFilter.FIND_EDGES)
+        # フィルタを適用
+        edges = image.filter(config_edge_detection)
+        edge_pixels = np.array(edges, dtype=np.uint8)
+        edge_pixels = (edge_pixels - edge_pixels.min()) / (np.ptp(edge_pixels) + 1e-5) * 255
+    else:
+        edge_pixels = np.full((height, width), edge_threshold)  # 全体を同一値に設定
+
+    if dither_type == 0:
+        # Bayer マトリックスを生成
+        matrix = bayer_matrix(matrix_size) * 255 # 0-255 の範囲にスケール
+    if dither_type == 1:
+        # random マトリックスを生成
+        matrix = random_matrix(matrix_size, random_seed) * 255
+    elif dither_type == 2:
+        # clustered マトリクスを生成
+        matrix = clustered_matrix(matrix_size) * 255
+
+    matrix = np.tile(matrix, (height // matrix_size + 1, width // matrix_size + 1))
+    matrix = matrix[:height, :width]
+
+    # ピクセルデータを取得
+    pixels = np.array(image)
+
+    # ハイブリッドディザリングを適用
+    result = np.zeros_like(pixels, dtype=np.uint8)
+    for y in range(height):
+        for x in range(width):
+            if edge_pixels[y, x] > edge_threshold or filter_enabled == False:  # エッジ部分
+                result[y, x] = 255 if pixels[y, x] > matrix[y, x] else 0
+            else:  # 無地部分
+                result[y, x] = 255 if pixels[y, x] > edge_threshold else 0
+
+    # 新しい画像を作成
+    return Image.fromarray(result, mode="L")
+
+
+def process_image(image, max_width=PRINTER_IMAGE_MAX_WIDTH, auto_enlarge=False, alpha_to_white=True, contrast=False, invert=False,
+                  brightness=1.0, dither_mode=1, dither_type=0, matrix_size=4, filter_type="FIND_EDGES", filter_enabled=True, random_seed=0):
+    """
+    印刷用に画像を処理（リサイズ・補正・ディザリング）\n
+    画面のプレビューとコマンドラインの印刷で共通の処理です。
+
+    :param image: 入力画像（Pillow Image オブジェクト）
+    :param int max_width: プリンタの画像最大幅
+    :param bool auto_enlarge: 小さい画像を最大幅まで拡大するかどうか
+    :param bool alpha_to_white: アルファチャンネルを白で合成するかどうか
+    :param bool contrast: コントラストを強調するかどうか
+    :param bool invert: 反転するかどうか
+    :param float brightness: 明るさ（1.0で変更なし）
+    :param int dither_mode: ディザリング(1)、２値化(2)、ハイブリッド(3)
+    :param int dither_type: ハイブリッドのディザ種類（0=bayer, 1=random, 2=clustered）
+    :param int matrix_size: ハイブリッドのマトリックスのサイズ
+    :param str filter_type: ハイブリッドのエッジ検出フィルタ
+    :param bool filter_enabled: ハイブリッドのエッジ検出を有効にするかどうか
+    :param int random_seed: ハイブリッドのランダムマトリクス用シード値
+    :return: 処理後の画像
+    :rtype: Image
+    """
+    # RGBAモードの場合はRGBに変換
+    if image.mode == "RGBA":
+        if alpha_to_white:
+            background = Image.new("RGB", image.size, (255, 255, 255))  # 白背景
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        image = image.convert("RGB")
+
+    # 画像の幅と高さを取得
+    width, height = image.size
+
+    # 幅がプリンタ画像最大値未満、以上の場合は最大値に拡大
+    if (auto_enlarge and width < max_width) or width > max_width: 
+        # プリンタの画像最大幅をセット
+        new_width = max_width
+        # アスペクト比を計算
+        aspect_ratio = height / width
+        # 高さをアスペクト比に基づいて計算
+        new_height = int(new_width * aspect_ratio)
+        # 画像をリサイズ
+        with timing.stage("image_resize"):
+            image = image.resize((new_width, new_height), Image.LANCZOS)
+
+    # コントラスト強調
+    if contrast:
+        enhancer = ImageEnhance.Contrast(image)
+        image = enhancer.enhance(2.0)
+
+    # 反転
+    if invert:
+        image = ImageOps.invert(image)
+
+    # 明るさ調整
+    image = ImageEnhance.Brightness(image).enhance(brightness)
+
+    # ディザリング
+    if dither_mode == 1:  
+        with timing.stage("dither"):
+            image = image.convert("1")
+    # 2値化
+    elif dither_mode == 2:
+        with timing.stage("threshold"):
+            image = image.convert("L")
+            image = image.point(lambda x: 255 if x > 128 else 0, mode='1')
+    # ハイブリッドディザリング
+    elif dither_mode == 3:
+        with timing.stage("hybrid_dithering"):
+            image = hybrid_dithering(image,
+                                     dither_type=dither_type,
+                                     matrix_size=matrix_size,
+                                     filter_type=filter_type,
+                                     filter_enabled=filter_enabled,
+                                     random_seed=random_seed)
+
+    return image
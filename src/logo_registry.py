@@ -0,0 +1,299 @@
+from pathlib import Path
+import os
+import re
+import json
+import hashlib
+import secrets
+import logging
+import threading
+
+from PIL import Image
+import numpy as np
+
+import image_pipeline
+
+"""
+ロゴのNVグラフィックス登録
+<LOGO:名前> で指定したロゴ画像を、プリンタのNVグラフィックスメモリ（GS ( L）に一度だけ登録し、
+印刷時はキーコードを指定する短いコマンド（数バイト）で印字します。
+印刷データはどのプリンタでも同じ内容になり、登録は印刷データの送信直前に送信先のプリンタごとに行います。
+キーコードはPC（登録状況のファイル）ごとの識別子と印字データのハッシュから決めるため、同じプリンタを複数のPCで共有する場合や、
+PCを入れ直した場合も、異なるロゴに同じキーコードを使うことはありません（登録状況が分からないPCは登録し直します）。
+画像を差し替えた場合は、このPCが登録した古いキーコードのNVグラフィックスを削除してから登録します。
+登録した内容はロゴの印字データのハッシュでプリンタごとに記録し、画像を差し替えた場合だけ登録し直します。
+NVメモリは書き換え回数に上限があるため、登録は内容が変わった場合に限ります。
+プリンタを交換・初期化した場合は、登録状況のファイルを削除すると次の印刷で登録し直します。
+"""
+
+# ロゴ画像の置き場所（<LOGO:名前> の名前をファイル名とする画像）
+LOGO_DIR = Path(__file__).resolve().parent / "../logos"
+# ロゴ画像の拡張子（先に見つかったものを使用）
+LOGO_SUFFIXES = (".png", ".bmp", ".gif", ".jpg", ".jpeg")
+# ロゴ名に使える文字
+LOGO_NAME_PATTERN = re.compile(r"^[\w-]+$")
+# 登録状況の保存先（プリンタごとに登録済みのロゴ名とキーコード）
+LOGO_REGISTRY_FILE = Path(__file__).resolve().parent / "../cache/logos.json"
+# 登録状況の形式バージョン（形式を変えたら上げる）
+LOGO_REGISTRY_FORMAT_VERSION = 2
+# キーコード（kc1 kc2）に使える文字コードの範囲
+LOGO_KEY_FIRST = 32
+LOGO_KEY_LAST = 126
+# NVグラフィックスのコマンド（GS ( L、データが64KBを超える場合はGS 8 L）
+GRAPHICS_COMMAND = b"\x1d\x28\x4c"
+GRAPHICS_COMMAND_LONG = b"\x1d\x38\x4c"
+# NVグラフィックスの機能番号（指定したキーコードの削除・ラスター形式の登録・印字）
+GRAPHICS_FN_DELETE = 66
+GRAPHICS_FN_DEFINE = 67
+GRAPHICS_FN_PRINT = 69
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+def graphics_command(fn, parameters):
+    """
+    NVグラフィックスのコマンドを作成（GS ( L m fn ...）
+
+    :param int fn: 機能番号
+    :param bytes parameters: 機能番号に続くパラメータ
+    :rtype: bytes
+    """
+    body = bytes((48, fn)) + parameters
+    if len(body) <= 0xFFFF:
+        return GRAPHICS_COMMAND + len(body).to_bytes(2, "little") + body
+    return GRAPHICS_COMMAND_LONG + len(body).to_bytes(4, "little") + body
+
+
+def key_for_digest(digest, owner=""):
+    """
+    印字データのハッシュからキーコードを決定（kc1 kc2とも32～126の範囲）
+
+    :param str digest: 印字データのハッシュ（16進数）
+    :param str owner: 登録するPCの識別子（他のPCが登録した同じ内容のロゴと別のキーコードにする）
+    :return: キーコード（2文字）
+    :rtype: str
+    """
+    count = LOGO_KEY_LAST - LOGO_KEY_FIRST + 1
+    number = int(hashlib.sha256((owner + digest).encode("ascii")).hexdigest()[:8], 16) % (count * count)
+    return chr(LOGO_KEY_FIRST + number // count) + chr(LOGO_KEY_FIRST + number % count)
+
+
+def delete_command(key):
+    """
+    NVグラフィックスの削除コマンド（GS ( L fn=66）
+
+    :param str key: キーコード（2文字）
+    :rtype: bytes
+    """
+    return graphics_command(GRAPHICS_FN_DELETE, key.encode("ascii"))
+
+
+class Logo:
+    """
+    印字用に変換したロゴ（1bitのラスターデータとキーコード）
+    """
+    def __init__(self, name, image, owner=""):
+        """
+        ロゴの初期化
+
+        :param str name: ロゴ名
+        :param image: 印字用に変換した画像（Pillow Image、モード"1"）
+        :param str owner: 登録するPCの識別子
+        """
+        self.name = name
+        self.image = image
+        self.width, self.height = image.size
+        # 1行ごとに8ドット単位で詰めたラスターデータ（1が黒、端数は白）
+        self.raster = np.packbits(~np.array(image, dtype=bool), axis=1).tobytes()
+        self.digest = hashlib.sha256(repr((self.width, self.height)).encode("utf-8") + self.raster).hexdigest()
+        self.key = key_for_digest(self.digest, owner)
+
+    def define_command(self):
+        """
+        NVグラフィックスへの登録コマンド（GS ( L fn=67、ラスター形式・1色）
+
+        :rtype: bytes
+        """
+        padded_width = (self.width + 7) // 8 * 8  # ラスターデータの1行の幅（ドット）
+        parameters = (bytes((48,)) + self.key.encode("ascii") + bytes((1,))
+                      + padded_width.to_bytes(2, "little") + self.height.to_bytes(2, "little")
+                      + bytes((49,)) + self.raster)
+        return graphics_command(GRAPHICS_FN_DEFINE, parameters)
+
+    def print_command(self):
+        """
+        登録済みのNVグラフィックスの印字コマンド（GS ( L fn=69、等倍）
+
+        :rtype: bytes
+        """
+        return graphics_command(GRAPHICS_FN_PRINT, self.key.encode("ascii") + bytes((1, 1)))
+
+
+class LogoRegistry:
+    """
+    プリンタごとのNVグラフィックスの登録状況（ロゴ名とキーコード）を管理するクラス
+    """
+    def __init__(self, logo_dir=LOGO_DIR, registry_file=LOGO_REGISTRY_FILE):
+        """
+        ロゴ登録状況の初期化（保存済みの登録状況があれば読み込み）
+
+        :param logo_dir: ロゴ画像の置き場所
+        :param registry_file: 登録状況の保存先
+        """
+        self.logo_dir = Path(logo_dir)
+        self.registry_file = Path(registry_file)
+        self.stored = {}  # プリンタ（IPアドレス:ポート） → {ロゴ名: 登録済みのキーコード}
+        self.stale = {}  # プリンタ → 削除するキーコード（以前の形式で登録したもの）
+        self.owner = None  # このPCの識別子（キーコードの決定に使用）
+        self.uploads = 0  # このプロセスで登録した回数
+        self._logos = {}  # ロゴ名 → (画像ファイルの識別情報, Logo)
+        self._lock = threading.RLock()
+        self.load()
+        if self.owner is None:
+            self.owner = secrets.token_hex(8)
+            self.save()
+
+    def find_image(self, name):
+        """
+        ロゴ名に対応する画像ファイルを検索
+
+        :param str name: ロゴ名
+        :return: 画像ファイルのパス（存在しない場合はNone）
+        :rtype: Path
+        """
+        if not LOGO_NAME_PATTERN.match(name):
+            return None
+        for suffix in LOGO_SUFFIXES:
+            path = self.logo_dir / f"{name}{suffix}"
+            if path.is_file():
+                return path
+        return None
+
+    def get(self, name, max_width=image_pipeline.PRINTER_IMAGE_MAX_WIDTH):
+        """
+        ロゴを取得（画像ファイルが変わっていなければ変換済みのものを使用）
+
+        :param str name: ロゴ名
+        :param int max_width: 印字幅（ドット）
+        :return: ロゴ（画像がない場合はNone）
+        :rtype: Logo
+        """
+        path = self.find_image(name)
+        if path is None:
+            return None
+        stat = path.stat()
+        fingerprint = (str(path), stat.st_size, stat.st_mtime_ns, max_width)
+        with self._lock:
+            cached = self._logos.get(name)
+            if cached is not None and cached[0] == fingerprint:
+                return cached[1]
+            with Image.open(path) as image:
+                processed = image_pipeline.process_image(image.convert("RGBA"), max_width=max_width).convert("1")
+            logo = Logo(name, processed, self.owner)
+            self._logos[name] = (fingerprint, logo)
+            return logo
+
+    def is_stored(self, printer, logo):
+        """
+        ロゴの現在の内容がプリンタに登録済みかどうか
+
+        :param str printer: プリンタ（IPアドレス:ポート）
+        :param Logo logo: ロゴ
+        :rtype: bool
+        """
+        with self._lock:
+            return self.stored.get(printer, {}).get(logo.name) == logo.key
+
+    def ensure_stored(self, printer_connection, printer, logo):
+        """
+        ロゴがプリンタに登録されていない、または内容が変わった場合は登録\n
+        同じロゴ名で以前に登録したキーコードは、他のロゴで使っていなければ同じ送信で削除します。
+
+        :param connection.PrinterConnection printer_connection: プリンタとの接続
+        :param str printer: プリンタ（IPアドレス:ポート）
+        :param Logo logo: ロゴ
+        :return: 登録したかどうか（登録済みだった場合はFalse）
+        :rtype: bool
+        :raises OSError: 登録コマンドを送信できない場合（接続できない場合はpython-escposの例外、登録状況は記録しない）
+        """
+        with self._lock:
+            if self.is_stored(printer, logo):
+                return False
+            stored = self.stored.get(printer, {})
+            in_use = {key for name, key in stored.items() if name != logo.name}
+            superseded = {stored.get(logo.name)} | set(self.stale.get(printer, ()))
+            obsolete = sorted(key for key in superseded if key and key != logo.key and key not in in_use)
+            data = b"".join(delete_command(key) for key in obsolete) + logo.define_command()
+            try:
+                printer_connection.send(data)
+            except Exception as e:
+                logger.warning(f"ロゴ '{logo.name}' をプリンタ {printer} に登録できません: {e}")
+                raise
+            stored = self.stored.setdefault(printer, {})
+            # ハッシュが衝突して同じキーコードを使っていた別のロゴは上書きされたため、登録済みから外す
+            for name in [name for name, key in stored.items() if key == logo.key]:
+                del stored[name]
+            stored[logo.name] = logo.key
+            self.stale.pop(printer, None)
+            self.uploads += 1
+            self.save()
+        if obsolete:
+            logger.info(f"プリンタ {printer} の使わなくなったロゴを削除しました: キー {obsolete}")
+        logger.info(f"ロゴ '{logo.name}' をプリンタ {printer} に登録しました: キー {logo.key!r} {logo.width}x{logo.height} {len(data)}バイト")
+        return True
+
+    def load(self):
+        """
+        保存済みの登録状況を読み込み（ファイルが存在しない、または形式が異なる場合は何もしない）
+        """
+        if not self.registry_file.exists():
+            return
+        try:
+            with open(self.registry_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"ロゴの登録状況の読み込みに失敗しました: {e}")
+            return
+        with self._lock:
+            if data.get("version") == 1:
+                # 以前の形式（順番に割り当てたキーコード）で登録したものは、次の登録時に削除
+                self.stale = {printer: sorted(keys) for printer, keys in data.get("printers", {}).items()}
+                return
+            if data.get("version") != LOGO_REGISTRY_FORMAT_VERSION:
+                return
+            self.owner = data.get("owner")
+            self.stored = {printer: dict(logos) for printer, logos in data.get("printers", {}).items()}
+            self.stale = {printer: list(keys) for printer, keys in data.get("stale", {}).items()}
+
+    def save(self):
+        """
+        登録状況を保存（一時ファイルに書き込んでから置き換え）
+        """
+        with self._lock:
+            data = {"version": LOGO_REGISTRY_FORMAT_VERSION, "owner": self.owner, "printers": self.stored, "stale": self.stale}
+            try:
+                self.registry_file.parent.mkdir(parents=True, exist_ok=True)
+                tmp_file = self.registry_file.with_suffix(self.registry_file.suffix + ".tmp")
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=1)
+                os.replace(tmp_file, self.registry_file)
+            except OSError as e:
+                logger.warning(f"ロゴの登録状況を保存できません: {e}")
+
+
+# プロセス共有のロゴ登録状況
+_shared_registry = None
+_shared_registry_lock = threading.Lock()
+
+
+def shared_registry():
+    """
+    プロセス共有のロゴ登録状況を取得（初回のみ作成）
+
+    :rtype: LogoRegistry
+    """
+    global _shared_registry
+    with _shared_registry_lock:
+        if _shared_registry is None:
+            _shared_registry = LogoRegistry()
+        return _shared_registry
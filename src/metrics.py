@@ -0,0 +1,377 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import os
+import bisect
+import logging
+import threading
+
+import connection
+import glyph_cache
+import timing
+
+"""
+印刷のメトリクス
+印刷ジョブ数・送信バイト数・段階ごとの処理時間のヒストグラム・プリンタのエラー/再接続・キャッシュのヒット数・待ちジョブ数を
+Prometheusのテキスト形式で公開します（localhostのHTTP、または一定間隔で書き出すファイル）。
+ジョブ・段階の値は処理時間の計測（timing）の通知から集計し、その他の値は取得時に各モジュールの統計から読み取るため、
+印刷・プレビューの処理を待たせません。
+"""
+
+# メトリクス名の接頭辞
+METRICS_PREFIX = "minicaptureprint_"
+# HTTPで公開する場合のアドレス（他の端末からは参照できないようlocalhostのみ）
+METRICS_HOST = "127.0.0.1"
+# ファイルに書き出す場合の保存先・間隔（秒）
+METRICS_FILE = Path(__file__).resolve().parent / "../cache/metrics.prom"
+METRICS_FILE_INTERVAL = 15
+# 処理時間のヒストグラムの区切り（秒）
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+def _format_labels(labels):
+    """
+    ラベルをPrometheusの記法に変換
+
+    :param labels: (名前, 値)のタプル
+    :rtype: str
+    """
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    """
+    増加のみのカウンター（ラベルの組み合わせごとに集計）
+    """
+    def __init__(self, name, help_text, labelnames=()):
+        """
+        カウンターの初期化
+
+        :param str name: メトリクス名（接頭辞なし）
+        :param str help_text: 説明
+        :param labelnames: ラベル名のタプル
+        """
+        self.name = METRICS_PREFIX + name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """
+        カウンターを加算
+
+        :param amount: 加算する値
+        :param labels: ラベルの値
+        """
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        """
+        Prometheusのテキスト形式に変換
+
+        :rtype: list[str]
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    値の分布（ラベルの組み合わせごとに、区切りごとの件数・合計・件数を集計）
+    """
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        ヒストグラムの初期化
+
+        :param str name: メトリクス名（接頭辞なし）
+        :param str help_text: 説明
+        :param labelnames: ラベル名のタプル
+        :param buckets: 区切りの値（昇順）
+        """
+        self.name = METRICS_PREFIX + name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # ラベル → [区切りごとの件数, 合計, 件数]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        値を記録
+
+        :param float value: 記録する値
+        :param labels: ラベルの値
+        """
+        key = tuple((name, labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        """
+        Prometheusのテキスト形式に変換（区切りごとの件数は累積）
+
+        :rtype: list[str]
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    メトリクスの一覧\n
+    集計するメトリクス（Counter・Histogram）と、取得時に値を読み取る関数（コレクター）を保持します。
+    """
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        """
+        カウンターを作成して登録
+
+        :rtype: Counter
+        """
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        ヒストグラムを作成して登録
+
+        :rtype: Histogram
+        """
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """
+        取得時に値を読み取る関数を登録
+
+        :param collector: (メトリクス名（接頭辞なし）, 種類（"counter"・"gauge"）, 説明, [(ラベルの辞書, 値)])のリストを返す関数
+        """
+        self.collectors.append(collector)
+
+    def render(self):
+        """
+        すべてのメトリクスをPrometheusのテキスト形式に変換
+
+        :rtype: str
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                logger.warning(f"メトリクスを取得できません: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                name = METRICS_PREFIX + name
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# アプリ全体のメトリクス
+registry = Registry()
+JOBS = registry.counter("jobs_total", "処理を終えた印刷ジョブ数", ("state",))
+BYTES_SENT = registry.counter("bytes_sent_total", "プリンタへ送信したバイト数", ("printer",))
+JOB_SECONDS = registry.histogram("job_seconds", "印刷ジョブの投入から完了までの時間（秒）", ("state",))
+STAGE_SECONDS = registry.histogram("stage_seconds", "段階ごとの処理時間（秒）", ("kind", "stage"))
+PREVIEWS = registry.counter("previews_total", "プレビューの更新回数")
+
+
+def observe_timing(record):
+    """
+    処理時間の計測結果をメトリクスに反映（timingの通知先）
+
+    :param timing.TimingRecord record: 計測結果
+    """
+    for name, seconds, _ in record.stages:
+        if seconds > 0:  # 所要時間のない出来事（キャッシュヒットなど）はキャッシュの統計で集計
+            STAGE_SECONDS.observe(seconds, kind=record.kind, stage=name)
+    if record.kind == "preview":
+        PREVIEWS.inc()
+    elif record.kind == "print" and "state" in record.fields:
+        state = record.fields["state"]
+        JOBS.inc(state=state)
+        JOB_SECONDS.observe(record.seconds, state=state)
+        if state == "done" and record.fields.get("bytes"):
+            BYTES_SENT.inc(record.fields["bytes"], printer=record.fields.get("printer", ""))
+
+
+def _merge_samples(samples, combine=sum):
+    """
+    同じラベルの値をまとめる（同じプリンタの接続・プールのメンバーが複数ある場合に系列が重複しないように）
+
+    :param samples: (ラベル, 値)のリスト
+    :param combine: 同じラベルの値のリストをまとめる関数（カウンターは合計、状態はmaxなど）
+    :return: (ラベル, 値)のリスト（最初に現れた順）
+    :rtype: list[tuple]
+    """
+    grouped = {}
+    for labels, value in samples:
+        grouped.setdefault(tuple(sorted(labels.items())), []).append(value)
+    return [(dict(key), combine(values)) for key, values in grouped.items()]
+
+
+def app_collector(print_queue, get_pool):
+    """
+    アプリの状態を読み取るコレクターを作成
+
+    :param print_queue: 印刷キュー（print_queue.PrintQueue）
+    :param get_pool: 現在のプリンタプール（printer_pool.PrinterPool、未作成の場合はNone）を返す関数
+    :return: Registry.add_collectorに登録する関数
+    """
+    from printer import PrinterHandler
+
+    def collect():
+        families = [("queue_jobs", "gauge", "未完了の印刷ジョブ数（印刷中を含む）", [({}, print_queue.waiting_count)])]
+        pool = get_pool()
+        if pool is not None:
+            members = pool.members
+            families += [
+                ("printer_queue_depth", "gauge", "プリンタごとの割り当て済みで未完了のジョブ数",
+                 _merge_samples([({"printer": m.name}, m.depth) for m in members])),
+                ("printer_healthy", "gauge", "プリンタが振り分け対象かどうか（1=正常）",
+                 _merge_samples([({"printer": m.name}, int(m.healthy)) for m in members], max)),
+                ("printer_errors_total", "counter", "プリンタごとの送信の失敗数",
+                 _merge_samples([({"printer": m.name}, m.jobs_failed) for m in members])),
+            ]
+        # 共有接続はプリンタオブジェクトごとに作成され、同じプリンタに複数ある場合があるため、プリンタごとに合計
+        connections = connection.shared_connections()
+        families += [
+            ("printer_connects_total", "counter", "プリンタへの接続回数（再接続を含む）",
+             _merge_samples([({"printer": f"{c.tm_print.host}:{c.tm_print.port}"}, c.connects) for c in connections])),
+            ("printer_connection_reuses_total", "counter", "保持していた接続を使い回した回数",
+             _merge_samples([({"printer": f"{c.tm_print.host}:{c.tm_print.port}"}, c.reuses) for c in connections])),
+        ]
+        glyph_stats = glyph_cache.shared_cache().stats()
+        families += [
+            ("cache_hits_total", "counter", "キャッシュのヒット数",
+             [({"cache": "glyph"}, glyph_stats["hits"]), ({"cache": "compiled"}, PrinterHandler._compiled_cache_hits)]),
+            ("cache_misses_total", "counter", "キャッシュのミス数",
+             [({"cache": "glyph"}, glyph_stats["misses"]), ({"cache": "compiled"}, PrinterHandler._compiled_cache_misses)]),
+        ]
+        return families
+
+    return collect
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    /metrics へのリクエストにメトリクスを返すハンドラー
+    """
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"メトリクス: {self.address_string()} {format % args}")
+
+
+class MetricsExporter:
+    """
+    メトリクスの公開（localhostのHTTP・ファイルへの定期的な書き出し）
+    """
+    def __init__(self, port=0, file_path=None, interval=METRICS_FILE_INTERVAL):
+        """
+        メトリクスの公開の初期化
+
+        :param int port: HTTPで公開するポート番号（0の場合は公開しない）
+        :param file_path: 書き出し先のファイル（Noneの場合は書き出さない）
+        :param interval: ファイルに書き出す間隔（秒）
+        """
+        self.port = port
+        self.file_path = Path(file_path) if file_path else None
+        self.interval = interval
+        self.server = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        """
+        公開を開始（処理時間の計測結果の集計も開始）
+
+        :return: self
+        :rtype: MetricsExporter
+        """
+        timing.add_listener(observe_timing)
+        if self.port:
+            self.server = ThreadingHTTPServer((METRICS_HOST, self.port), _MetricsRequestHandler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info(f"メトリクス: http://{METRICS_HOST}:{self.server.server_address[1]}/metrics で公開します")
+        if self.file_path is not None:
+            threading.Thread(target=self._run_file_writer, name="metrics-file", daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        公開を停止（ファイルに書き出す場合は最後に1回書き出す）
+        """
+        self._stop_event.set()
+        timing.remove_listener(observe_timing)
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.file_path is not None:
+            self.write_file()
+
+    def write_file(self):
+        """
+        メトリクスをファイルに書き出し（書き込み途中の内容を読まれないよう一時ファイルから置き換え）
+        """
+        try:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.file_path.with_name(self.file_path.name + ".tmp")
+            tmp_path.write_text(registry.render(), encoding="utf-8")
+            os.replace(tmp_path, self.file_path)
+        except OSError as e:
+            logger.warning(f"メトリクスを書き出せません: {e}")
+
+    def _run_file_writer(self):
+        """
+        書き出しスレッド：一定間隔でファイルに書き出し
+        """
+        while not self._stop_event.wait(self.interval):
+            self.write_file()
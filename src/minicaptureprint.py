@@ -0,0 +1,260 @@
+from pathlib import Path
+import sys
+import time
+import logging
+import argparse
+
+"""
+MiniCapturePrint コマンドライン版
+GUI（tkinter・tkinterdnd2・pystray・keyboard）を読み込まずに、タグ記法のテキスト・画像を印刷します。
+
+使い方:
+    python -m minicaptureprint print receipt.txt logo.png --cut
+    echo "<ALIGN:CENTER>ありがとうございました" | python -m minicaptureprint print -
+    python -m minicaptureprint batch templates/label.json rows.csv
+    python -m minicaptureprint print receipt.txt --export receipt.escpos
+    python -m minicaptureprint replay exported/ --printer 192.168.10.21 --printer 192.168.10.22:9100
+"""
+
+# srcディレクトリのパス
+SRC_DIR = Path(__file__).resolve().parent
+# 画像として扱う拡張子
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+# ディザリング方式の指定とGUIの設定値の対応
+DITHER_MODES = {"dither": 1, "threshold": 2, "hybrid": 3}
+
+logger = logging.getLogger("minicaptureprint")
+
+
+def load_settings(args):
+    """
+    設定ファイルを読み込み、プリンタの設定を作成
+
+    :param args: コマンドライン引数
+    :return: (アプリの設定, TM88IVクラス用設定)
+    :rtype: tuple[dict, dict]
+    """
+    from config import ConfigHandler, build_tm88iv_config, missing_files
+    import glyph_cache
+
+    config = ConfigHandler(args.config, on_error=lambda message: logger.error(message)).config
+    tm88iv_config = build_tm88iv_config(config, SRC_DIR)
+    tm88iv_config.pop("icon_file", None)  # GUI用のファイルは不要
+    missing = missing_files(tm88iv_config)
+    if missing:
+        raise FileNotFoundError(f"必要なファイルが見つかりません: {', '.join(str(path) for path in missing)}")
+
+    # グリフキャッシュの設定（GUIと同じキャッシュファイルを共有）
+    glyph_cache_file = SRC_DIR / "../cache/glyph_cache.pkl" if config.get("glyph_cache_persist_enabled", True) else None
+    glyph_cache.configure(max_bytes=int(config.get("glyph_cache_max_mb", 8)) * 1024 * 1024, cache_file=glyph_cache_file)
+    return config, tm88iv_config
+
+
+def create_handler(args, config, tm88iv_config, require_ip=True):
+    """
+    プリンタを準備
+
+    :param args: コマンドライン引数
+    :param dict config: アプリの設定
+    :param dict tm88iv_config: TM88IVクラス用設定
+    :param bool require_ip: IPアドレスの設定を必須にするかどうか（ファイルに書き出す場合は不要）
+    :rtype: PrinterHandler
+    """
+    from printer import PrinterHandler
+
+    printer_ip = args.ip or config.get("printer_ip", "")
+    if not printer_ip and require_ip:
+        raise ValueError("プリンターのIPアドレスが設定されていません（--ip で指定できます）")
+    return PrinterHandler(ip_address=printer_ip, media_width=config.get("image_max_width", 512), config=tm88iv_config,
+                          render_mode=args.render_mode or config.get("text_render_mode", "native"),
+                          port=config.get("printer_port", 9100), idle_timeout=0,  # 1回の実行で終わるため接続は保持しない
+                          store_logos=require_ip)  # ファイルに書き出す場合、ロゴは送信先のプリンタの登録状況が分からないため画像で出力
+
+
+def command_print(args):
+    """
+    printサブコマンド: テキスト・画像を印刷
+
+    :param args: コマンドライン引数
+    :return: 終了コード
+    :rtype: int
+    """
+    from PIL import Image
+    import display_width
+    import glyph_cache
+    from document import blocks_from_text
+    from image_pipeline import process_image
+    from printer import TextTagParser
+
+    texts = list(args.text or [])
+    images = []
+    for source in args.inputs:
+        if source == "-":
+            texts.append(sys.stdin.read())
+        elif Path(source).suffix.lower() in IMAGE_SUFFIXES:
+            images.append(source)
+        else:
+            texts.append(Path(source).read_text(encoding="utf-8"))
+    if not texts and not images:
+        logger.error("印刷するテキスト・画像がありません")
+        return 2
+
+    config, tm88iv_config = load_settings(args)
+    handler = create_handler(args, config, tm88iv_config, require_ip=args.export is None)
+    try:
+        parts = []
+        logos = ()
+        if texts:
+            # タグ記法のテキストはGUIと同じタグ解析を経由
+            parser = TextTagParser(blocks=blocks_from_text("\n".join(text.rstrip("\n") for text in texts)))
+            commands = parser.parse()
+            for lineno, line_width in parser.overflow_lines:
+                logger.warning(f"{lineno}行目の印字幅が{display_width.PRINTER_LINE_COLUMNS}桁を超えています（{line_width}桁）")
+            parts.append(handler.compile(commands, enable_text_print=True))
+            logos = handler.logo_names(commands)
+        for image_path in images:
+            with Image.open(image_path) as image:
+                processed = process_image(image, max_width=int(config.get("image_max_width", 512)),
+                                          auto_enlarge=args.enlarge, contrast=args.contrast, invert=args.invert,
+                                          brightness=args.brightness, dither_mode=DITHER_MODES[args.dither])
+            parts.append(handler.compile([], processed, enable_image_print=True))
+        data = b"".join(parts)
+        if not data:
+            logger.error("印刷データがありません")
+            return 1
+        if args.cut:
+            data += handler.cut_command()
+        if args.export is not None:
+            handler.export(data, args.export)
+            logger.info(f"書き出しました: {args.export} {len(data)}バイト")
+            return 0
+        handler.send(data, logos)
+        logger.info(f"印刷しました: {len(data)}バイト")
+        return 0
+    finally:
+        glyph_cache.shared_cache().save()
+
+
+def command_batch(args):
+    """
+    batchサブコマンド: テンプレートにCSV/JSONLの各行を差し込んで印刷
+
+    :param args: コマンドライン引数
+    :return: 終了コード（失敗した行がある場合は1）
+    :rtype: int
+    """
+    import glyph_cache
+    import template
+    from batch import BatchPrintJob
+
+    config, tm88iv_config = load_settings(args)
+    handler = create_handler(args, config, tm88iv_config)
+    try:
+        compiled = template.compile_template(handler, template.load_template(args.template), name=Path(args.template).stem,
+                                             should_cut_paper=args.cut)
+        progress = BatchPrintJob(handler, compiled, args.source,
+                                 progress_callback=lambda p: logger.info(p.summary())).run()
+    finally:
+        glyph_cache.shared_cache().save()
+    for row_number, message in progress.failures:
+        print(f"{row_number}\t{message}", file=sys.stderr)
+    print(progress.summary())
+    return 1 if progress.failed else 0
+
+
+def command_replay(args):
+    """
+    replayサブコマンド: 書き出した印刷データをプリンタへ送信
+
+    :param args: コマンドライン引数
+    :return: 終了コード（送信できなかったファイルがある場合は1）
+    :rtype: int
+    """
+    from config import ConfigHandler
+    from printer_pool import parse_endpoints, pool_endpoints
+    import replay
+
+    files = replay.collect_files(args.inputs)
+    if not files:
+        logger.error("送信するファイルがありません")
+        return 2
+    if args.printer:
+        endpoints = parse_endpoints(",".join(args.printer))
+    elif args.ip:
+        endpoints = parse_endpoints(args.ip)
+    else:
+        endpoints = pool_endpoints(ConfigHandler(args.config, on_error=lambda message: logger.error(message)).config)
+    if not all(endpoint["ip"] for endpoint in endpoints):
+        raise ValueError("プリンターのIPアドレスが設定されていません（--printer で指定できます）")
+
+    results, elapsed = replay.replay(files, replay.open_connections(endpoints),
+                                     on_file=lambda path, result, stats: logger.info(f"{result.name}: {path.name} {stats.summary()}"))
+    for result in results:
+        print(result.summary())
+        for path, error in result.failures:
+            print(f"{path}\t{error}", file=sys.stderr)
+    total_bytes = sum(result.bytes for result in results)
+    total_files = sum(result.files for result in results)
+    print(f"合計: {total_files}/{len(files)}件 {total_bytes:,}バイト {elapsed:.2f}秒 "
+          f"{total_bytes / elapsed / 1024 if elapsed else 0:.0f}KB/s")
+    return 1 if any(result.failures for result in results) else 0
+
+
+def main(argv=None):
+    """
+    コマンドラインのエントリーポイント
+
+    :param argv: コマンドライン引数（省略時はsys.argv）
+    :return: 終了コード
+    :rtype: int
+    """
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(prog="minicaptureprint", description="MiniCapturePrint コマンドライン版")
+    parser.add_argument("--config", type=Path, default=SRC_DIR / "../config/config.json", help="設定ファイル")
+    parser.add_argument("--ip", help="プリンタのIPアドレス（省略時は設定ファイルの値）")
+    parser.add_argument("--render-mode", choices=("native", "raster"), help="テキストの印字方式（省略時は設定ファイルの値）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="詳細なログを表示")
+    parser.add_argument("--timing", action="store_true", help="段階ごとの処理時間をcache/timing.jsonlに記録")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    print_parser = subparsers.add_parser("print", help="テキスト・画像を印刷")
+    print_parser.add_argument("inputs", nargs="*", help="タグ記法のテキストファイル・画像ファイル（- で標準入力）")
+    print_parser.add_argument("-t", "--text", action="append", help="タグ記法のテキスト（複数指定可）")
+    print_parser.add_argument("--cut", action="store_true", help="印刷後に用紙をカット")
+    print_parser.add_argument("--dither", choices=tuple(DITHER_MODES), default="dither", help="画像の2値化方式")
+    print_parser.add_argument("--brightness", type=float, default=1.0, help="画像の明るさ（1.0で変更なし）")
+    print_parser.add_argument("--contrast", action="store_true", help="画像のコントラスト強調")
+    print_parser.add_argument("--invert", action="store_true", help="画像の反転")
+    print_parser.add_argument("--enlarge", action="store_true", help="小さい画像を印字幅まで拡大")
+    print_parser.add_argument("--export", type=Path, help="印刷せずに印刷データをファイル（.escpos）に書き出し")
+    print_parser.set_defaults(handler=command_print)
+
+    batch_parser = subparsers.add_parser("batch", help="テンプレートにCSV/JSONLの各行を差し込んで印刷")
+    batch_parser.add_argument("template", help="テンプレート（文書ファイル）")
+    batch_parser.add_argument("source", help="データファイル（CSV / JSONL）")
+    batch_parser.add_argument("--cut", action="store_true", help="1件ごとに用紙をカット")
+    batch_parser.set_defaults(handler=command_batch)
+
+    replay_parser = subparsers.add_parser("replay", help="書き出した印刷データ（.escpos）をプリンタへ送信")
+    replay_parser.add_argument("inputs", nargs="+", help="印刷データのファイル・フォルダ（フォルダの場合は中の.escposファイル）")
+    replay_parser.add_argument("--printer", action="append", help="送信先（IPアドレス:ポート、複数指定時は振り分け、省略時は設定ファイルのプリンタプール）")
+    replay_parser.set_defaults(handler=command_replay)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(levelname)s: %(message)s")
+    logger.setLevel(logging.INFO)  # 処理結果は常に表示
+    import timing
+    timing.configure(args.timing)
+    try:
+        with timing.measure(args.command, source="cli"):
+            return args.handler(args)
+    except Exception as e:
+        logger.error(e)
+        return 1
+    finally:
+        if args.verbose:
+            logger.info(f"処理時間: {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,448 @@
+import time
+import queue
+import logging
+import itertools
+import threading
+
+from escpos.exceptions import Error as EscposError
+
+import display_width
+import glyph_cache
+import timing
+from printer import TextTagParser
+from spool import retry_delay
+
+# 送信待ちにできるコンパイル済みジョブの数（プリンタごと、これを超えると次のジョブのコンパイルを待たせる）
+PIPELINE_DEPTH = 2
+
+# ジョブの状態
+JOB_WAITING = "waiting"  # 待機中
+JOB_PRINTING = "printing"  # 印刷中
+JOB_DONE = "done"  # 完了
+JOB_CANCELLED = "cancelled"  # 中止
+JOB_FAILED = "failed"  # 失敗
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+# ジョブ番号の採番
+_job_numbers = itertools.count(1)
+
+
+class PrintJob:
+    """
+    印刷ジョブ\n
+    投入時の画面の状態（タグブロック・画像・印刷設定）を保持し、投入後に画面を編集しても印刷内容は変わりません。
+    """
+    def __init__(self, blocks=None, image=None, enable_text_print=False, enable_image_print=False, should_cut_paper=False, data=None):
+        """
+        印刷ジョブの初期化
+
+        :param blocks: 行ごとの(文字列, タグ)のリスト
+        :param image: 印刷する画像（Pillow Imageオブジェクト）
+        :param enable_text_print: テキスト印刷を有効にするかどうか
+        :param enable_image_print: 画像印刷を有効にするかどうか
+        :param should_cut_paper: 印刷後に用紙をカットするかどうか
+        :param bytes data: コンパイル済みの印刷データ（スプールから再開する場合、指定時は解析・コンパイルを省略）
+        """
+        self.number = next(_job_numbers)
+        self.blocks = blocks
+        self.image = image
+        self.enable_text_print = enable_text_print
+        self.enable_image_print = enable_image_print
+        self.should_cut_paper = should_cut_paper
+        self.state = JOB_WAITING
+        self.sent_bytes = 0
+        self.total_bytes = 0
+        self.error = None
+        self.cancel_event = threading.Event()
+        self.pool = None  # 投入先のプリンタプール
+        self.member = None  # 割り当てたプリンタ
+        self.tried = []  # 送信に失敗したプリンタ
+        self.data = data
+        self.logos = ()  # 印刷データで使うロゴ名（送信先のプリンタごとに送信前に登録）
+        self.spool_entry = None  # スプールに保存したジョブ（spool.SpoolEntry）
+        self.retry_at = None  # 再送の予定時刻（time.monotonic()の値、再送待ちでない場合はNone）
+        self.timing = timing.begin("print", job=self.number)  # 段階ごとの処理時間（計測が無効な場合はNone）
+        self.submitted_at = None  # 投入した時刻（time.monotonic()の値）
+        self.render_started = None  # 作業スレッドで最初に処理を始めた時刻（再送・別のプリンタでの送信では更新しない）
+
+    @property
+    def ratio(self):
+        """
+        送信の進捗率（0.0～1.0）
+
+        :rtype: float
+        """
+        return self.sent_bytes / self.total_bytes if self.total_bytes else 0.0
+
+    @property
+    def finished(self):
+        """
+        処理が終わったかどうか（完了・中止・失敗）
+
+        :rtype: bool
+        """
+        return self.state in (JOB_DONE, JOB_CANCELLED, JOB_FAILED)
+
+    def cancel(self):
+        """
+        ジョブを中止（待機中の場合は印刷せず、印刷中の場合は送信を止めてプリンタを初期化）
+        """
+        self.cancel_event.set()
+
+
+class PrintQueue:
+    """
+    印刷キュー\n
+    ジョブをプリンタプールのいずれかのプリンタに割り当て、プリンタごとの作業スレッドで投入順に解析・コンパイル・送信します。
+    作業スレッドはプリンタごとに準備（解析・コンパイル）と送信の2つに分かれ、送信中に次のジョブの準備を進めます。
+    準備済みで送信待ちのジョブはPIPELINE_DEPTH件までに抑え、送信が詰まった場合は準備を待たせてメモリの使用量を抑えます。
+    送信に失敗したジョブは別のプリンタに割り当て直し、状態が変わるたびに通知します。
+    スプールを指定した場合は、コンパイル済みの印刷データを送信前に保存し、どのプリンタにも送れなかったジョブは待ち時間を延ばしながら再送します。
+    """
+    def __init__(self, on_update=None, spool=None):
+        """
+        印刷キューの初期化
+
+        :param on_update: 状態の通知先（PrintJobを引数に呼び出し、作業スレッドから呼ばれる）
+        :param spool: 印刷データの保存先（spool.PrintSpool、Noneの場合は保存・再送しない）
+        """
+        self.on_update = on_update
+        self.spool = spool
+        self.pending = []  # 未完了のジョブ（投入順）
+        self.pending_lock = threading.Lock()
+        self.retry_timers = {}  # 再送待ちのジョブとタイマー
+        self.stopping = False
+        self.resumed = False
+
+    def submit(self, job, pool):
+        """
+        ジョブを投入
+
+        :param PrintJob job: 印刷ジョブ
+        :param pool: 印刷先のプリンタプール（PrinterPool）
+        :return: 投入したジョブ
+        :rtype: PrintJob
+        """
+        job.submitted_at = time.monotonic()
+        with self.pending_lock:
+            self.pending.append(job)
+        job.pool = pool
+        self._dispatch(job, pool.choose())
+        return job
+
+    def resume(self, pool):
+        """
+        スプールに残っている未送信のジョブを保存順に投入（最初の1回のみ、新しいジョブより先に呼び出し）
+
+        :param pool: 印刷先のプリンタプール（PrinterPool）
+        :return: 投入したジョブ
+        :rtype: list[PrintJob]
+        """
+        if self.spool is None or self.resumed:
+            return []
+        self.resumed = True
+        jobs = []
+        for entry in self.spool.pending():
+            try:
+                job = PrintJob(data=entry.load())
+            except OSError as e:
+                logger.warning(f"スプールのジョブを読み込めません: {entry.entry_id}: {e}")
+                continue
+            job.spool_entry = entry
+            job.logos = tuple(entry.metadata.get("logos", ()))
+            logger.info(f"印刷ジョブ{job.number}: 前回送信できなかったジョブを再開します ({len(job.data)}バイト)")
+            jobs.append(self.submit(job, pool))
+        return jobs
+
+    def cancel_all(self):
+        """
+        未完了のすべてのジョブを中止
+        """
+        with self.pending_lock:
+            for job in self.pending:
+                job.cancel()
+        self.retry_now()
+
+    def retry_now(self):
+        """
+        再送待ちのジョブを待ち時間を切り上げて再送（プリンタが復帰したとき・中止したとき）
+        """
+        with self.pending_lock:
+            jobs = list(self.retry_timers)
+            for job in jobs:
+                self.retry_timers.pop(job).cancel()
+        for job in jobs:
+            self._retry(job)
+
+    def stop(self):
+        """
+        アプリの終了時に印刷を止める（中止したジョブはスプールに残し、次回の起動時に最初から印刷）
+        """
+        self.stopping = True
+        self.cancel_all()
+
+    @property
+    def waiting_count(self):
+        """
+        未完了のジョブ数（印刷中のジョブを含む）
+
+        :rtype: int
+        """
+        with self.pending_lock:
+            return len(self.pending)
+
+    def _dispatch(self, job, member):
+        """
+        ジョブをプリンタの待ち行列に入れる（作業スレッドはプリンタごとに初回に開始）
+
+        :param PrintJob job: 印刷ジョブ
+        :param member: 割り当てたプリンタ（PoolMember）
+        """
+        job.member = member
+        job.state = JOB_WAITING
+        with self.pending_lock:
+            if member.worker is None:
+                member.rendered = queue.Queue(maxsize=PIPELINE_DEPTH)
+                member.worker = threading.Thread(target=self._run_render, args=(member,), name=f"print-render-{member.name}", daemon=True)
+                member.sender = threading.Thread(target=self._run_transmit, args=(member,), name=f"print-send-{member.name}", daemon=True)
+                member.worker.start()
+                member.sender.start()
+        member.jobs.put(job)
+        self._notify(job)
+
+    def _run_render(self, member):
+        """
+        準備スレッド：プリンタに割り当てたジョブを順番に解析・コンパイルし、送信スレッドへ渡す
+
+        :param member: プリンタ（PoolMember）
+        """
+        while True:
+            job = member.jobs.get()
+            try:
+                with timing.activate(job.timing):
+                    ready = self._render(job, member)
+            except Exception as e:
+                job.state = JOB_FAILED
+                job.error = e
+                logger.error(f"印刷ジョブ{job.number}: {e}")
+                ready = False
+            if ready:
+                member.rendered.put(job)  # 送信待ちが上限に達している場合は空くまで待つ
+            else:
+                self._finish(job, member)
+
+    def _run_transmit(self, member):
+        """
+        送信スレッド：準備済みのジョブを順番に送信（失敗した場合は別のプリンタに割り当て直すか、再送を予約）
+
+        :param member: プリンタ（PoolMember）
+        """
+        while True:
+            job = member.rendered.get()
+            retry_member = None
+            scheduled = False
+            try:
+                with timing.activate(job.timing):
+                    self._transmit(job, member)
+            except (OSError, EscposError) as e:
+                member.record_failure(e)
+                job.tried.append(member)
+                # 別のプリンタに割り当て直す（中止された場合・他にプリンタがない場合は失敗）
+                retry_member = None if job.cancel_event.is_set() else job.pool.choose(exclude=job.tried)
+                if retry_member is not None:
+                    logger.warning(f"印刷ジョブ{job.number}: {member.name}で失敗したため{retry_member.name}で印刷します")
+                elif job.spool_entry is not None and not job.cancel_event.is_set():
+                    # スプールに保存済みのジョブは、時間をおいて全プリンタで再送
+                    job.error = e
+                    scheduled = self._schedule_retry(job)
+                else:
+                    job.state = JOB_FAILED
+                    job.error = e
+                    logger.error(f"印刷ジョブ{job.number}: {e}")
+            except Exception as e:
+                job.state = JOB_FAILED
+                job.error = e
+                logger.error(f"印刷ジョブ{job.number}: {e}")
+            if retry_member is not None:
+                job.pool.release(member)
+                job.sent_bytes = 0
+                self._dispatch(job, retry_member)
+            elif scheduled:
+                job.pool.release(member)
+                self._notify(job)
+            else:
+                self._finish(job, member)
+
+    def _finish(self, job, member):
+        """
+        処理を終えた（完了・中止・失敗）ジョブを片付けて通知
+
+        :param PrintJob job: 印刷ジョブ
+        :param member: 割り当てたプリンタ（PoolMember）
+        """
+        job.pool.release(member)
+        self._finish_spool(job)
+        with self.pending_lock:
+            self.pending.remove(job)
+        timing.finish(job.timing, state=job.state, printer=member.name, bytes=len(job.data or b""))
+        self._notify(job)
+        glyph_cache.shared_cache().save()
+
+    def _schedule_retry(self, job):
+        """
+        スプールのジョブの再送を予約（失敗回数に応じて待ち時間を延長）
+
+        :param PrintJob job: 印刷ジョブ
+        :return: 予約したかどうか（アプリの終了中は予約しない）
+        :rtype: bool
+        """
+        self.spool.record_failure(job.spool_entry, job.error)
+        delay = retry_delay(job.spool_entry.attempts)
+        with self.pending_lock:
+            if self.stopping:
+                job.state = JOB_FAILED
+                return False
+            job.state = JOB_WAITING
+            job.sent_bytes = 0
+            job.retry_at = time.monotonic() + delay
+            timer = threading.Timer(delay, self._on_retry_timer, args=(job,))
+            timer.daemon = True
+            self.retry_timers[job] = timer
+            timer.start()
+        logger.warning(f"印刷ジョブ{job.number}: 送信できないため{delay:.0f}秒後に再送します: {job.error}")
+        return True
+
+    def _on_retry_timer(self, job):
+        """
+        再送の予定時刻になったときの処理（タイマースレッドから呼ばれる）
+
+        :param PrintJob job: 印刷ジョブ
+        """
+        with self.pending_lock:
+            if self.retry_timers.pop(job, None) is None:
+                return  # retry_nowで再送済み
+        self._retry(job)
+
+    def _retry(self, job):
+        """
+        再送待ちのジョブをプリンタに割り当て直す
+
+        :param PrintJob job: 印刷ジョブ
+        """
+        job.tried = []
+        job.retry_at = None
+        self._dispatch(job, job.pool.choose())
+
+    def _finish_spool(self, job):
+        """
+        処理を終えたジョブをスプールから削除（アプリの終了で中止したジョブは次回再開するため残す）
+
+        :param PrintJob job: 印刷ジョブ
+        """
+        if job.spool_entry is None or (self.stopping and job.state != JOB_DONE):
+            return
+        if job.state == JOB_FAILED:
+            logger.warning(f"印刷ジョブ{job.number}: 印刷できないためスプールから削除します")
+        self.spool.remove(job.spool_entry)
+
+    def _render(self, job, member):
+        """
+        ジョブを送信できる状態にする（解析・コンパイル・スプールへの保存）
+
+        :param PrintJob job: 印刷ジョブ
+        :param member: 割り当てたプリンタ（PoolMember）
+        :return: 送信するかどうか（中止した場合・印刷データがない場合はFalse）
+        :rtype: bool
+        """
+        if job.cancel_event.is_set():
+            job.state = JOB_CANCELLED
+            return False
+        job.state = JOB_PRINTING
+        self._notify(job)
+        if job.render_started is None:
+            job.render_started = time.monotonic()
+            if job.timing is not None:
+                # 投入から作業スレッドが処理を始めるまでの待ち時間（最初の1回のみ）
+                job.timing.add("queue_wait", job.render_started - (job.submitted_at or job.timing.started))
+
+        if job.data is None:
+            # タグ解析（投入時のタグブロックから）
+            parser = TextTagParser(blocks=job.blocks)
+            commands = parser.parse()
+            for lineno, line_width in parser.overflow_lines:
+                logger.warning(f"{lineno}行目の印字幅が{display_width.PRINTER_LINE_COLUMNS}桁を超えています（{line_width}桁、用紙上で折り返されます）")
+            job.logos = member.handler.logo_names(commands)
+            # 印刷データをコンパイル（再送時はコンパイル済みのデータを使用）
+            job.data = member.handler.compile(commands, job.image, job.enable_text_print, job.enable_image_print, job.should_cut_paper)
+        if not job.data:
+            logger.debug(f"印刷ジョブ{job.number}: 印刷データがありません")
+            job.state = JOB_DONE
+            return False
+        if job.cancel_event.is_set():
+            job.state = JOB_CANCELLED
+            return False
+        if self.spool is not None and job.spool_entry is None:
+            # 送信前にスプールへ保存（保存できない場合も印刷は続行）
+            try:
+                job.spool_entry = self.spool.add(job.data, job_number=job.number, logos=list(job.logos))
+            except OSError as e:
+                logger.warning(f"印刷ジョブ{job.number}: スプールに保存できません: {e}")
+        return True
+
+    def _transmit(self, job, member):
+        """
+        準備済みのジョブを送信
+
+        :param PrintJob job: 印刷ジョブ
+        :param member: 割り当てたプリンタ（PoolMember）
+        """
+        if job.cancel_event.is_set():
+            job.state = JOB_CANCELLED
+            return
+        data = job.data
+        job.total_bytes = len(data)
+
+        def on_progress(sent, total):
+            job.sent_bytes = sent
+            self._notify(job)
+
+        started = time.perf_counter()
+        try:
+            # ロゴは印刷データを作ったプリンタではなく、送信先のプリンタに登録（別のプリンタへの再送・スプールからの再開を含む）
+            member.handler.prepare_logos(job.logos)
+            completed = member.handler.connection.send(data, progress_callback=on_progress, cancel_event=job.cancel_event)
+        except (OSError, EscposError):
+            # 送信途中で失敗した接続は使い回さない（次の送信時に接続し直す）
+            member.handler.connection.close()
+            raise
+        if completed:
+            member.record_success(len(data), time.perf_counter() - started)
+            job.state = JOB_DONE
+            return
+        # 送信途中で中止した場合は、途中までのコマンドの続きとして後のデータが解釈されないようプリンタを初期化
+        job.state = JOB_CANCELLED
+        self._reset_quietly(job, member)
+
+    @staticmethod
+    def _reset_quietly(job, member):
+        """
+        プリンタを初期化（初期化できない場合はログのみ）
+
+        :param PrintJob job: 印刷ジョブ
+        :param member: プリンタ（PoolMember）
+        """
+        try:
+            member.handler.connection.reset()
+        except (OSError, EscposError) as e:
+            logger.warning(f"印刷ジョブ{job.number}: {member.name}を初期化できません: {e}")
+
+    def _notify(self, job):
+        """
+        状態を通知
+
+        :param PrintJob job: 印刷ジョブ
+        """
+        if self.on_update is not None:
+            self.on_update(job)
@@ -1,28 +1,106 @@
+from collections import OrderedDict
+from contextlib import contextmanager
 import re
+import os
+import time
+import hashlib
 import logging
+import threading
 from tm88iv.tm88iv import TM88IV
+import connection
+import display_width
+import glyph_cache
+import font_index
+import font_manager
+import logo_registry
+import timing
+from raster_renderer import ReceiptRasterizer
+
+# コンパイル済み印刷データのキャッシュ上限（バイト）
+COMPILED_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
 
 class PrinterHandler:
     """
     プリンタを操作するクラス
     """
-    def __init__(self, ip_address, media_width=512, config=None):
+    # コンパイル済み印刷データのキャッシュ（全インスタンスで共有）
+    _compiled_cache = OrderedDict()
+    _compiled_cache_bytes = 0
+    _compiled_cache_hits = 0
+    _compiled_cache_misses = 0
+    _compiled_cache_lock = threading.Lock()
+    # プリンタオブジェクトの共有（プリンタ・フォント構成ごと）
+    _printer_instances = {}
+    _printer_instances_lock = threading.Lock()
+    # プリンタオブジェクトへの出力の取り込み（_rawの差し替え）を複数スレッドで同時に行わないためのロック
+    _output_lock = threading.RLock()
+
+    def __init__(self, ip_address, media_width=512, config=None, render_mode="native", port=9100, idle_timeout=connection.CONNECTION_IDLE_TIMEOUT,
+                 store_logos=True):
         """
         プリンタの初期化
 
         :param ip_address: プリンタのIPアドレス
         :param media_width: メディアの幅（ピクセル単位）
         :param config: 設定オブジェクト（オプション）
+        :param render_mode: テキストの印字方式（"native": 装飾ごとにjptext2で出力、"raster": 文書全体を1枚の画像で出力）
+        :param port: プリンタのポート番号
+        :param idle_timeout: 印刷後に接続を保持する時間（秒、0の場合は印刷ごとに切断）
+        :param store_logos: ロゴをプリンタのNVグラフィックスに登録して印字するかどうか（Falseの場合は画像で印字）
         """
-        # プリンタの初期化
-        self.tm_print = TM88IV(ip_address, config=config) 
-        # プリンタのメディア幅を設定(python-escpos ver3.1にて確認
-        self.tm_print.profile.profile_data['media']['width']['pixels'] = media_width
-
         # ログ設定
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
 
+        started = time.perf_counter()
+        self.media_width = media_width
+        self.config = config
+        self.render_mode = render_mode
+        self.font_fingerprint = self._font_fingerprint(config)
+        # フォントファイルの設定キー（送信用のプリンタオブジェクトには渡さず、描画が必要な文字があるときだけ読み込む）
+        self.font_keys = frozenset(key for key, _ in font_index.font_chain_from_config(config))
+        # プリンタの初期化（同じプリンタ・設定のオブジェクトはプロセス内で共有、フォントは読み込まない）
+        self.tm_print = self._shared_printer(ip_address, int(port), self._printer_config(()), ())
+        # プリンタとの接続（プリンタオブジェクトごとに共有し、印刷のたびに接続し直さない）
+        self.connection = connection.shared_connection(self.tm_print, idle_timeout)
+        # プリンタのメディア幅を設定(python-escpos ver3.1にて確認
+        self.tm_print.profile.profile_data['media']['width']['pixels'] = media_width
+        # フォント収録文字インデックス（描画が必要な文字を収録しているフォントだけを1回の参照で決定）
+        self.font_index = font_index.shared_index(config)
+        # 共有フォント管理（レンダラーはここからImageFontを取得）
+        self.fonts = font_manager.shared_manager()
+        # 一括ラスター印字用
+        self.rasterizer = ReceiptRasterizer(config, media_width=media_width, fonts=self.fonts) if render_mode == "raster" else None
+        # ロゴのNVグラフィックス登録状況（プロセス共有）
+        self.logos = logo_registry.shared_registry()
+        self.store_logos = store_logos
+        self.printer_name = f"{ip_address}:{port}"
+        # 取り込み中の出力先（処理時間の計測でバイト数を数えるため）
+        self._capture_buffer = None
+        self.logger.info(f"印刷準備: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    @classmethod
+    def _shared_printer(cls, ip_address, port, config, font_fingerprint):
+        """
+        プロセス内で共有するプリンタオブジェクトを取得（初回のみ作成）
+
+        :param ip_address: プリンタのIPアドレス
+        :param int port: プリンタのポート番号
+        :param config: TM88IVクラス用設定
+        :param tuple font_fingerprint: フォントファイルの識別情報
+        :return: プリンタオブジェクト
+        :rtype: TM88IV
+        """
+        key = (ip_address, port, font_fingerprint, repr(sorted((str(k), str(v)) for k, v in (config or {}).items())))
+        with cls._printer_instances_lock:
+            tm_print = cls._printer_instances.get(key)
+            if tm_print is None:
+                tm_print = TM88IV(ip_address, config=config)
+                tm_print.port = port
+                cls._printer_instances[key] = tm_print
+            return tm_print
+
     def print_text_with_tags(self, text_widget, image_path=None, enable_text_print=False, enable_image_print=False, should_cut_paper=False):
         """
         タグ付きテキストを印刷します。
@@ -35,87 +113,461 @@ class PrinterHandler:
         """
         # 印刷有効フラグ
         debug_print_enabled = True # デバッグ用の印刷フラグ
-        # 印刷フラグ
-        isprinted = False
         # タグ解析
         parser = TextTagParser(text_widget)
         commands = parser.parse()
+        for lineno, line_width in parser.overflow_lines:
+            self.logger.warning(f"{lineno}行目の印字幅が{display_width.PRINTER_LINE_COLUMNS}桁を超えています（{line_width}桁、用紙上で折り返されます）")
         self.logger.debug(f"=== タグ解析結果 ===")
         self.logger.debug(f"コマンド: {commands}")
 
-        # テキストが含まれているかどうか
-        text_included = False  
-        if any(cmd[0] in ("jp2", "qr", "itf", "ean", "c39", "c128") for cmd in commands):
-            text_included = True
-
         if debug_print_enabled:
             self.logger.debug(f"=== 印刷開始 ===")
             self.logger.debug(f"テキスト印刷: {enable_text_print}, 画像印刷: {enable_image_print}, 用紙カット: {should_cut_paper}")
-            self.logger.debug(f"テキスト含むか: {text_included}")
             self.logger.debug(f"画像パス: {image_path if image_path else 'なし'}")
 
-            # プリンタを開く
-            self.tm_print.open()
+            # 印刷データをコンパイル（未変更ならキャッシュ済みのバイト列を使用）
+            data = self.compile(commands, image_path, enable_text_print, enable_image_print, should_cut_paper)
+            if not data:
+                self.logger.debug("印刷データがありません")
+                return
 
-            if enable_text_print and text_included:
-                for arg_type, arg_command, arg_dict in commands:
-                    self.logger.debug(f"コマンド: {arg_type}, 引数: {arg_command}, オプション: {arg_dict}")
-                    # 絵文字対応日本語出力
-                    if arg_type == "jp2":
-                        self.tm_print.jptext2(arg_command, **arg_dict)
-                        isprinted = True  # 印刷フラグを設定
-                    # バーコード：QRコード
-                    if arg_type == "qr":
-                        self.tm_print.qr(arg_command, native=True)
-                        isprinted = True  # 印刷フラグを設定
-                    # バーコード：ITFコード
-                    if arg_type == "itf":
-                        self.tm_print.barcode(arg_command, bc="ITF", align_ct=False, width=2)
-                        isprinted = True  # 印刷フラグを設定
-                    # バーコード：EANコード
-                    if arg_type == "ean":
-                        self.tm_print.barcode(arg_command, bc="EAN13", align_ct=False, width=2)
-                        isprinted = True  # 印刷フラグを設定
-                    # バーコード：Code39コード
-                    if arg_type == "c39":
-                        self.tm_print.barcode(arg_command, bc="CODE39", align_ct=False, width=2)
-                        isprinted = True  # 印刷フラグを設定
-                    # バーコード：Code128コード
-                    if arg_type == "c128":
-                        # CODE128は(SHIFT or CODE A or CODE B or CODE C)の内、CODE Bを使用
-                        self.tm_print.barcode("{B" + arg_command, bc="CODE128", align_ct=False, function_type="B", width=2)
-                        isprinted = True  # 印刷フラグを設定
-                    # 他のコマンド
-                    if arg_type == "row":
-                        self.tm_print._raw(arg_command)
+            self.send(data, self.logo_names(commands))
+            self.logger.debug("=== 印刷完了 ===")
 
-            if enable_image_print and image_path:
-                self.logger.debug(f"画像を印刷: {image_path}")
-                self.tm_print.image(image_path, center=False)
-                isprinted = True  # 画像印刷フラグを設定
+    def print_template(self, template, values):
+        """
+        コンパイル済みテンプレートに値を差し込んで印刷します。
 
+        :param template: コンパイル済みテンプレート（template.compile_templateの戻り値）
+        :param dict values: 差し込み項目名と値
+        """
+        self.send(template.render(self, values), template.logos)
+
+    def send(self, data, logos=()):
+        """
+        コンパイル済みのバイト列をプリンタへ送信します。\n
+        接続は保持して使い回し、切断されていた場合は自動で接続し直します。
+        ロゴを使う場合は、送信前にこのプリンタのNVグラフィックスへ登録します（登録済みの場合は何もしません）。
+
+        :param bytes data: ESC/POSのバイト列
+        :param logos: 印刷データで使うロゴ名（logo_namesの戻り値）
+        """
+        self.prepare_logos(logos)
+        self.connection.send(data)
+
+    @staticmethod
+    def logo_names(commands):
+        """
+        コマンド列で使うロゴ名を取得します（重複を除いた出現順）。
+
+        :param commands: TextTagParserが返すコマンドのリスト
+        :rtype: tuple[str]
+        """
+        return tuple(dict.fromkeys(arg_command for arg_type, arg_command, _ in commands if arg_type == "logo"))
+
+    def prepare_logos(self, names):
+        """
+        ロゴのうち、このプリンタのNVグラフィックスに未登録・内容が変わったものを登録します。\n
+        印刷データはキーコードで印字するコマンドのみを含むため、送信先のプリンタごとに送信前に呼び出します
+        （別のプリンタへの再送・スプールからの再開を含む）。
+
+        :param names: ロゴ名（logo_namesの戻り値）
+        :raises OSError: 登録できない場合（プリンタに接続できない場合はpython-escposの例外）
+        """
+        if not self.store_logos:
+            return
+        for name in names:
+            logo = self.logos.get(name, self.media_width)
+            if logo is not None:
+                self.logos.ensure_stored(self.connection, self.printer_name, logo)
+
+    def export(self, data, path):
+        """
+        コンパイル済みのバイト列をプリンタへ送信せず、ファイルに書き出します（後でreplayで送信）。\n
+        書き出すのはプリンタへ送信する内容そのもので、書き込み途中のファイルが残らないよう一時ファイルから置き換えます。
+
+        :param bytes data: ESC/POSのバイト列
+        :param path: 書き出し先（拡張子は.escpos）
+        """
+        path = os.fspath(path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.logger.debug(f"印刷データを書き出しました: {path} {len(data)}バイト")
+
+    def compile(self, commands, image_path=None, enable_text_print=False, enable_image_print=False, should_cut_paper=False):
+        """
+        コマンド列と画像をESC/POSのバイト列に変換します（プリンタへは送信しません）。\n
+        同じ内容・設定の場合はキャッシュ済みのバイト列を返却します。
+
+        :param commands: TextTagParserが返すコマンドのリスト
+        :param image_path: 印刷する画像（パスまたはPillow Imageオブジェクト）
+        :param enable_text_print: テキスト印刷を有効にするかどうか
+        :param enable_image_print: 画像印刷を有効にするかどうか
+        :param should_cut_paper: 印刷後に用紙をカットするかどうか
+        :return: ESC/POSのバイト列（印刷するものがない場合は空）
+        :rtype: bytes
+        """
+        key = self._compile_key(commands, image_path, enable_text_print, enable_image_print, should_cut_paper)
+        cls = PrinterHandler
+        with cls._compiled_cache_lock:
+            data = cls._compiled_cache.get(key)
+            if data is not None:
+                cls._compiled_cache.move_to_end(key)
+                cls._compiled_cache_hits += 1
+                timing.mark("compile_cache_hit", nbytes=len(data))
+                self.logger.info(f"印刷データ: キャッシュヒット {len(data)}バイト (ヒット率 {self._compiled_cache_hit_rate():.1%})")
+                return data
+            cls._compiled_cache_misses += 1
+
+        started = time.perf_counter()
+        with self._capture_output() as buffer:
+            isprinted = self._emit_commands(commands, image_path, enable_text_print, enable_image_print)
             if isprinted and should_cut_paper:
                 self.logger.debug("用紙をカットします")
-                self.tm_print.cut()  # カットコマンドを送信
+                with timing.stage("cut", buffer=buffer):
+                    self.tm_print.cut()  # カットコマンドを送信
+        data = bytes(buffer) if isprinted else b""
+        elapsed = time.perf_counter() - started
+
+        with cls._compiled_cache_lock:
+            if key not in cls._compiled_cache and len(data) <= COMPILED_CACHE_MAX_BYTES:
+                cls._compiled_cache[key] = data
+                cls._compiled_cache_bytes += len(data)
+                # 上限を超えた分は古いものから破棄
+                while cls._compiled_cache_bytes > COMPILED_CACHE_MAX_BYTES:
+                    _, evicted = cls._compiled_cache.popitem(last=False)
+                    cls._compiled_cache_bytes -= len(evicted)
+            self.logger.info(f"印刷データ: コンパイル {elapsed * 1000:.1f}ms {len(data)}バイト (ヒット率 {self._compiled_cache_hit_rate():.1%})")
+        return data
+
+    def compile_command(self, arg_type, arg_command, arg_dict):
+        """
+        コマンドを1つESC/POSのバイト列に変換します（キャッシュは使わず、プリンタへは送信しません）。\n
+        テンプレートの固定部分・差し込み項目の組み立てに使います。
+
+        :param str arg_type: コマンド種別
+        :param arg_command: コマンドの内容
+        :param dict arg_dict: コマンドのオプション
+        :return: ESC/POSのバイト列
+        :rtype: bytes
+        """
+        with self._capture_output() as buffer:
+            self._emit_command(arg_type, arg_command, arg_dict)
+        return bytes(buffer)
 
-            self.logger.debug("=== 印刷完了 ===")
+    def cut_command(self):
+        """
+        用紙カットのESC/POSのバイト列を作成します（プリンタへは送信しません）。
 
-            # プリンタを閉じる
-            self.tm_print.close()
+        :rtype: bytes
+        """
+        with self._capture_output() as buffer:
+            self.tm_print.cut()
+        return bytes(buffer)
+
+    def _emit_commands(self, commands, image_path, enable_text_print, enable_image_print):
+        """
+        コマンド列と画像をプリンタオブジェクトへ出力します。
+
+        :return: 何か印刷したかどうか
+        :rtype: bool
+        """
+        # 印刷フラグ
+        isprinted = False
+
+        # テキストが含まれているかどうか
+        text_included = False  
+        if any(cmd[0] in ("jp2", "qr", "itf", "ean", "c39", "c128", "logo") for cmd in commands):
+            text_included = True
+        self.logger.debug(f"テキスト含むか: {text_included}")
+
+        if enable_text_print and text_included:
+            if self.render_mode == "raster":
+                # 文書全体を1枚のラスター画像にまとめて出力（バーコードはコマンドのまま）
+                with timing.stage("raster_render"):
+                    segments = self.rasterizer.render(commands)
+                for segment_type, segment in segments:
+                    if segment_type == "image":
+                        with timing.stage("command:raster_image", buffer=self._capture_buffer):
+                            self.tm_print._raw(b"\x1b\x61\x00")  # 画像は幅いっぱいなので左寄せで出力
+                            self.tm_print.image(segment, center=False)
+                        isprinted = True  # 印刷フラグを設定
+                    else:
+                        isprinted = self._emit_command(*segment) or isprinted
+            else:
+                for arg_type, arg_command, arg_dict in commands:
+                    isprinted = self._emit_command(arg_type, arg_command, arg_dict) or isprinted
+
+        if enable_image_print and image_path:
+            self.logger.debug(f"画像を印刷: {image_path}")
+            with timing.stage("command:image", buffer=self._capture_buffer):
+                self.tm_print.image(image_path, center=False)
+            isprinted = True  # 画像印刷フラグを設定
+
+        return isprinted
+
+    def _emit_command(self, arg_type, arg_command, arg_dict):
+        """
+        コマンドを1つプリンタオブジェクトへ出力します。
+
+        :param str arg_type: コマンド種別
+        :param arg_command: コマンドの内容
+        :param dict arg_dict: コマンドのオプション
+        :return: 印刷する内容を出力したかどうか
+        :rtype: bool
+        """
+        self.logger.debug(f"コマンド: {arg_type}, 引数: {arg_command}, オプション: {arg_dict}")
+        with timing.stage(f"command:{arg_type}", buffer=self._capture_buffer):
+            return self._emit_command_body(arg_type, arg_command, arg_dict)
+
+    def _emit_command_body(self, arg_type, arg_command, arg_dict):
+        """
+        コマンドを1つプリンタオブジェクトへ出力します（_emit_commandの本体）。
+
+        :return: 印刷する内容を出力したかどうか
+        :rtype: bool
+        """
+        # 絵文字対応日本語出力
+        if arg_type == "jp2":
+            self._jptext2(arg_command, arg_dict)
+            return True
+        # バーコード：QRコード
+        if arg_type == "qr":
+            self.tm_print.qr(arg_command, native=True)
+            return True
+        # バーコード：ITFコード
+        if arg_type == "itf":
+            self.tm_print.barcode(arg_command, bc="ITF", align_ct=False, width=2)
+            return True
+        # バーコード：EANコード
+        if arg_type == "ean":
+            self.tm_print.barcode(arg_command, bc="EAN13", align_ct=False, width=2)
+            return True
+        # バーコード：Code39コード
+        if arg_type == "c39":
+            self.tm_print.barcode(arg_command, bc="CODE39", align_ct=False, width=2)
+            return True
+        # バーコード：Code128コード
+        if arg_type == "c128":
+            # CODE128は(SHIFT or CODE A or CODE B or CODE C)の内、CODE Bを使用
+            self.tm_print.barcode("{B" + arg_command, bc="CODE128", align_ct=False, function_type="B", width=2)
+            return True
+        # ロゴ
+        if arg_type == "logo":
+            return self._logo(arg_command)
+        # 他のコマンド
+        if arg_type == "row":
+            self.tm_print._raw(arg_command)
+        return False
+
+    def _logo(self, name):
+        """
+        ロゴを出力します。\n
+        NVグラフィックスを使う場合はキーコードを指定する印字コマンドのみ（登録は送信時にprepare_logosで行います）、
+        使わない場合（ファイルへの書き出し）は画像で出力します。
+
+        :param str name: ロゴ名
+        :return: 印刷する内容を出力したかどうか
+        :rtype: bool
+        """
+        logo = self.logos.get(name, self.media_width)
+        if logo is None:
+            self.logger.warning(f"ロゴ '{name}' の画像がありません: {self.logos.logo_dir}")
+            return False
+        if self.store_logos:
+            self.tm_print._raw(logo.print_command())
+        else:
+            self.tm_print.image(logo.image, center=False)
+        return True
+
+    def _logo_state(self, commands):
+        """
+        コマンド列で使うロゴの出力内容の識別情報（コンパイル結果のキャッシュキー用、プリンタとは通信しません）
+
+        :param commands: TextTagParserが返すコマンドのリスト
+        :return: (NVグラフィックスを使うか, ロゴごとの(ロゴ名, キーコード))
+        :rtype: tuple
+        """
+        state = []
+        for name in self.logo_names(commands):
+            logo = self.logos.get(name, self.media_width)
+            if logo is None:
+                state.append((name, None))
+            else:
+                # 画像で出力する場合は内容が変わると出力も変わる
+                state.append((name, logo.key if self.store_logos else logo.digest))
+        return self.store_logos, tuple(state)
+
+    def _jptext2(self, text, options):
+        """
+        jptext2で出力します。\n
+        フォント描画が必要な文字（絵文字・外字）を含む場合は、呼び出し1回分の出力をグリフキャッシュに保存して使い回します。
+        jptext2は文字の並び・前後の文字によって漢字モードの切り替えや外字の割り当てが変わるため、
+        文字ごとに分割せず、同じ文字列・同じ引数の呼び出し単位でキャッシュします。
+        キャッシュにない場合は、収録文字インデックスで決めた必要なフォントだけを読み込んだプリンタオブジェクトで描画します。
+
+        :param str text: 出力する文字列
+        :param dict options: jptext2の引数
+        """
+        rendered = [chunk for chunk, needs_font in glyph_cache.split_for_glyph_cache(text) if needs_font]
+        if not rendered:
+            self.tm_print.jptext2(text, **options)
+            return
+        cache = glyph_cache.shared_cache()
+        key = self._glyph_key(text, options)
+        data = cache.get(key)
+        if data is None:
+            font_printer = self._font_printer("".join(rendered))
+            with self._capture_output(font_printer) as buffer:
+                font_printer.jptext2(text, **options)
+            data = bytes(buffer)
+            cache.put(key, data)
+        self.tm_print._raw(data)
+
+    def _font_printer(self, text):
+        """
+        文字列の描画に必要なフォントだけを読み込んだプリンタオブジェクトを取得（フォントの組み合わせごとにプロセスで共有）\n
+        フォールバックの順で優先順位の高いフォントのうち、各文字を収録している最優先のフォントを含めるため、
+        jptext2が選ぶフォントはすべてのフォントを渡した場合と変わりません。
+        収録文字インデックスがない場合はすべてのフォントを読み込みます。
+
+        :param str text: フォント描画が必要な文字列
+        :return: プリンタオブジェクト（送信には使わず、出力は取り込んで使う）
+        :rtype: TM88IV
+        """
+        font_keys = self.font_index.required_fonts(text) if self.font_index is not None else self.font_keys
+        fingerprint = tuple(f for f in self.font_fingerprint if f[0] in font_keys)
+        tm_print = self._shared_printer(self.tm_print.host, self.tm_print.port, self._printer_config(font_keys), fingerprint)
+        tm_print.profile.profile_data['media']['width']['pixels'] = self.media_width
+        return tm_print
+
+    def _printer_config(self, font_keys):
+        """
+        指定したフォントだけを含むTM88IVクラス用設定（フォント以外の設定はそのまま）
+
+        :param font_keys: 含めるフォントの設定キー
+        :rtype: dict
+        """
+        return {key: value for key, value in (self.config or {}).items() if key not in self.font_keys or key in font_keys}
+
+    def _glyph_key(self, text, options):
+        """
+        グリフキャッシュのキーを作成\n
+        (コードポイント列, フォント, サイズ, 倍角, 位置調整, その他の引数)
+        jptext2が実際に使うフォントは外から確定できないため、設定されたすべてのフォントファイルの識別情報を含めます。
+
+        :param str text: jptext2に渡す文字列
+        :param dict options: jptext2の引数
+        :return: キャッシュキー
+        :rtype: tuple
+        """
+        config = self.config or {}
+        return (
+            tuple(ord(ch) for ch in text),
+            self.font_fingerprint,
+            config.get("emoji_font_size"),
+            bool(options.get("dw")),
+            bool(options.get("dh")),
+            config.get("emoji_font_adjust_x"),
+            config.get("emoji_font_adjust_y"),
+            tuple(sorted((k, v) for k, v in options.items() if k not in ("dw", "dh"))),
+        )
+
+    @staticmethod
+    def _font_fingerprint(config):
+        """
+        設定されたフォントファイルの識別情報（パス・サイズ・更新日時）
+
+        :param config: TM88IVクラス用設定
+        :return: フォントファイルごとの識別情報
+        :rtype: tuple
+        """
+        fingerprint = []
+        for key, value in sorted((config or {}).items()):
+            if "_file" not in key:  # fallback_font_file_p01 などの番号付きのキーを含む
+                continue
+            try:
+                stat = os.stat(value)
+                fingerprint.append((key, os.path.basename(value), stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                fingerprint.append((key, str(value), None, None))
+        return tuple(fingerprint)
+
+    @contextmanager
+    def _capture_output(self, tm_print=None):
+        """
+        プリンタオブジェクトへの出力を送信せずにバッファへ取り込むコンテキストマネージャ\n
+        python-escposの出力はすべて_rawを経由するため、インスタンス側で一時的に差し替えます。
+        印刷キュー・一括印刷のスレッドと同時に使われるため、取り込み中は他のスレッドを待たせます。
+
+        :param tm_print: 取り込むプリンタオブジェクト（省略時は送信用のプリンタオブジェクト）
+        """
+        tm_print = tm_print or self.tm_print
+        buffer = bytearray()
+        with PrinterHandler._output_lock:
+            previous = tm_print.__dict__.get("_raw")  # 入れ子で取り込み中の場合の差し替え元
+            previous_buffer = self._capture_buffer
+            tm_print._raw = buffer.extend
+            self._capture_buffer = buffer
+            try:
+                yield buffer
+            finally:
+                self._capture_buffer = previous_buffer
+                if previous is None:
+                    del tm_print._raw  # クラス側の_rawに戻す
+                else:
+                    tm_print._raw = previous
+
+    def _compile_key(self, commands, image_path, enable_text_print, enable_image_print, should_cut_paper):
+        """
+        コンパイル結果のキャッシュキーを作成（文書モデル・画像・設定・ロゴのハッシュ）
+
+        :return: キャッシュキー
+        :rtype: str
+        """
+        digest = hashlib.sha256()
+        digest.update(repr(commands).encode("utf-8"))
+        digest.update(repr((enable_text_print, enable_image_print, should_cut_paper, self.media_width, self.render_mode)).encode("utf-8"))
+        digest.update(repr(sorted((str(k), str(v)) for k, v in (self.config or {}).items())).encode("utf-8"))
+        digest.update(repr(self._logo_state(commands)).encode("utf-8"))
+        if enable_image_print and image_path:
+            if isinstance(image_path, (str, os.PathLike)):
+                stat = os.stat(image_path)
+                digest.update(repr((str(image_path), stat.st_size, stat.st_mtime_ns)).encode("utf-8"))
+            else:
+                digest.update(repr((image_path.mode, image_path.size)).encode("utf-8"))
+                digest.update(image_path.tobytes())
+        return digest.hexdigest()
+
+    @classmethod
+    def _compiled_cache_hit_rate(cls):
+        """
+        コンパイル済み印刷データキャッシュのヒット率
+
+        :rtype: float
+        """
+        total = cls._compiled_cache_hits + cls._compiled_cache_misses
+        return cls._compiled_cache_hits / total if total else 0.0
 
 
 class TextTagParser:
     """
     タグ付きテキストを解析し、TM88IVのエスケープコマンドに変換するクラス
     """
-    def __init__(self, text_widget):
+    def __init__(self, text_widget=None, blocks=None):
         """
         タグ付きテキストを解析するクラスの初期化
 
         :param text_widget: タグ付きテキストを含むウィジェット
+        :param blocks: 行ごとの(文字列, タグ)のリスト（ウィジェットの代わりに保存済みの文書を解析する場合）
         """
         self.text_widget = text_widget
+        self.blocks = blocks
         self.esc_commands = []  # 最終的にPrinterHandlerへ渡すコマンド列
+        self.overflow_lines = []  # 印字幅を超える行(行番号, 印字幅)のリスト
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
 
@@ -127,13 +579,27 @@ class TextTagParser:
         """
         # 既存のコマンドをクリア
         self.esc_commands.clear()
-        # 各行のタグブロックを取得
-        self.blocks_per_line = self._get_line_tag_blocks()
+        self.overflow_lines.clear()
+        # 各行のタグブロックを取得（テキストウィジェットから取得する場合はTkの呼び出しが大半）
+        with timing.stage("parse_blocks"):
+            self.blocks_per_line = self.get_blocks()
         # タグブロックをESC/POSコマンドに変換
-        self.esc_commands = self._convert_line_to_esc()
+        with timing.stage("parse_convert"):
+            self.esc_commands = self._convert_line_to_esc()
         # 変換結果を返す
         return self.esc_commands
 
+    def get_blocks(self):
+        """
+        各行のタグブロックを取得（文書が指定されている場合はそのまま返却）
+
+        :return: 行ごとの(文字列, タグ)のリスト
+        :rtype: list[list[tuple]]
+        """
+        if self.blocks is not None:
+            return self.blocks
+        return self._get_line_tag_blocks()
+
     def _get_line_tag_blocks(self):
         """
         各行のタグブロックを取得（改行もセグメントとして含める）
@@ -211,13 +677,14 @@ class TextTagParser:
 
         # 初期位置は左
         commands.append(("row", b"\x1b\x61\x00", {}))
-        for line_blocks in self.blocks_per_line:
+        for lineno, line_blocks in enumerate(self.blocks_per_line, start=1):
             self.logger.debug(f"行ブロック: {line_blocks}")
             # 各行のテキストとタグを取得
             index = 0  # 行のインデックス
             include_text = False  # テキストが存在するかどうかのフラグ
             include_align = False  # 左寄せ、中央寄せ、右寄せのフラグ
             include_barcode = False  # バーコードが存在するかどうかのフラグ
+            line_width = 0  # 行の印字幅（桁）
             jptext2_args_dict = {"bflg": True}
             for text, tags in line_blocks:
                 is_text = True  # テキストかどうかのフラグ
@@ -283,6 +750,15 @@ class TextTagParser:
                     is_text = False  # CODE39コードはテキストではない
                     include_barcode = True
 
+                # ロゴ（プリンタのNVグラフィックスに登録して印字）
+                if "logo_tag" in tags and re.search(r"<LOGO:[^>]+>", text):
+                    if index > 0:
+                        commands.append(("jp2", "\n", jptext2_args_dict))
+                    logo_name = re.search(r"<LOGO:([^>]+)>", text).group(1)
+                    commands.append(("logo", logo_name, {}))
+                    is_text = False  # ロゴはテキストではない
+                    include_barcode = True  # バーコードと同じく行末の改行は不要
+
                 # バーコード：Code128コード
                 if "c128_tag" in tags and re.search(r"<C128:[^>]+>", text):
                     if index > 0:
@@ -320,10 +796,15 @@ class TextTagParser:
                 if is_text:
                     commands.append(("jp2", text, jptext2_args_dict))
                     include_text = True  # テキストが存在するフラグを設定
+                    line_width += display_width.printed_width(text, tags)
 
                 # 行のインデックスを更新
                 index += 1
 
+            # 印字幅を超える行はプリンタ側で折り返されるため記録
+            if line_width > display_width.PRINTER_LINE_COLUMNS:
+                self.overflow_lines.append((lineno, line_width))
+
             # 行の終わりに改行を追加
             if include_text or \
                 (index == 1 and not include_barcode and not include_align and line_count > 1) or \
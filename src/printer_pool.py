@@ -0,0 +1,233 @@
+import re
+import time
+import queue
+import logging
+import threading
+
+# 送信に失敗したプリンタを振り分け対象から外す時間（秒）
+POOL_FAILURE_COOLDOWN = 30
+# 送信実績がないプリンタの想定スループット（バイト/秒）
+POOL_DEFAULT_THROUGHPUT = 64 * 1024
+# スループットの移動平均の重み（新しい送信実績の割合）
+POOL_THROUGHPUT_SMOOTHING = 0.3
+# プリンタの指定の記法（例: 192.168.10.21:9100*2、ポート・重みは省略可）
+ENDPOINT_PATTERN = re.compile(r"^\s*([^\s:*]+)(?::(\d+))?(?:\*(\d+))?\s*$")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+def parse_endpoints(text):
+    """
+    カンマ区切りのプリンタの指定を読み込み
+
+    :param str text: 「IPアドレス:ポート*重み」のカンマ区切り（ポートの省略時は9100、重みの省略時は1）
+    :return: {"ip", "port", "weight"}のリスト
+    :rtype: list[dict]
+    """
+    endpoints = []
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        match = ENDPOINT_PATTERN.match(item)
+        if not match:
+            raise ValueError(f"プリンタの指定が不正です: {item.strip()}")
+        ip, port, weight = match.group(1), int(match.group(2) or 9100), int(match.group(3) or 1)
+        if not 1 <= port <= 65535:
+            raise ValueError(f"ポート番号は1から65535の範囲で指定してください: {item.strip()}")
+        if weight < 1:
+            raise ValueError(f"重みは1以上で指定してください: {item.strip()}")
+        endpoints.append({"ip": ip, "port": port, "weight": weight})
+    return endpoints
+
+
+def format_endpoints(endpoints):
+    """
+    プリンタの指定をカンマ区切りの文字列に変換（parse_endpointsの逆）
+
+    :param endpoints: {"ip", "port", "weight"}のリスト
+    :rtype: str
+    """
+    items = []
+    for endpoint in endpoints:
+        item = f"{endpoint['ip']}:{endpoint.get('port', 9100)}"
+        if int(endpoint.get("weight", 1)) != 1:
+            item += f"*{endpoint['weight']}"
+        items.append(item)
+    return ", ".join(items)
+
+
+def pool_endpoints(config):
+    """
+    設定からプールのプリンタの一覧を取得（プールが未設定の場合は単一のプリンタ）
+
+    :param config: アプリの設定
+    :return: {"ip", "port", "weight"}のリスト
+    :rtype: list[dict]
+    """
+    endpoints = config.get("printer_pool") or []
+    if endpoints:
+        return [{"ip": e["ip"], "port": int(e.get("port", 9100)), "weight": int(e.get("weight", 1))} for e in endpoints]
+    return [{"ip": config.get("printer_ip", ""), "port": int(config.get("printer_port", 9100)), "weight": 1}]
+
+
+class PoolMember:
+    """
+    プールに属するプリンタ1台分の状態（専用の待ち行列・送信実績・正常性）
+    """
+    def __init__(self, handler, weight=1):
+        """
+        プリンタの状態の初期化
+
+        :param handler: PrinterHandler
+        :param int weight: 重み（大きいほど多くのジョブを割り当て）
+        """
+        self.handler = handler
+        self.weight = max(int(weight), 1)
+        self.jobs = queue.Queue()
+        self.depth = 0  # 割り当て済みで未完了のジョブ数（印刷中を含む）
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.bytes_sent = 0
+        self.throughput = None  # 送信速度の移動平均（バイト/秒）
+        self.last_error = None
+        self.unhealthy_until = 0.0
+        self.worker = None  # 準備（解析・コンパイル）スレッド
+        self.sender = None  # 送信スレッド
+        self.rendered = None  # 準備済みで送信待ちのジョブ（上限付きの待ち行列）
+
+    @property
+    def name(self):
+        """
+        プリンタの表示名（IPアドレス:ポート）
+
+        :rtype: str
+        """
+        return f"{self.handler.tm_print.host}:{self.handler.tm_print.port}"
+
+    @property
+    def status(self):
+        """
+        状態監視による最新の状態（未確認の場合はNone）
+
+        :rtype: status_monitor.PrinterStatus
+        """
+        return self.handler.connection.status
+
+    @property
+    def healthy(self):
+        """
+        振り分け対象かどうか（送信に失敗してから一定時間・印刷できない状態の間は対象外）
+
+        :rtype: bool
+        """
+        status = self.status
+        return time.monotonic() >= self.unhealthy_until and (status is None or status.ready)
+
+    def score(self, nbytes=0):
+        """
+        振り分けの評価値（割り当て済みのジョブを含めて送り終えるまでの推定時間、小さいほど空いている）
+
+        :param int nbytes: 割り当てるジョブの大きさ（不明な場合は0）
+        :rtype: float
+        """
+        throughput = self.throughput or POOL_DEFAULT_THROUGHPUT
+        return ((self.depth + 1) * max(nbytes, 1)) / (throughput * self.weight)
+
+    def record_success(self, nbytes, seconds):
+        """
+        送信の成功を記録
+
+        :param int nbytes: 送信したバイト数
+        :param float seconds: 送信にかかった時間（秒）
+        """
+        self.jobs_done += 1
+        self.bytes_sent += nbytes
+        self.unhealthy_until = 0.0
+        if seconds > 0 and nbytes > 0:
+            rate = nbytes / seconds
+            self.throughput = rate if self.throughput is None else (
+                self.throughput * (1 - POOL_THROUGHPUT_SMOOTHING) + rate * POOL_THROUGHPUT_SMOOTHING)
+
+    def record_failure(self, error):
+        """
+        送信の失敗を記録（一定時間は振り分け対象から外す）
+
+        :param error: 発生したエラー
+        """
+        self.jobs_failed += 1
+        self.last_error = error
+        self.unhealthy_until = time.monotonic() + POOL_FAILURE_COOLDOWN
+        logger.warning(f"{self.name}: 送信に失敗したため{POOL_FAILURE_COOLDOWN}秒間振り分け対象から外します: {error}")
+
+    def summary(self):
+        """
+        状態の要約（設定ウィンドウの表示用）
+
+        :rtype: str
+        """
+        status = self.status
+        if status is not None and not status.ready:
+            state = status.describe()
+        else:
+            state = "正常" if self.healthy else "停止中"
+        throughput = f"{self.throughput / 1024:.0f}KB/s" if self.throughput else "-"
+        return (f"{self.name} 重み{self.weight} {state} 待ち{self.depth} "
+                f"完了{self.jobs_done} 失敗{self.jobs_failed} {throughput}")
+
+
+class PrinterPool:
+    """
+    複数のプリンタをまとめて扱うクラス\n
+    ジョブごとに、正常なプリンタのうち最も早く送り終えると見込まれるもの（待ちジョブ数・送信速度・重みから推定）を選びます。
+    """
+    def __init__(self, members):
+        """
+        プリンタプールの初期化
+
+        :param members: PoolMemberのリスト
+        """
+        if not members:
+            raise ValueError("プリンタが設定されていません")
+        self.members = members
+        self.lock = threading.Lock()
+
+    def choose(self, nbytes=0, exclude=()):
+        """
+        ジョブを割り当てるプリンタを選択し、待ちジョブ数に加算
+
+        :param int nbytes: ジョブの大きさ（不明な場合は0）
+        :param exclude: 対象外にするプリンタ（送信に失敗したプリンタなど）
+        :return: 選んだプリンタ（対象がない場合はNone）
+        :rtype: PoolMember
+        """
+        with self.lock:
+            candidates = [member for member in self.members if member not in exclude]
+            if not candidates:
+                return None
+            # 正常なプリンタがない場合は、最も早く復帰するものを試す（印刷できない状態の場合は送信時に失敗）
+            healthy = [member for member in candidates if member.healthy]
+            if healthy:
+                member = min(healthy, key=lambda m: m.score(nbytes))
+            else:
+                member = min(candidates, key=lambda m: m.unhealthy_until)
+            member.depth += 1
+            return member
+
+    def release(self, member):
+        """
+        ジョブの完了（失敗・中止を含む）をプリンタの待ちジョブ数に反映
+
+        :param PoolMember member: ジョブを割り当てたプリンタ
+        """
+        with self.lock:
+            member.depth -= 1
+
+    def stats(self):
+        """
+        プリンタごとの状態の要約
+
+        :rtype: list[str]
+        """
+        with self.lock:
+            return [member.summary() for member in self.members]
@@ -0,0 +1,244 @@
+from collections import OrderedDict
+from PIL import Image, ImageDraw
+import logging
+import threading
+import numpy as np
+
+import display_width
+import font_index
+import font_manager
+from glyph_cache import split_clusters
+
+# 印字幅（ドット）
+RASTER_MEDIA_WIDTH = 512
+# 半角1文字の幅（ドット、フォントA 12×24相当）
+RASTER_HALF_WIDTH = 12
+# 文字の高さ（ドット、漢字フォント 24×24相当）
+RASTER_CHAR_HEIGHT = 24
+# 改行量（ドット、TM-T88IVの初期値 1/6インチ相当）
+RASTER_LINE_HEIGHT = 30
+# アンダーラインの太さ（ドット）
+RASTER_UNDERLINE_THICKNESS = 2
+# 配置コマンド(ESC a n)と配置の対応
+RASTER_ALIGN_COMMANDS = {b"\x1b\x61\x00": "left", b"\x1b\x61\x01": "center", b"\x1b\x61\x02": "right"}
+# 配置と配置コマンドの対応（パススルーのコマンドの前に出力）
+RASTER_ALIGN_BYTES = {align: command for command, align in RASTER_ALIGN_COMMANDS.items()}
+# ラスター化できず、プリンタのコマンドをそのまま使うコマンド種別（バーコード・NVグラフィックスのロゴ）
+RASTER_PASSTHROUGH_TYPES = ("qr", "itf", "ean", "c39", "c128", "logo")
+# 描画済みの文字セルのキャッシュ上限（件数）
+RASTER_CELL_CACHE_MAX_ENTRIES = 4096
+
+
+class ReceiptRasterizer:
+    """
+    タグ解析結果のコマンド列を、文書全体で1枚の1bit画像に配置するクラス\n
+    配置・倍角・アンダーライン・反転・水平線を画像上で再現し、バーコードはプリンタのコマンドのまま残します。
+    """
+    # 描画済みの文字セル（プロセス内で共有、上限を超えた分は古いものから破棄）
+    _cell_cache = OrderedDict()
+    _cell_cache_lock = threading.Lock()
+
+    def __init__(self, config, media_width=RASTER_MEDIA_WIDTH, fonts=None, index=None):
+        """
+        ラスター化クラスの初期化
+
+        :param dict config: TM88IVクラス用設定（フォントファイル・絵文字設定）
+        :param int media_width: 印字幅（ドット）
+        :param fonts: 共有フォント管理（省略時はプロセス共有のもの）
+        :param index: フォント収録文字インデックス（省略時はプロセス共有のもの）
+        """
+        self.config = config or {}
+        self.media_width = int(media_width)
+        self.fonts = fonts or font_manager.shared_manager()
+        # 絵文字以外の文字は漢字フォントを優先するため、絵文字フォントを除いた構成で引く
+        text_config = {k: v for k, v in self.config.items() if k != "emoji_font_file"}
+        self.index = index if index is not None else font_index.shared_index(text_config)
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+    def render(self, commands):
+        """
+        コマンド列をラスター画像とパススルーコマンドの列に変換
+
+        :param commands: TextTagParserが返すコマンドのリスト
+        :return: ("image", Pillow Image) または ("command", コマンド) のリスト
+        :rtype: list[tuple]
+        """
+        segments = []
+        rows = []  # 現在の画像に積み上げる行（numpy配列、Trueが黒）
+        line = []  # 現在の行の文字セル
+        align = "left"
+        line_align = None  # 行の配置は行頭の時点で確定（ESC/POSと同じ）
+
+        for arg_type, arg_command, arg_dict in commands:
+            if arg_type == "row":
+                if arg_command in RASTER_ALIGN_COMMANDS:
+                    align = RASTER_ALIGN_COMMANDS[arg_command]
+                continue
+            if arg_type in RASTER_PASSTHROUGH_TYPES:
+                if line:
+                    rows.extend(self._layout_line(line, line_align or align))
+                    line, line_align = [], None
+                if rows:
+                    segments.append(("image", self._compose(rows)))
+                    rows = []
+                # 画像は左寄せで出力するため、コマンドの前に現在の配置を指定し直す（通常の印字方式と同じ配置）
+                segments.append(("command", ("row", RASTER_ALIGN_BYTES[align], {})))
+                segments.append(("command", (arg_type, arg_command, arg_dict)))
+                continue
+            if arg_type != "jp2":
+                continue
+            parts = arg_command.split("\n")
+            for i, part in enumerate(parts):
+                if part:
+                    if line_align is None:
+                        line_align = align
+                    line.extend(self._cell(cluster, arg_dict) for cluster in split_clusters(part))
+                if i < len(parts) - 1:
+                    # 改行
+                    rows.extend(self._layout_line(line, line_align or align))
+                    line, line_align = [], None
+
+        if line:
+            rows.extend(self._layout_line(line, line_align or align))
+        if rows:
+            segments.append(("image", self._compose(rows)))
+        return segments
+
+    def _layout_line(self, cells, align):
+        """
+        1行分の文字セルを配置（印字幅を超える場合はプリンタと同様に折り返し）
+
+        :param cells: 文字セル（numpy配列）のリスト
+        :param str align: 配置（left, center, right）
+        :return: 行画像（numpy配列）のリスト
+        :rtype: list[numpy.ndarray]
+        """
+        if not cells:
+            return [np.zeros((RASTER_LINE_HEIGHT, self.media_width), dtype=bool)]
+        rows = []
+        start = 0
+        while start < len(cells):
+            width = 0
+            end = start
+            while end < len(cells) and (end == start or width + cells[end].shape[1] <= self.media_width):
+                width += cells[end].shape[1]
+                end += 1
+            chunk = cells[start:end]
+            height = max(cell.shape[0] for cell in chunk)
+            row = np.zeros((height + RASTER_LINE_HEIGHT - RASTER_CHAR_HEIGHT, self.media_width), dtype=bool)
+            if align == "center":
+                x = max((self.media_width - width) // 2, 0)
+            elif align == "right":
+                x = max(self.media_width - width, 0)
+            else:
+                x = 0
+            for cell in chunk:
+                cell_h, cell_w = cell.shape
+                cell_w = min(cell_w, self.media_width - x)
+                # 高さの異なる文字はベースライン（セルの下端）を揃える
+                row[height - cell_h:height, x:x + cell_w] = cell[:, :cell_w]
+                x += cell_w
+            rows.append(row)
+            start = end
+        return rows
+
+    def _compose(self, rows):
+        """
+        行画像を縦に連結して1bit画像を作成
+
+        :param rows: 行画像（numpy配列）のリスト
+        :return: 1bit画像
+        :rtype: Image
+        """
+        canvas = np.vstack(rows)
+        # Pillowの1bit画像は白が1のため反転して変換
+        return Image.fromarray(np.where(canvas, 0, 255).astype(np.uint8), mode="L").convert("1")
+
+    def _cell(self, cluster, options):
+        """
+        1表示単位の文字セルを描画（描画結果はキャッシュ）
+
+        :param str cluster: 表示単位の文字列
+        :param dict options: jptext2の引数（dw, dh, underline, wbreverse）
+        :return: 文字セル（numpy配列、Trueが黒）
+        :rtype: numpy.ndarray
+        """
+        dw = bool(options.get("dw"))
+        dh = bool(options.get("dh"))
+        underline = bool(options.get("underline"))
+        invert = bool(options.get("wbreverse"))
+        font_file, size, adjust_x, adjust_y = self._font_for(cluster)
+        key = (cluster, str(font_file), size, adjust_x, adjust_y, dw, dh, underline, invert)
+        cls = ReceiptRasterizer
+        with cls._cell_cache_lock:
+            cell = cls._cell_cache.get(key)
+            if cell is not None:
+                cls._cell_cache.move_to_end(key)
+                return cell
+
+        columns = 2 if self._is_wide(cluster) else 1
+        width = RASTER_HALF_WIDTH * columns
+        image = Image.new("L", (width, RASTER_CHAR_HEIGHT), 255)
+        if font_file is not None:
+            draw = ImageDraw.Draw(image)
+            font = self.fonts.font(font_file, size)
+            draw.text((width / 2 + adjust_x, RASTER_CHAR_HEIGHT / 2 + adjust_y), cluster, font=font, fill=0, anchor="mm")
+        cell = np.array(image) < 128
+        # 倍角はプリンタと同様にドットを単純に拡大
+        if dw:
+            cell = np.repeat(cell, 2, axis=1)
+        if dh:
+            cell = np.repeat(cell, 2, axis=0)
+        if underline:
+            cell[-RASTER_UNDERLINE_THICKNESS:, :] = True
+        if invert:
+            cell = ~cell
+        cell.setflags(write=False)
+        with cls._cell_cache_lock:
+            cls._cell_cache[key] = cell
+            while len(cls._cell_cache) > RASTER_CELL_CACHE_MAX_ENTRIES:
+                cls._cell_cache.popitem(last=False)
+        return cell
+
+    def _font_for(self, cluster):
+        """
+        表示単位を描画するフォントと描画設定を決定
+
+        :param str cluster: 表示単位の文字列
+        :return: (フォントファイル, サイズ, X座標調整, Y座標調整)
+        :rtype: tuple
+        """
+        if self._is_emoji(cluster) and self.config.get("emoji_font_file"):
+            return (self.config["emoji_font_file"],
+                    int(self.config.get("emoji_font_size", RASTER_CHAR_HEIGHT - 4)),
+                    int(self.config.get("emoji_font_adjust_x", 0)),
+                    int(self.config.get("emoji_font_adjust_y", 0)))
+        resolved = self.index.font_for_cluster(cluster) if self.index is not None else None
+        font_file = resolved[1] if resolved else self.config.get("kanji_font_file")
+        return font_file, RASTER_CHAR_HEIGHT, 0, 0
+
+    @staticmethod
+    def _is_emoji(cluster):
+        """
+        表示単位が絵文字かを判定（絵文字シーケンス、または絵文字が集まるブロックの文字）
+
+        :param str cluster: 表示単位の文字列
+        :rtype: bool
+        """
+        if len(cluster) > 1:
+            return True
+        cp = ord(cluster)
+        return cp >= 0x1F000 or 0x2600 <= cp <= 0x27BF or 0x2B00 <= cp <= 0x2BFF
+
+    @staticmethod
+    def _is_wide(cluster):
+        """
+        表示単位が全角幅かを判定
+
+        :param str cluster: 表示単位の文字列
+        :rtype: bool
+        """
+        if len(cluster) > 1:
+            return True  # 絵文字シーケンス
+        return display_width.char_width(cluster) == 2
@@ -0,0 +1,140 @@
+from pathlib import Path
+import time
+import logging
+import threading
+
+from escpos.exceptions import Error as EscposError
+from escpos.printer import Network
+
+import connection
+
+# 書き出した印刷データの拡張子
+ESCPOS_SUFFIX = ".escpos"
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+def collect_files(paths):
+    """
+    送信するファイルの一覧を作成（フォルダの場合は中の.escposファイルを名前順に追加）
+
+    :param paths: ファイル・フォルダのパスのリスト
+    :rtype: list[Path]
+    """
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(path.glob(f"*{ESCPOS_SUFFIX}")))
+        else:
+            files.append(path)
+    return files
+
+
+class ReplayResult:
+    """
+    プリンタ1台分の再生の実績
+    """
+    def __init__(self, name):
+        """
+        再生の実績の初期化
+
+        :param str name: プリンタの表示名（IPアドレス:ポート）
+        """
+        self.name = name
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0  # 送信にかかった時間の合計（秒）
+        self.failures = []  # (ファイルのパス, エラー)のリスト
+
+    @property
+    def throughput(self):
+        """
+        送信速度（バイト/秒）
+
+        :rtype: float
+        """
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        """
+        実績の要約
+
+        :rtype: str
+        """
+        return (f"{self.name}: {self.files}件 {self.bytes:,}バイト {self.seconds:.2f}秒 "
+                f"{self.throughput / 1024:.0f}KB/s 失敗{len(self.failures)}件")
+
+
+def open_connections(endpoints, timeout=60):
+    """
+    再生先のプリンタとの接続を準備（フォントなどの印刷準備は不要なため、ネットワーク接続のみ）
+
+    :param endpoints: {"ip", "port"}のリスト（printer_pool.parse_endpointsの形式）
+    :param timeout: 送信のタイムアウト（秒）
+    :rtype: list[connection.PrinterConnection]
+    """
+    # 接続はファイルごとに切断せず、プリンタごとの送信を終えるまで使い回す
+    return [connection.PrinterConnection(Network(endpoint["ip"], int(endpoint.get("port", 9100)), timeout))
+            for endpoint in endpoints]
+
+
+def assign_files(files, count):
+    """
+    ファイルをプリンタに振り分け（合計バイト数が最も少ないプリンタに順番に割り当て、プリンタごとの順序は保持）
+
+    :param files: ファイルのパスのリスト
+    :param int count: プリンタの台数
+    :return: プリンタごとのファイルのリスト
+    :rtype: list[list[Path]]
+    """
+    assignments = [[] for _ in range(count)]
+    assigned_bytes = [0] * count
+    for path in files:
+        index = assigned_bytes.index(min(assigned_bytes))
+        assignments[index].append(path)
+        assigned_bytes[index] += path.stat().st_size
+    return assignments
+
+
+def replay(files, connections, on_file=None):
+    """
+    書き出した印刷データをプリンタへ送信（再生）\n
+    ファイルをプリンタに振り分け、プリンタごとのスレッドで並行して送信します。
+    ファイルの内容はそのまま送るため、フォントの読み込み・画像処理・タグ解析は行いません。
+
+    :param files: ファイルのパスのリスト
+    :param connections: 送信先のプリンタとの接続（connection.PrinterConnection）のリスト
+    :param on_file: 1ファイル送信するごとの通知先（ファイルのパス, ReplayResult, connection.SendStatsを引数に呼び出し）
+    :return: (プリンタごとの実績, 全体の所要時間（秒）)
+    :rtype: tuple[list[ReplayResult], float]
+    """
+    if not connections:
+        raise ValueError("送信先のプリンタがありません")
+    results = [ReplayResult(f"{c.tm_print.host}:{c.tm_print.port}") for c in connections]
+
+    def run(printer_connection, paths, result):
+        for path in paths:
+            try:
+                stats = printer_connection.send_file(path)
+            except (OSError, EscposError) as e:
+                # 途中まで送信した接続は使い回さない（次のファイルの送信時に接続し直す）
+                printer_connection.close()
+                result.failures.append((path, e))
+                logger.error(f"{result.name}: {path} を送信できません: {e}")
+                continue
+            result.files += 1
+            result.bytes += stats.sent_bytes
+            result.seconds += stats.seconds
+            if on_file is not None:
+                on_file(path, result, stats)
+        printer_connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(c, paths, result), name=f"replay-{result.name}", daemon=True)
+               for c, paths, result in zip(connections, assign_files(files, len(connections)), results)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
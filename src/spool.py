@@ -0,0 +1,198 @@
+from pathlib import Path
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+
+# スプールの保存先
+SPOOL_DIR = Path(__file__).resolve().parent / "../cache/spool"
+# スプールの形式バージョン
+SPOOL_FORMAT_VERSION = 1
+# 再送の待ち時間の初期値・上限（秒、失敗するたびに倍）
+SPOOL_RETRY_BASE_SECONDS = 2
+SPOOL_RETRY_MAX_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+def retry_delay(attempts):
+    """
+    再送までの待ち時間（指数バックオフ）
+
+    :param int attempts: これまでの送信の失敗回数
+    :rtype: float
+    """
+    return min(SPOOL_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), SPOOL_RETRY_MAX_SECONDS)
+
+
+def _write_atomic(path, data):
+    """
+    ファイルを書き込み途中の状態が残らないように書き込み（一時ファイルに書いてから置き換え）
+
+    :param Path path: 書き込み先
+    :param bytes data: 書き込む内容
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SpoolEntry:
+    """
+    スプールに保存した印刷ジョブ1件（印刷データ<ID>.escposと情報<ID>.jsonの組）
+    """
+    def __init__(self, spool, entry_id, metadata):
+        """
+        スプールのジョブの初期化
+
+        :param PrintSpool spool: 保存先のスプール
+        :param str entry_id: ID（保存順に並ぶ文字列）
+        :param dict metadata: ジョブの情報
+        """
+        self.spool = spool
+        self.entry_id = entry_id
+        self.metadata = metadata
+
+    @property
+    def data_path(self):
+        """
+        印刷データのファイルのパス
+
+        :rtype: Path
+        """
+        return self.spool.directory / f"{self.entry_id}.escpos"
+
+    @property
+    def metadata_path(self):
+        """
+        情報ファイルのパス
+
+        :rtype: Path
+        """
+        return self.spool.directory / f"{self.entry_id}.json"
+
+    @property
+    def attempts(self):
+        """
+        送信に失敗した回数
+
+        :rtype: int
+        """
+        return self.metadata.get("attempts", 0)
+
+    def load(self):
+        """
+        印刷データを読み込み
+
+        :rtype: bytes
+        """
+        return self.data_path.read_bytes()
+
+
+class PrintSpool:
+    """
+    印刷ジョブのスプール\n
+    コンパイル済みの印刷データを送信前にディスクへ保存し、送信を終えたら削除します。
+    アプリの異常終了・プリンタの再起動・ネットワークの切断で送れなかったジョブは、次回の起動時に保存順に再開できます。
+    印刷データを先に書き込み、情報ファイルを最後に置き換えるため、情報ファイルがあるジョブは常に完全な状態です。
+    """
+    def __init__(self, directory=SPOOL_DIR):
+        """
+        スプールの初期化（保存先のフォルダがない場合は作成）
+
+        :param directory: 保存先のフォルダ
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, data, **metadata):
+        """
+        印刷データをスプールに保存
+
+        :param bytes data: ESC/POSのバイト列
+        :param metadata: ジョブの情報（ジョブ番号など、JSONに変換できる値）
+        :return: 保存したジョブ
+        :rtype: SpoolEntry
+        """
+        with self._lock:
+            entry_id = f"{time.time_ns():020d}-{next(self._numbers):06d}"
+        metadata = dict(metadata, version=SPOOL_FORMAT_VERSION, created=time.time(), bytes=len(data), attempts=0)
+        entry = SpoolEntry(self, entry_id, metadata)
+        _write_atomic(entry.data_path, data)
+        self._write_metadata(entry)
+        logger.debug(f"スプールに保存しました: {entry_id} {len(data)}バイト")
+        return entry
+
+    def record_failure(self, entry, error):
+        """
+        送信の失敗を記録（失敗回数は再開時の待ち時間に使用）
+
+        :param SpoolEntry entry: スプールのジョブ
+        :param error: 発生したエラー
+        """
+        entry.metadata["attempts"] = entry.attempts + 1
+        entry.metadata["last_error"] = str(error)
+        try:
+            self._write_metadata(entry)
+        except OSError as e:
+            logger.warning(f"スプールの情報を更新できません: {entry.entry_id}: {e}")
+
+    def remove(self, entry):
+        """
+        送信を終えた（または中止した）ジョブをスプールから削除（情報ファイルを先に削除）
+
+        :param SpoolEntry entry: スプールのジョブ
+        """
+        for path in (entry.metadata_path, entry.data_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"スプールのファイルを削除できません: {path}: {e}")
+
+    def pending(self):
+        """
+        未送信のジョブを保存順に取得（書き込み途中で中断したファイルは削除するため、ジョブの保存を始める前に呼び出し）
+
+        :rtype: list[SpoolEntry]
+        """
+        entries = []
+        for path in sorted(self.directory.glob("*.json")):
+            entry_id = path.stem
+            try:
+                metadata = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"スプールの情報を読み込めません: {path}: {e}")
+                continue
+            entry = SpoolEntry(self, entry_id, metadata)
+            if metadata.get("version") != SPOOL_FORMAT_VERSION or not entry.data_path.exists():
+                logger.warning(f"スプールのジョブを再開できないため削除します: {entry_id}")
+                self.remove(entry)
+                continue
+            entries.append(entry)
+        # 情報ファイルのない印刷データ・一時ファイルは書き込み途中で中断したもの
+        ids = {entry.entry_id for entry in entries}
+        for path in list(self.directory.glob("*.tmp")) + list(self.directory.glob("*.escpos")):
+            if path.suffix == ".tmp" or path.stem not in ids:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+        return entries
+
+    def _write_metadata(self, entry):
+        """
+        情報ファイルを書き込み
+
+        :param SpoolEntry entry: スプールのジョブ
+        """
+        _write_atomic(entry.metadata_path, json.dumps(entry.metadata, ensure_ascii=False).encode("utf-8"))
@@ -0,0 +1,186 @@
+import time
+import logging
+import threading
+
+from escpos.exceptions import Error as EscposError
+
+# 状態を問い合わせる間隔（秒）
+STATUS_POLL_INTERVAL = 5
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+class PrinterStatus:
+    """
+    プリンタの状態（リアルタイムステータスの応答から作成）
+    """
+    def __init__(self, reachable=True, online=True, cover_open=False, paper_near_end=False, paper_end=False,
+                 error=False, message=None):
+        """
+        プリンタの状態の初期化
+
+        :param bool reachable: 接続できたかどうか
+        :param bool online: オンラインかどうか
+        :param bool cover_open: カバーが開いているかどうか
+        :param bool paper_near_end: ロール紙の残りが少ないかどうか
+        :param bool paper_end: ロール紙がないかどうか
+        :param bool error: エラーが発生しているかどうか（オートカッターエラー・復帰不可能エラーなど）
+        :param str message: 接続できない場合のエラー内容
+        """
+        self.reachable = reachable
+        self.online = online
+        self.cover_open = cover_open
+        self.paper_near_end = paper_near_end
+        self.paper_end = paper_end
+        self.error = error
+        self.message = message
+        self.checked_at = time.time()
+
+    @classmethod
+    def from_responses(cls, responses):
+        """
+        DLE EOT 1～4 の応答から状態を作成
+
+        :param responses: n=1（プリンタ）・n=2（オフライン要因）・n=3（エラー要因）・n=4（ロール紙）の応答
+        :rtype: PrinterStatus
+        """
+        printer, offline, error, paper = responses
+        return cls(online=not printer & 0x08,
+                   cover_open=bool(offline & 0x04),
+                   paper_near_end=bool(paper & 0x0C),
+                   paper_end=bool(paper & 0x60 or offline & 0x20),
+                   error=bool(offline & 0x40 or error & 0x68))
+
+    @classmethod
+    def unreachable(cls, message):
+        """
+        接続できない場合の状態を作成
+
+        :param str message: エラー内容
+        :rtype: PrinterStatus
+        """
+        return cls(reachable=False, online=False, message=message)
+
+    @property
+    def ready(self):
+        """
+        印刷できる状態かどうか（ロール紙の残り少は印刷可能）
+
+        :rtype: bool
+        """
+        return self.reachable and self.online and not (self.cover_open or self.paper_end or self.error)
+
+    @property
+    def blocked(self):
+        """
+        プリンタの応答で印刷できない要因（カバーオープン・用紙切れ・エラー）が確認されているかどうか\n
+        接続できなかった場合は一時的なこと（再起動直後・他の端末が印刷中など）があるため含めません。
+
+        :rtype: bool
+        """
+        return self.reachable and (self.cover_open or self.paper_end or self.error)
+
+    def describe(self):
+        """
+        状態の説明
+
+        :rtype: str
+        """
+        if not self.reachable:
+            return f"接続できません: {self.message}"
+        problems = []
+        if self.cover_open:
+            problems.append("カバーオープン")
+        if self.paper_end:
+            problems.append("用紙切れ")
+        if self.error:
+            problems.append("エラー")
+        if not self.online and not problems:
+            problems.append("オフライン")
+        if self.paper_near_end:
+            problems.append("用紙残り少")
+        return "・".join(problems) if problems else "正常"
+
+
+class StatusMonitor:
+    """
+    プリンタの状態を定期的に問い合わせて保持するクラス\n
+    問い合わせにはリアルタイムステータス（DLE EOT）を使い、結果は接続の状態として印刷前の確認に使われます。
+    印刷中は問い合わせを行わず、直前の状態を保持します。
+    """
+    def __init__(self, printer_connection, interval=STATUS_POLL_INTERVAL, on_change=None):
+        """
+        状態監視の初期化
+
+        :param printer_connection: 監視するプリンタとの接続（connection.PrinterConnection）
+        :param interval: 問い合わせの間隔（秒）
+        :param on_change: 状態が変わったときの通知先（StatusMonitor, PrinterStatusを引数に呼び出し、監視スレッドから呼ばれる）
+        """
+        self.connection = printer_connection
+        self.interval = interval
+        self.on_change = on_change
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def name(self):
+        """
+        プリンタの表示名（IPアドレス:ポート）
+
+        :rtype: str
+        """
+        return f"{self.connection.tm_print.host}:{self.connection.tm_print.port}"
+
+    @property
+    def status(self):
+        """
+        最新の状態（未確認の場合はNone）
+
+        :rtype: PrinterStatus
+        """
+        return self.connection.status
+
+    def start(self):
+        """
+        監視を開始
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"status-monitor-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        監視を停止（問い合わせ中の場合は、その問い合わせが終わったところで停止）
+        """
+        self._stop_event.set()
+
+    def poll(self):
+        """
+        状態を1回問い合わせ、保持している状態を更新
+
+        :return: 最新の状態（印刷中で問い合わせなかった場合は直前の状態）
+        :rtype: PrinterStatus
+        """
+        try:
+            responses = self.connection.query_status()
+            if responses is None:
+                return self.connection.status
+            status = PrinterStatus.from_responses(responses)
+        except (OSError, EscposError) as e:
+            status = PrinterStatus.unreachable(str(e))
+        previous = self.connection.status
+        self.connection.status = status
+        if previous is None or previous.describe() != status.describe():
+            logger.info(f"{self.name}: {status.describe()}")
+            if self.on_change is not None:
+                self.on_change(self, status)
+        return status
+
+    def _run(self):
+        """
+        監視スレッド：一定間隔で状態を問い合わせ
+        """
+        while not self._stop_event.is_set():
+            self.poll()
+            self._stop_event.wait(self.interval)
@@ -0,0 +1,268 @@
+from pathlib import Path
+import os
+import re
+import time
+import pickle
+import hashlib
+import logging
+
+import document
+from printer import PrinterHandler, TextTagParser
+
+# テンプレート（文書ファイル）の保存先
+TEMPLATE_DIR = Path(__file__).resolve().parent / "../templates"
+# コンパイル済みテンプレートの保存先
+TEMPLATE_CACHE_DIR = Path(__file__).resolve().parent / "../cache/templates"
+# コンパイル済みテンプレートの形式バージョン（形式を変えたら上げる）
+TEMPLATE_FORMAT_VERSION = 1
+# 差し込み項目の記法（例: {name}）
+PLACEHOLDER_PATTERN = re.compile(r"\{(\w+)\}")
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+
+class CompiledTemplate:
+    """
+    コンパイル済みテンプレート\n
+    固定部分はESC/POSのバイト列、差し込み項目を含むコマンドはそのまま保持し、印刷時に差し込み項目だけを描画して連結します。
+    """
+    def __init__(self, key, commands, segments, render_mode, should_cut_paper):
+        """
+        コンパイル済みテンプレートの初期化
+
+        :param str key: コンパイル時のキャッシュキー
+        :param commands: タグ解析結果のコマンドのリスト
+        :param segments: バイト列、または差し込み項目を含むコマンドのリスト
+        :param str render_mode: コンパイル時の印字方式
+        :param bool should_cut_paper: 印刷後に用紙をカットするかどうか
+        """
+        self.key = key
+        self.commands = commands
+        self.segments = segments
+        self.render_mode = render_mode
+        self.should_cut_paper = should_cut_paper
+
+    @property
+    def placeholders(self):
+        """
+        テンプレート内の差し込み項目名（出現順）
+
+        :rtype: list[str]
+        """
+        names = []
+        for _, arg_command, _ in self.commands:
+            if isinstance(arg_command, str):
+                for name in PLACEHOLDER_PATTERN.findall(arg_command):
+                    if name not in names:
+                        names.append(name)
+        return names
+
+    @property
+    def logos(self):
+        """
+        テンプレート内のロゴ名（送信前にプリンタへ登録するため）
+
+        :rtype: tuple[str]
+        """
+        return PrinterHandler.logo_names(self.commands)
+
+    def render(self, handler, values):
+        """
+        差し込み項目に値を設定して印刷データを作成
+
+        :param handler: PrinterHandler
+        :param dict values: 差し込み項目名と値
+        :return: ESC/POSのバイト列
+        :rtype: bytes
+        """
+        if self.render_mode == "raster":
+            # 一括ラスター印字は文書全体で1枚の画像になるため、値を差し込んでから全体をコンパイル
+            return handler.compile(fill_commands(self.commands, values), enable_text_print=True,
+                                   should_cut_paper=self.should_cut_paper)
+        data = bytearray()
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                data += segment
+                continue
+            arg_type, arg_command, arg_dict = segment
+            data += handler.compile_command(arg_type, fill(arg_command, values), arg_dict)
+        return bytes(data)
+
+
+def fill(text, values):
+    """
+    文字列の差し込み項目を値に置き換え
+
+    :param str text: 差し込み項目を含む文字列
+    :param dict values: 差し込み項目名と値
+    :return: 置き換え後の文字列
+    :rtype: str
+    """
+    def replace(match):
+        name = match.group(1)
+        if values.get(name) is None:
+            raise ValueError(f"差し込み項目 '{name}' の値がありません")
+        return str(values[name])
+    return PLACEHOLDER_PATTERN.sub(replace, text)
+
+
+def fill_commands(commands, values):
+    """
+    コマンド列の差し込み項目を値に置き換え
+
+    :param commands: タグ解析結果のコマンドのリスト
+    :param dict values: 差し込み項目名と値
+    :return: 置き換え後のコマンドのリスト
+    :rtype: list[tuple]
+    """
+    return [(arg_type, fill(arg_command, values) if isinstance(arg_command, str) else arg_command, arg_dict)
+            for arg_type, arg_command, arg_dict in commands]
+
+
+def compile_template(handler, blocks, name=None, should_cut_paper=False, cache_dir=TEMPLATE_CACHE_DIR):
+    """
+    テンプレートをコンパイル（名前を指定した場合はディスクにキャッシュ）\n
+    フォントファイル・印字幅・印字方式・プリンタ設定が変わった場合は再コンパイルします。
+
+    :param handler: PrinterHandler
+    :param blocks: 行ごとの(文字列, タグ)のリスト
+    :param str name: テンプレート名（キャッシュファイル名）
+    :param bool should_cut_paper: 印刷後に用紙をカットするかどうか
+    :param cache_dir: コンパイル済みテンプレートの保存先
+    :return: コンパイル済みテンプレート
+    :rtype: CompiledTemplate
+    """
+    commands = TextTagParser(blocks=blocks).parse()
+    key = _template_key(handler, commands, should_cut_paper)
+    cache_file = Path(cache_dir) / f"{name}.pkl" if name else None
+    if cache_file is not None:
+        template = _load_cached(cache_file, key)
+        if template is not None:
+            logger.info(f"テンプレート: キャッシュから読み込み {name}")
+            return template
+
+    started = time.perf_counter()
+    segments = _compile_segments(handler, commands, should_cut_paper) if handler.render_mode != "raster" else []
+    template = CompiledTemplate(key, commands, segments, handler.render_mode, should_cut_paper)
+    logger.info(f"テンプレート: コンパイル {(time.perf_counter() - started) * 1000:.1f}ms 差し込み項目 {template.placeholders}")
+
+    if cache_file is not None:
+        try:
+            _save_cached(cache_file, template)
+        except OSError as e:
+            logger.warning(f"コンパイル済みテンプレートを保存できません: {e}")
+    return template
+
+
+def load_template(path):
+    """
+    テンプレート（文書ファイル）を読み込み
+
+    :param path: 文書ファイルのパス
+    :return: 行ごとの(文字列, タグ)のリスト
+    :rtype: list[list[tuple]]
+    """
+    return document.load_document(path)
+
+
+def save_template(path, blocks):
+    """
+    テンプレート（文書ファイル）を保存
+
+    :param path: 保存先のパス
+    :param blocks: 行ごとの(文字列, タグ)のリスト
+    """
+    document.save_document(path, blocks)
+
+
+def _compile_segments(handler, commands, should_cut_paper):
+    """
+    固定部分をバイト列に変換し、差し込み項目を含むコマンドと交互に並べる
+
+    :param handler: PrinterHandler
+    :param commands: タグ解析結果のコマンドのリスト
+    :param bool should_cut_paper: 印刷後に用紙をカットするかどうか
+    :return: バイト列、または差し込み項目を含むコマンドのリスト
+    :rtype: list
+    """
+    segments = []
+    pending = []  # 固定部分のコマンド
+
+    def append_bytes(data):
+        # 連続する固定部分は1つのバイト列にまとめる
+        if segments and isinstance(segments[-1], bytes):
+            segments[-1] += data
+        elif data:
+            segments.append(data)
+
+    def flush():
+        if not pending:
+            return
+        append_bytes(b"".join(handler.compile_command(*command) for command in pending))
+        pending.clear()
+
+    for arg_type, arg_command, arg_dict in commands:
+        if not (isinstance(arg_command, str) and PLACEHOLDER_PATTERN.search(arg_command)):
+            pending.append((arg_type, arg_command, arg_dict))
+            continue
+        if arg_type != "jp2":
+            # バーコードは内容全体を差し込み時に作成
+            flush()
+            segments.append((arg_type, arg_command, arg_dict))
+            continue
+        # テキストは差し込み項目の前後を固定部分として分割
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(arg_command):
+            if match.start() > position:
+                pending.append((arg_type, arg_command[position:match.start()], arg_dict))
+            flush()
+            segments.append((arg_type, match.group(0), arg_dict))
+            position = match.end()
+        if position < len(arg_command):
+            pending.append((arg_type, arg_command[position:], arg_dict))
+    flush()
+
+    if should_cut_paper:
+        append_bytes(handler.cut_command())
+    return segments
+
+
+def _template_key(handler, commands, should_cut_paper):
+    """
+    コンパイル済みテンプレートのキャッシュキーを作成（コマンド列・印字幅・印字方式・設定・フォントファイルのハッシュ）
+
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    digest.update(repr(TEMPLATE_FORMAT_VERSION).encode("utf-8"))
+    digest.update(handler._compile_key(commands, None, True, False, should_cut_paper).encode("utf-8"))
+    digest.update(repr(handler.font_fingerprint).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _load_cached(cache_file, key):
+    """
+    保存済みのコンパイル済みテンプレートを読み込み（存在しない、またはキーが異なる場合はNone）
+
+    :rtype: CompiledTemplate
+    """
+    try:
+        with open(cache_file, "rb") as f:
+            template = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if not isinstance(template, CompiledTemplate) or template.key != key:
+        return None
+    return template
+
+
+def _save_cached(cache_file, template):
+    """
+    コンパイル済みテンプレートを保存（一時ファイルに書き込んでから置き換え）
+    """
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_suffix(cache_file.suffix + ".tmp")
+    with open(tmp_file, "wb") as f:
+        pickle.dump(template, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
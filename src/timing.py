@@ -0,0 +1,304 @@
+from pathlib import Path
+import json
+import time
+import logging
+import threading
+
+"""
+処理時間の計測
+印刷ジョブ・プレビュー更新ごとに、段階（タグ解析・コマンド種別ごとの出力・ディザリング・接続・送信など）の
+所要時間とバイト数を記録し、1件1行のJSON（JSONL）としてファイルに追記します。
+計測が無効な場合、各段階の計測は何もしない共通のオブジェクトを返すだけなので、ほとんど負荷になりません。
+ファイルに記録しない場合でも、通知先（メトリクスの集計など）が登録されている間は計測して通知します。
+
+使い方:
+    record = timing.begin("print", job=1)
+    with timing.activate(record):
+        with timing.stage("parse"):
+            ...
+    timing.finish(record)
+"""
+
+# 計測結果の保存先
+TIMING_LOG_FILE = Path(__file__).resolve().parent / "../cache/timing.jsonl"
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)  # デバッグ時 INFO --> DEBUG
+
+_enabled = False  # 計測するかどうか（ファイルへの記録・通知先のいずれかがある場合）
+_log_enabled = False
+_log_file = TIMING_LOG_FILE
+_listeners = []  # 計測を終えた記録の通知先
+_write_lock = threading.Lock()
+_local = threading.local()  # スレッドごとの計測中の記録
+
+
+def configure(enabled, log_file=TIMING_LOG_FILE):
+    """
+    ファイルへの記録の有効・無効と保存先を設定
+
+    :param bool enabled: ファイルに記録するかどうか
+    :param log_file: 保存先のファイル
+    """
+    global _enabled, _log_enabled, _log_file
+    _log_enabled = bool(enabled)
+    _log_file = Path(log_file)
+    _enabled = _log_enabled or bool(_listeners)
+
+
+def add_listener(callback):
+    """
+    計測を終えた記録の通知先を登録（登録中はファイルに記録しない場合も計測）
+
+    :param callback: 通知先（TimingRecordを引数に呼び出し、処理したスレッドから呼ばれる）
+    """
+    global _enabled
+    _listeners.append(callback)
+    _enabled = True
+
+
+def remove_listener(callback):
+    """
+    通知先の登録を解除
+
+    :param callback: add_listenerで登録した通知先
+    """
+    global _enabled
+    if callback in _listeners:
+        _listeners.remove(callback)
+    _enabled = _log_enabled or bool(_listeners)
+
+
+def is_enabled():
+    """
+    計測が有効かどうか
+
+    :rtype: bool
+    """
+    return _enabled
+
+
+class TimingRecord:
+    """
+    1件の処理（印刷ジョブ・プレビュー更新）の計測結果
+    """
+    def __init__(self, kind, **fields):
+        """
+        計測結果の初期化
+
+        :param str kind: 処理の種類（"print"・"preview"など）
+        :param fields: 記録に含める項目（ジョブ番号など）
+        """
+        self.kind = kind
+        self.fields = fields
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        self.finished = None  # 計測を終えた時刻（time.monotonic()の値）
+        self.stages = []  # (段階, 所要時間（秒）, バイト数)のリスト
+
+    def add(self, name, seconds, nbytes=None):
+        """
+        段階の計測結果を追加
+
+        :param str name: 段階の名前
+        :param float seconds: 所要時間（秒）
+        :param int nbytes: バイト数（ない場合はNone）
+        """
+        self.stages.append((name, seconds, nbytes))
+
+    def to_dict(self):
+        """
+        記録用の辞書に変換
+
+        :rtype: dict
+        """
+        stages = []
+        for name, seconds, nbytes in self.stages:
+            stage = {"stage": name, "ms": round(seconds * 1000, 3)}
+            if nbytes is not None:
+                stage["bytes"] = nbytes
+            stages.append(stage)
+        return dict(self.fields, kind=self.kind, started_at=self.started_at,
+                    total_ms=round(self.seconds * 1000, 3), stages=stages)
+
+    @property
+    def seconds(self):
+        """
+        開始から終了（終了前の場合は現在）までの時間（秒）
+
+        :rtype: float
+        """
+        return (self.finished or time.monotonic()) - self.started
+
+
+class _Stage:
+    """
+    段階の計測（withで囲んだ範囲の所要時間と、出力先のバッファの増加量を記録）
+    """
+    __slots__ = ("record", "name", "buffer", "nbytes", "started", "start_length")
+
+    def __init__(self, record, name, buffer, nbytes):
+        self.record = record
+        self.name = name
+        self.buffer = buffer
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start_length = len(self.buffer) if self.buffer is not None else 0
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.started
+        nbytes = len(self.buffer) - self.start_length if self.buffer is not None else self.nbytes
+        self.record.add(self.name, elapsed, nbytes)
+        return False
+
+
+class _NullContext:
+    """
+    何もしないコンテキスト（計測が無効な場合に共通で使用）
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class _Activation:
+    """
+    記録を現在のスレッドの計測先にする（終了時に元の計測先に戻す）
+    """
+    __slots__ = ("record", "previous")
+
+    def __init__(self, record):
+        self.record = record
+
+    def __enter__(self):
+        self.previous = getattr(_local, "record", None)
+        _local.record = self.record
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.record = self.previous
+        return False
+
+
+def begin(kind, **fields):
+    """
+    処理1件の計測を開始
+
+    :param str kind: 処理の種類
+    :param fields: 記録に含める項目
+    :return: 計測結果（計測が無効な場合はNone）
+    :rtype: TimingRecord
+    """
+    return TimingRecord(kind, **fields) if _enabled else None
+
+
+def activate(record):
+    """
+    記録を現在のスレッドの計測先にするコンテキストマネージャ（印刷ジョブを別のスレッドで続けて処理する場合など）
+
+    :param TimingRecord record: 計測結果（Noneの場合は何もしない）
+    """
+    return _Activation(record) if record is not None else _NULL_CONTEXT
+
+
+def stage(name, buffer=None, nbytes=None):
+    """
+    現在のスレッドの計測先に段階を記録するコンテキストマネージャ（計測が無効・計測先がない場合は何もしない）
+
+    :param str name: 段階の名前
+    :param buffer: 出力先のバッファ（指定時は段階の間に増えたバイト数を記録）
+    :param int nbytes: 記録するバイト数（バッファを指定しない場合）
+    """
+    if not _enabled:
+        return _NULL_CONTEXT
+    record = getattr(_local, "record", None)
+    if record is None:
+        return _NULL_CONTEXT
+    return _Stage(record, name, buffer, nbytes)
+
+
+def mark(name, nbytes=None):
+    """
+    所要時間のない出来事（キャッシュヒットなど）を現在のスレッドの計測先に記録
+
+    :param str name: 出来事の名前
+    :param int nbytes: バイト数
+    """
+    if not _enabled:
+        return
+    record = getattr(_local, "record", None)
+    if record is not None:
+        record.add(name, 0.0, nbytes)
+
+
+def finish(record, **fields):
+    """
+    処理1件の計測を終了し、ファイルに追記・通知先に通知
+
+    :param TimingRecord record: 計測結果（Noneの場合は何もしない）
+    :param fields: 記録に追加する項目（処理結果など）
+    """
+    if record is None:
+        return
+    record.fields.update(fields)
+    record.finished = time.monotonic()
+    for callback in list(_listeners):
+        try:
+            callback(record)
+        except Exception as e:
+            logger.warning(f"計測結果の通知に失敗しました: {e}")
+    if not _log_enabled:
+        return
+    line = json.dumps(record.to_dict(), ensure_ascii=False)
+    try:
+        with _write_lock:
+            _log_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(_log_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"計測結果を保存できません: {e}")
+
+
+class _Measure:
+    """
+    処理1件の計測（開始・計測先の設定・終了をまとめて行う）
+    """
+    __slots__ = ("record", "activation")
+
+    def __init__(self, kind, **fields):
+        self.record = begin(kind, **fields)
+        self.activation = activate(self.record)
+
+    def __enter__(self):
+        self.activation.__enter__()
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.activation.__exit__(exc_type, exc_value, traceback)
+        if exc_value is not None:
+            finish(self.record, error=str(exc_value))
+        else:
+            finish(self.record)
+        return False
+
+
+def measure(kind, **fields):
+    """
+    処理1件をwithで囲んで計測するコンテキストマネージャ（計測が無効な場合は何もしない）
+
+    :param str kind: 処理の種類
+    :param fields: 記録に含める項目
+    """
+    if not _enabled:
+        return _NULL_CONTEXT
+    return _Measure(kind, **fields)
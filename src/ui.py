@@ -1,19 +1,18 @@
 from functools import lru_cache
 from pathlib import Path
 from tkinterdnd2 import DND_FILES, TkinterDnD
-from tkinter import Tk, Label, Text, Button, Entry, Scrollbar, Frame, Canvas, Toplevel, Radiobutton, IntVar, StringVar, Checkbutton, BooleanVar, Scale, LabelFrame, TclError, font, simpledialog, HORIZONTAL, messagebox
+from tkinter import Tk, Label, Text, Button, Entry, Scrollbar, Frame, Canvas, Toplevel, Radiobutton, IntVar, StringVar, Checkbutton, BooleanVar, Scale, LabelFrame, TclError, font, simpledialog, filedialog, HORIZONTAL, messagebox
 from pystray import Icon, MenuItem, Menu
-from PIL import Image, ImageDraw, ImageTk, ImageGrab, ImageEnhance, ImageOps, ImageFilter
+from PIL import Image, ImageDraw, ImageTk, ImageGrab
 
 import re
 import sys
+import time
 import threading
 import queue
 import keyboard
 import os
-import numpy as np
 import inspect
-import unicodedata
 import ctypes
 
 # サブモジュールのディレクトリ名（例: "tm88iv"）
@@ -24,117 +23,51 @@ if not os.path.isdir(os.path.abspath(submodule_dir)):
                          f"git submodule update --init --recursive を実行してください。\n")
     sys.exit(1)
 
-from config import ConfigHandler # config.pyからのインポート
-from printer import PrinterHandler # printer.pyからのインポート
+from config import ConfigHandler, build_tm88iv_config, missing_files # config.pyからのインポート
+from printer import PrinterHandler, TextTagParser # printer.pyからのインポート
 from ui_settings import SettingsWindow # ui_settings.pyからのインポート
+import glyph_cache # glyph_cache.pyからのインポート
+import display_width # display_width.pyからのインポート
+from document import BARCODE_TAGS, CUSTOM_TAGS # document.pyからのインポート
+import template # template.pyからのインポート
+from image_pipeline import FILTER_MAP, process_image # image_pipeline.pyからのインポート
+from batch import BatchPrintJob # batch.pyからのインポート
+import connection # connection.pyからのインポート
+from print_queue import PrintJob, PrintQueue, JOB_CANCELLED, JOB_FAILED, JOB_WAITING # print_queue.pyからのインポート
+from printer_pool import PoolMember, PrinterPool, pool_endpoints # printer_pool.pyからのインポート
+from status_monitor import StatusMonitor, STATUS_POLL_INTERVAL # status_monitor.pyからのインポート
+from spool import PrintSpool # spool.pyからのインポート
+import timing # timing.pyからのインポート
+import metrics # metrics.pyからのインポート
 
 # 定数
 PRINTER_IMAGE_MAX_WIDTH = 512
 PRINTER_IMAGE_MAX_HEIGHT = 960 # ほぼ未使用
 
-BARCODE_TAGS = {
-    "QR":    {"pattern": r"<QR:(.+?)>",    "tag": "qr_tag",   "bg": "#e8fce8", "fg": "#006600"},
-    "ITF":   {"pattern": r"<ITF:(.+?)>",   "tag": "itf_tag",  "bg": "#f4e8ff", "fg": "#6a1b9a"},
-    "EAN13": {"pattern": r"<EAN13:(.+?)>", "tag": "ean_tag",  "bg": "#eeeeee", "fg": "#222222"},
-    "C39":   {"pattern": r"<C39:(.+?)>",   "tag": "c39_tag",  "bg": "#e7f0fa", "fg": "#004488"},
-    "C128":  {"pattern": r"<C128:(.+?)>",  "tag": "c128_tag", "bg": "#fff3e0", "fg": "#a63d00"},
-}
-
-# 色付け用タグ（配置用タグとは分離）
-CUSTOM_TAGS = {
-    "HR": {"pattern": r"<HR>", "tag": "hr_tag", "bg": "#E0E0E0", "fg": "#757575"},
-    "ALIGN_CENTER_COLOR": {"pattern": r"<ALIGN:CENTER>", "tag": "align_center_color", "bg": "#90CAF9", "fg": "#1976D2"},
-    "ALIGN_LEFT_COLOR":   {"pattern": r"<ALIGN:LEFT>",   "tag": "align_left_color",   "bg": "#A5D6A7", "fg": "#388E3C"},
-    "ALIGN_RIGHT_COLOR":  {"pattern": r"<ALIGN:RIGHT>",  "tag": "align_right_color",  "bg": "#FFE0B2", "fg": "#BF360C"},
-}
-
 # タグのグループ化
 STYLE_TAG_GROUPS = {
     "size": ["bold", "four", "vert"],
     "decoration": ["underline", "invert"]
 }
 
-# Bayer マトリックスを生成
-@lru_cache(maxsize=4)
-def bayer_matrix(n):
-    """
-    Bayer マトリックスを生成
-
-    :param int n: マトリクスのサイズ（2, 4, 8 のいずれか）
-    :return: Bayer マトリックス
-    :rtype: numpy.ndarray
-    :raises ValueError: 未対応のサイズの場合
-    """
-    if n == 1:
-        return np.array([[0]])
-    elif n in (2, 4, 8):
-        smaller_matrix = bayer_matrix(n // 2)
-        return np.block([
-            [4 * smaller_matrix, 4 * smaller_matrix + 2],
-            [4 * smaller_matrix + 3, 4 * smaller_matrix + 1]
-        ]) / (n * n)
-    else:
-        raise ValueError("bayer_matrix: 未対応のサイズです（2, 4, 8 のみ対応）")
-
-
-# random マトリックスを生成
-@lru_cache(maxsize=100)
-def random_matrix(n, seed=0):
-    """
-    random マトリックスを生成
+# 行番号欄の再描画間隔（ミリ秒、約1フレーム）
+LINE_INFO_REDRAW_DELAY = 16
+# テキスト読込：1回に挿入する行数
+TEXT_IMPORT_CHUNK_LINES = 1000
+# テキスト読込：この行数を超える貼り付けは分割して挿入
+TEXT_IMPORT_PASTE_LINES = 2000
 
-    :param int n: マトリクスのサイズ（2, 4, 8 のいずれか）
-    :param int seed: 乱数シード値
-    :return: 正規化されたランダムマトリックス
-    :rtype: numpy.ndarray
+# 文字列の可視幅を計算（行テキスト単位でキャッシュ）
+@lru_cache(maxsize=4096)
+def visual_width(s):
     """
-    np.random.seed(seed)  # 再現性のためにシードを固定
-    matrix = np.random.rand(n, n)
-    flat = matrix.flatten()
-    ranks = flat.argsort().argsort()  # ランク化（0〜n^2-1）
-    normalized = ranks.reshape((n, n)) / (n * n)
-    return normalized
+    文字列の可視幅を計算（事前計算済みの幅テーブルを参照）
 
-
-# clusterd マトリックスを生成
-@lru_cache(maxsize=4)
-def clustered_matrix(n):
+    :param str s: 対象の文字列
+    :return: 可視幅（全角文字は2、半角文字は1として計算）
+    :rtype: int
     """
-    クラスターマトリックスを生成
-
-    :param int n: マトリクスのサイズ（2, 4, 8 のいずれか）
-    :return: クラスターマトリックス
-    :rtype: numpy.ndarray
-    :raises ValueError: 未対応のサイズの場合（2, 4, 8 のみ対応）
-    """
-    # 4x4クラスタマトリクス（Ulichney の方式ベース）
-    base_4x4 = np.array([
-        [12,  5,  6, 13],
-        [ 4,  0,  1,  7],
-        [11,  3,  2,  8],
-        [15, 10,  9, 14]
-    ]) / 16.0
-
-    # 8x8クラスタマトリクス（Ulichney の方式ベース）
-    base_8x8 = np.array([
-        [36, 16, 28, 48, 37, 17, 29, 49],
-        [12,  0,  4, 20, 13,  1,  5, 21],
-        [44, 24, 32, 52, 45, 25, 33, 53],
-        [ 8,  2,  6, 22,  9,  3,  7, 23],
-        [40, 18, 30, 50, 41, 19, 31, 51],
-        [14, 10,  6, 26, 15, 11,  7, 27],
-        [46, 26, 34, 54, 47, 27, 35, 55],
-        [10,  6,  8, 24, 11,  7,  9, 25]
-    ]) / 64.0
-
-    if n == 4:
-        return base_4x4
-    elif n == 8:
-        return base_8x8
-    elif n == 2:
-        return np.array([[0, 2], [3, 1]]) / 4.0
-    else:
-        raise ValueError("clustered_matrix: 未対応のサイズです（2, 4, 8 のみ対応）")
+    return display_width.text_width(s)
 
 
 class InptDialog(simpledialog.Dialog):
@@ -209,6 +142,8 @@ class App(TkinterDnD.Tk):
         self.original_image = None
         self.processed_image = None
         self.icon = None
+        self.icon_image = None
+        self.status_monitors = [] # プリンタの状態監視
         self.dither_mode = IntVar(value=1) # ディザリング(1)、２値化(2)、ハイブリッド(3)
         self.widthforce_mode = BooleanVar(value=True) # 横幅固定の有効/無効
         self.rotate_load_enabled = BooleanVar(value=False) # 読込時90°回転の有効/無効
@@ -220,24 +155,12 @@ class App(TkinterDnD.Tk):
         self.image_out_enabled = BooleanVar(value=True) # 画像印刷の有効/無効
         self.text_out_enabled = BooleanVar(value=True) # テキスト印刷の有効/無効
         self._is_handling_modified = False  # テキストウィジェットの変更を処理中かどうか
+        self._is_importing_text = False  # テキストを分割して読込中かどうか（読込中はタグの再適用を保留）
+        self._line_info_after_id = None  # 行番号欄の再描画予約ID
+        self._line_info_items = []  # 行番号欄のキャンバスアイテム(背景, 行番号, 可視幅)
+        self._line_info_state = []  # 行番号欄の描画済み状態(Y座標, 行番号, 可視幅)
 
-        self.filter_map = {
-            "FIND_EDGES": ImageFilter.FIND_EDGES,
-            "EDGE_ENHANCE": ImageFilter.EDGE_ENHANCE,
-            "EDGE_ENHANCE_MORE": ImageFilter.EDGE_ENHANCE_MORE,
-            "CONTOUR": ImageFilter.CONTOUR,
-            "EMBOSS": ImageFilter.EMBOSS,
-            #"SHARPEN": ImageFilter.SHARPEN,
-            #"SMOOTH": ImageFilter.SMOOTH,
-            "SMOOTH_MORE": ImageFilter.SMOOTH_MORE,
-            "DETAIL": ImageFilter.DETAIL,
-            "BLUR": ImageFilter.BLUR,
-            #"GaussianBlur": ImageFilter.GaussianBlur,
-            #"UnsharpMask": ImageFilter.UnsharpMask,
-            #"GaussianBlur": ImageFilter.GaussianBlur,
-            #"BoxBlur": ImageFilter.BoxBlur,
-            #"MedianFilter": ImageFilter.MedianFilter,
-        }
+        self.filter_map = FILTER_MAP  # エッジ検出フィルタ
         # ハイブリッドディザリングの設定
         self.hybrid_dither_type = IntVar(value=0)   # 0=bayer, 1=random, 2=clustered
         self.hybrid_matrix_size = IntVar(value=4)   # 2, 4, 8
@@ -255,6 +178,15 @@ class App(TkinterDnD.Tk):
         self.queue = queue.Queue()
         # キューを定期的にチェック
         self.check_queue()
+        # 印刷キュー（印刷は作業スレッドで行い、状態はメインスレッドで表示）
+        # スプールが有効な場合は、送信前の印刷データを保存して異常終了・切断後に再開
+        spool = None
+        if self.config.get("print_spool_enabled", True):
+            try:
+                spool = PrintSpool()
+            except OSError as e:
+                self.show_error(f"スプールを使用できません（印刷データは保存されません）:\n{e}", "スプールエラー")
+        self.print_queue = PrintQueue(on_update=lambda job: self.queue.put(lambda: self.on_print_job_update(job)), spool=spool)
 
         # タイトル設定
         self.title("MiniCapturePrint")
@@ -264,34 +196,40 @@ class App(TkinterDnD.Tk):
         self.resizable(False, False)
 
         # TM88IVクラス用設定
-        self.tm88iv_config = {
-            "emoji_font_file": self.src_dir / "../fonts/OpenMoji-black-glyf.ttf",  # 絵文字フォント
-            "kanji_font_file": self.src_dir / "../fonts/NotoSansCJKjp-Medium.otf", # 日本語フォント
-            "fallback_font_file_p01": self.src_dir / "../fonts/unifont_jp-17.0.03.otf",   # フォールバックフォント Unifont (BMP)
-            "fallback_font_file_p2": self.src_dir / "../fonts/unifont_upper-17.0.03.otf", # フォールバックフォント Unifont (SIP)
-            "fallback_jigmo_file_p01": self.src_dir / "../fonts/jigmo.ttf",  # フォールバックフォント Jigmo Plane 0 (BMP) & Plane 1 (SMP)
-            "fallback_jigmo_file_p2": self.src_dir / "../fonts/jigmo2.ttf",  # フォールバックフォント Jigmo Plane 2 (SIP)
-            "fallback_jigmo_file_p3": self.src_dir / "../fonts/jigmo3.ttf",  # フォールバックフォント JigmoPlane 3 (TIP)
-            # TM88IVクラスの引数ではないけど、ファイルチェックの関係上含める
-            "icon_file": self.src_dir / "minicaptureprint.ico"  # アイコンファイル
-        }
-
-        # 絵文字フォント変更有効化している場合は、設定からフォントファイルを取得して設定
-        emoji_font_enabled = self.config.get("printer_emoji_font_enabled", False)
-        if emoji_font_enabled:
-            self.tm88iv_config["emoji_font_file"] = self.src_dir / "../fonts" / self.config.get("printer_emoji_font","OpenMoji-black-glyf.ttf")
+        self.tm88iv_config = build_tm88iv_config(self.config, self.src_dir)
 
         # 必要なファイルが存在するかチェック
-        for key, path in self.tm88iv_config.items():
-            if not os.path.exists(path):
-                self.show_error(f"必要なファイルが見つかりません: {path}", "ファイルエラー")
-                sys.exit(1)  # アプリケーションを終了
+        for path in missing_files(self.tm88iv_config):
+            self.show_error(f"必要なファイルが見つかりません: {path}", "ファイルエラー")
+            sys.exit(1)  # アプリケーションを終了
+
+        # グリフキャッシュの設定（永続化が有効な場合は前回のキャッシュを読み込む）
+        glyph_cache_file = None
+        if self.config.get("glyph_cache_persist_enabled", True):
+            glyph_cache_file = self.src_dir / "../cache/glyph_cache.pkl"
+        glyph_cache.configure(max_bytes=int(self.config.get("glyph_cache_max_mb", 8)) * 1024 * 1024, cache_file=glyph_cache_file)
+
+        # 処理時間の計測（有効な場合は印刷・プレビューごとに段階別の時間をcache/timing.jsonlへ記録）
+        timing.configure(self.config.get("timing_log_enabled", False))
+        # メトリクスの公開（ポート番号を設定した場合はlocalhostのHTTP、ファイルが有効な場合はcache/metrics.promに書き出し）
+        self.metrics_exporter = None
+        try:
+            metrics_port = int(self.config.get("metrics_port", 0))
+            if metrics_port < 0 or metrics_port > 65535:
+                raise ValueError
+        except (TypeError, ValueError):
+            self.show_error("メトリクスのポート番号は0から65535の範囲の整数で指定してください（0はHTTPで公開しない）", "設定エラー")
+            metrics_port = 0
+        metrics_file = metrics.METRICS_FILE if self.config.get("metrics_file_enabled", False) else None
+        if metrics_port or metrics_file:
+            try:
+                metrics.registry.add_collector(metrics.app_collector(self.print_queue, lambda: getattr(self, "printer_pool", None)))
+                self.metrics_exporter = metrics.MetricsExporter(port=metrics_port, file_path=metrics_file).start()
+            except OSError as e:
+                self.show_error(f"メトリクスを公開できません:\n{e}", "メトリクスエラー")
 
-        # 絵文字の残りの設定を追加
-        if emoji_font_enabled:
-            self.tm88iv_config["emoji_font_size"] = self.config.get("printer_emoji_font_size", 20)  # 絵文字フォントサイズ
-            self.tm88iv_config["emoji_font_adjust_x"] = self.config.get("printer_emoji_font_adjust_x",0) # 絵文字フォントのX座標調整
-            self.tm88iv_config["emoji_font_adjust_y"] = self.config.get("printer_emoji_font_adjust_y",0) # 絵文字フォントのX座標調整
+        # 文字幅テーブルの読み込み（行番号欄と印字幅チェックで共有）
+        display_width.load()
 
         # グローバルホットキーの設定
         enable_hotkey = self.config.get("hotkey_enabled", True)
@@ -323,6 +261,13 @@ class App(TkinterDnD.Tk):
         # フォームとボタンを追加
         self.create_form()
 
+        # プリンタの状態監視・前回送信できなかったジョブの再開（IPアドレスが未設定の場合は印刷時に確認）
+        if all(endpoint["ip"] for endpoint in pool_endpoints(self.config)):
+            try:
+                self.print_queue.resume(self.get_printer_pool())
+            except Exception as e:
+                self.show_error(f"プリンタの準備中にエラーが発生しました:\n{e}")
+
 
     def show_error(self, message, title="エラー"):
         """
@@ -388,6 +333,7 @@ class App(TkinterDnD.Tk):
         Button(self, text="Code128挿入", command=self.input_code128_barcode).place(x=410, y=40, width=100, height=26)
         # 3列目
         Button(self, text="水平線挿入", command=self.insert_horizontal_rule).place(x=10, y=70, width=100, height=26)
+        Button(self, text="テキスト読込", command=self.import_text_file).place(x=110, y=70, width=100, height=26)
         Button(self, text="左寄せ", command=self.insert_align_left).place(x=210, y=70, width=100, height=26)
         Button(self, text="中央寄せ", command=self.insert_align_center).place(x=310, y=70, width=100, height=26)
         Button(self, text="右寄せ", command=self.insert_align_right).place(x=410, y=70, width=100, height=26)
@@ -404,16 +350,18 @@ class App(TkinterDnD.Tk):
         # スクロールバーを追加
         scrollbar = Scrollbar(text_frame, command=self.text_widget.yview)
         scrollbar.place(x=472, y=0, width=20, height=506)
-        # スクロールバーをテキスト入力フィールドに関連付け
-        self.text_widget.configure(yscrollcommand=scrollbar.set)
+        # スクロールバーをテキスト入力フィールドに関連付け（スクロール時は行番号も更新）
+        self.text_widget.configure(yscrollcommand=lambda first, last: [scrollbar.set(first, last), self.schedule_redraw_line_info()])
         # キーリリースイベントで行番号を更新
-        self.text_widget.bind("<KeyRelease>", lambda e: self.redraw_line_info())
+        self.text_widget.bind("<KeyRelease>", lambda e: self.schedule_redraw_line_info())
         # マウスボタンが離されたときも行番号を更新
-        self.text_widget.bind("ButtonRelease-1", lambda e: self.redraw_line_info())
+        self.text_widget.bind("<ButtonRelease-1>", lambda e: self.schedule_redraw_line_info())
         # マウスホイールでスクロールしたときも行番号を更新
-        self.text_widget.bind("<MouseWheel>", lambda e: self.after(50, self.redraw_line_info()))
+        self.text_widget.bind("<MouseWheel>", lambda e: self.schedule_redraw_line_info())
         # テキストウィジェットのサイズ変更時に行番号を更新
-        self.text_widget.bind("<Configure>", lambda e: self.redraw_line_info())
+        self.text_widget.bind("<Configure>", lambda e: self.schedule_redraw_line_info())
+        # 大きなテキストの貼り付けは分割して挿入
+        self.text_widget.bind("<<Paste>>", self._on_text_paste)
 
         # 右側のデザイン
         # ラベルフレームを作成
@@ -475,6 +423,17 @@ class App(TkinterDnD.Tk):
         Button(self, text="設定", command=self.open_settings).place(x=10, y=663, width=47, height=46)
         # デバッグボタン
         #Button(self, text="デバッグ", command=lambda: self.debug_print_text_with_tags(self.text_widget)).place(x=60, y=663, width=47, height=46)
+        # テンプレート保存ボタン
+        Button(self, text="雛形\n保存", command=self.save_template).place(x=60, y=663, width=47, height=46)
+        # 差込印刷ボタン
+        Button(self, text="差込\n印刷", command=self.print_template).place(x=110, y=663, width=47, height=46)
+        # 一括印刷ボタン
+        Button(self, text="一括\n印刷", command=self.print_batch).place(x=160, y=663, width=47, height=46)
+        # 印刷中止ボタン
+        Button(self, text="印刷\n中止", command=self.cancel_print).place(x=210, y=663, width=47, height=46)
+        # 印刷状況
+        self.print_status_label = Label(self, text="", anchor="w")
+        self.print_status_label.place(x=265, y=676, width=405, height=20)
 
         # テキスト印刷
         self.checkbutton7 = Checkbutton(self, text="テキスト印刷", variable=self.text_out_enabled, command=self.update_preview)
@@ -522,13 +481,7 @@ class App(TkinterDnD.Tk):
                 tag_category = category
                 break
 
-        index = start
-        all_have_tag = True
-        while self.text_widget.compare(index, "<", end):
-            if tag_name not in self.text_widget.tag_names(index):
-                all_have_tag = False
-                break
-            index = self.text_widget.index(f"{index} +1c")
+        all_have_tag = self.is_range_tagged(tag_name, start, end)
 
         if tag_category:
             for other_tag in STYLE_TAG_GROUPS[tag_category]:
@@ -539,6 +492,25 @@ class App(TkinterDnD.Tk):
         else:
             self.text_widget.tag_add(tag_name, start, end)
 
+    def is_range_tagged(self, tag_name, start, end):
+        """
+        指定範囲の全文字にタグが付いているかを判定\n
+        Tkは同一タグの隣接範囲を結合して保持するため、開始位置を含むタグ範囲が終了位置まで届いているかで判定できます。
+
+        :param str tag_name: タグ名
+        :param str start: 範囲の開始インデックス
+        :param str end: 範囲の終了インデックス
+        :return: 範囲全体にタグが付いている場合はTrue
+        :rtype: bool
+        """
+        # 開始位置以前から始まる最後のタグ範囲（開始位置を含む範囲があればそれ）
+        tag_range = self.text_widget.tag_prevrange(tag_name, f"{start} +1c")
+        if not tag_range:
+            return False
+        range_start, range_end = tag_range
+        return (self.text_widget.compare(range_start, "<=", start) and
+                self.text_widget.compare(range_end, ">=", end))
+
     def debug_print_text_with_tags(self, text_widget):
         """
         テキストウィジェットの内容とタグ状態をデバッグ出力
@@ -573,17 +545,48 @@ class App(TkinterDnD.Tk):
         :param s: 対象の文字列
         :return: 可視幅（全角文字は2、半角文字は1として計算）
         """
+        return visual_width(s)
+
+    def get_printed_width(self, line_num, line_text):
+        """
+        行の印字幅を計算（横倍角・4倍角の範囲は2倍）
+
+        :param str line_num: 行番号
+        :param str line_text: 行のテキスト
+        :return: 印字幅（全角文字は2、半角文字は1として計算）
+        :rtype: int
+        """
+        line_start = f"{line_num}.0"
+        wide_tags = set(display_width.WIDE_PRINT_TAGS)
+        active = wide_tags & set(self.text_widget.tag_names(line_start))  # 行頭で有効な倍角タグ
+        if not active and not any(self.text_widget.tag_nextrange(tag, line_start, f"{line_num}.end") for tag in wide_tags):
+            return self.get_visual_width(line_text)
+        # タグの切り替わりを追いながら加算
         width = 0
-        for ch in s:
-            ea = unicodedata.east_asian_width(ch)
-            width += 2 if ea in ('W', 'F', 'A') else 1
+        for key, value, _ in self.text_widget.dump(line_start, f"{line_num}.end", tag=True, text=True):
+            if key == "tagon" and value in wide_tags:
+                active.add(value)
+            elif key == "tagoff" and value in wide_tags:
+                active.discard(value)
+            elif key == "text":
+                width += self.get_visual_width(value) * (2 if active else 1)
         return width
 
+    def schedule_redraw_line_info(self):
+        """
+        行番号の再描画を予約（連続したイベントは1フレームにつき1回の再描画にまとめる）
+        """
+        if self._line_info_after_id is not None:
+            return
+        self._line_info_after_id = self.after(LINE_INFO_REDRAW_DELAY, self.redraw_line_info)
+
     def redraw_line_info(self):
         """
-        テキストウィジェットの行番号を更新
+        テキストウィジェットの行番号を更新\n
+        既存のキャンバスアイテムを再利用し、位置や内容が変わった行のみ描き直します。
         """
-        self.line_info_canvas.delete("all")
+        self._line_info_after_id = None
+        slot = 0
         i = self.text_widget.index("@0,0") # 表示開始行
         while True:
             dline = self.text_widget.dlineinfo(i)
@@ -592,15 +595,57 @@ class App(TkinterDnD.Tk):
             y = dline[1]  # 行のY座標を取得
             line_num = str(i).split(".")[0]  # 行番号を取得
             line_text = self.text_widget.get(f"{line_num}.0", f"{line_num}.end")  # 行のテキストを取得
-            vis_width = self.get_visual_width(line_text)  # 可視幅を計算
-
-            # 警告色条件
-            bg_color = "#f4f4f4" if vis_width <= (21 * 2) else "#ffeeba"  # フォントA(12×24)=42桁、漢字フォント(24×24)=21桁以内は通常色、それ以上は警告色(TM-T88IV基準)
-            self.line_info_canvas.create_rectangle(0, y, 64, y + 17, fill=bg_color, outline="")
-            self.line_info_canvas.create_text(4, y+2, anchor="nw", text=f"{line_num:>2}",font=("Consolas", 9))
-            self.line_info_canvas.create_text(32, y+2, anchor="nw", text=f"{vis_width:>2}", font=("Consolas", 9))
+            vis_width = self.get_printed_width(line_num, line_text)  # 倍角を含めた印字幅を計算
+            self._draw_line_info_slot(slot, y, line_num, vis_width)
+            slot += 1
             i = self.text_widget.index(f"{i}+1line") # 次の行へ移動
 
+        # 表示範囲外になったアイテムは非表示にして次回再利用
+        for index in range(slot, len(self._line_info_items)):
+            if self._line_info_state[index] is not None:
+                for item in self._line_info_items[index]:
+                    self.line_info_canvas.itemconfigure(item, state="hidden")
+                self._line_info_state[index] = None
+
+    def _draw_line_info_slot(self, slot, y, line_num, vis_width):
+        """
+        行番号欄の1行分を描画（変更がなければ何もしない）
+
+        :param int slot: 表示上の行位置（0始まり）
+        :param int y: 行のY座標
+        :param str line_num: 行番号
+        :param int vis_width: 印字幅
+        """
+        state = (y, line_num, vis_width)
+        # 警告色条件
+        bg_color = "#f4f4f4" if vis_width <= display_width.PRINTER_LINE_COLUMNS else "#ffeeba"  # フォントA(12×24)=42桁、漢字フォント(24×24)=21桁以内は通常色、それ以上は警告色(TM-T88IV基準)
+
+        if slot >= len(self._line_info_items):
+            rect = self.line_info_canvas.create_rectangle(0, y, 64, y + 17, fill=bg_color, outline="")
+            num_text = self.line_info_canvas.create_text(4, y+2, anchor="nw", text=f"{line_num:>2}",font=("Consolas", 9))
+            width_text = self.line_info_canvas.create_text(32, y+2, anchor="nw", text=f"{vis_width:>2}", font=("Consolas", 9))
+            self._line_info_items.append((rect, num_text, width_text))
+            self._line_info_state.append(state)
+            return
+
+        previous = self._line_info_state[slot]
+        if previous == state:
+            return
+        rect, num_text, width_text = self._line_info_items[slot]
+        if previous is None or previous[0] != y:
+            self.line_info_canvas.coords(rect, 0, y, 64, y + 17)
+            self.line_info_canvas.coords(num_text, 4, y+2)
+            self.line_info_canvas.coords(width_text, 32, y+2)
+        if previous is None or previous[1] != line_num:
+            self.line_info_canvas.itemconfigure(num_text, text=f"{line_num:>2}")
+        if previous is None or previous[2] != vis_width:
+            self.line_info_canvas.itemconfigure(rect, fill=bg_color)
+            self.line_info_canvas.itemconfigure(width_text, text=f"{vis_width:>2}")
+        if previous is None:
+            for item in self._line_info_items[slot]:
+                self.line_info_canvas.itemconfigure(item, state="normal")
+        self._line_info_state[slot] = state
+
     def _on_text_modified(self, event):
         """
         テキストウィジェットの内容が変更されたときに呼び出されるイベントハンドラ
@@ -610,6 +655,10 @@ class App(TkinterDnD.Tk):
         """
         if self._is_handling_modified:
             return
+        if self._is_importing_text:
+            # 分割読込中は読込完了時にまとめてタグを適用
+            self.text_widget.edit_modified(False)
+            return
         self._is_handling_modified = True
 
         widget = event.widget
@@ -619,6 +668,83 @@ class App(TkinterDnD.Tk):
 
         self._is_handling_modified = False
 
+    def import_text_file(self):
+        """
+        テキストファイルを選択してカーソル位置に読み込みます。
+        """
+        if self._is_importing_text:
+            return
+        path = filedialog.askopenfilename(parent=self, title="テキストファイルを選択",
+                                          filetypes=[("テキスト", "*.txt *.log *.csv *.md"), ("すべてのファイル", "*.*")])
+        if not path:
+            return
+        try:
+            raw = Path(path).read_bytes()
+            try:
+                text = raw.decode("utf-8-sig")
+            except UnicodeDecodeError:
+                text = raw.decode("cp932")
+        except Exception as e:
+            self.show_error(f"テキストファイルの読み込み中にエラーが発生しました:\n{e}")
+            return
+        self.insert_text_chunked(text.replace("\r\n", "\n"))
+
+    def _on_text_paste(self, event):
+        """
+        貼り付け時のイベントハンドラ（大きなテキストのみ分割して挿入し、それ以外は標準の貼り付け）
+
+        :param event: イベントオブジェクト
+        :type event: Event
+        """
+        try:
+            text = self.clipboard_get()
+        except TclError:
+            return None
+        if self._is_importing_text or text.count("\n") < TEXT_IMPORT_PASTE_LINES:
+            return None
+        # 選択範囲は標準の貼り付けと同様に置き換え
+        if self.text_widget.tag_ranges("sel"):
+            self.text_widget.delete("sel.first", "sel.last")
+        self.insert_text_chunked(text)
+        return "break"
+
+    def insert_text_chunked(self, text, index="insert"):
+        """
+        テキストを分割して挿入します（画面を固めないよう、afterで少しずつ挿入）。\n
+        挿入中はタグの再適用を保留し、完了時に1回だけ配置・バーコードのタグを適用します。
+
+        :param str text: 挿入するテキスト
+        :param str index: 挿入位置
+        """
+        lines = text.splitlines(keepends=True)
+        total = len(lines)
+        if total == 0:
+            return
+        self._is_importing_text = True
+        self.text_widget.mark_set("import_pos", index)
+        self.text_widget.mark_gravity("import_pos", "right")  # 挿入した文字の後ろへ移動
+
+        def insert_chunk(start):
+            end = min(start + TEXT_IMPORT_CHUNK_LINES, total)
+            self.text_widget.insert("import_pos", "".join(lines[start:end]))
+            self.title(f"MiniCapturePrint - 読込中 {end * 100 // total}% ({end}/{total}行)")
+            if end < total:
+                self.after(1, insert_chunk, end)
+            else:
+                finish()
+
+        def finish():
+            self.text_widget.mark_unset("import_pos")
+            self.text_widget.edit_modified(False)
+            self._is_importing_text = False
+            # まとめてタグを適用
+            self.reapply_alignment_tags()
+            self.apply_barcode_tags()
+            self.schedule_redraw_line_info()
+            self.title("MiniCapturePrint")
+
+        insert_chunk(0)
+
     def update_hybrid_button_state(self):
         """
         ハイブリッドモード選択時だけ詳細設定ボタンを有効化
@@ -742,63 +868,6 @@ class App(TkinterDnD.Tk):
         for rb in self.filter_radio_buttons:
             rb.config(state="normal" if enabled else "disabled")
 
-    def hybrid_dithering(self, image, edge_threshold=128, dither_type=0, matrix_size=4, filter_type="FIND_EDGES", filter_enabled=True, random_seed=0):
-        """
-        ハイブリッドディザリングを適用
-
-        :param image: 入力画像（Pillow Image オブジェクト）
-        :param edge_threshold: 2値化のしきい値
-        :param matrix_size: マトリックスのサイズ
-        :return: ハイブリッドディザリング後の画像
-        """
-        # matrix_size確認
-        if matrix_size & (matrix_size - 1) != 0:
-            current_function = inspect.currentframe().f_code.co_name
-            messagebox.showerror("エラー", f"関数: {current_function}\nmatrix_sizeは2のべき乗で無ければいけない")
-            return
-
-        # グレースケールに変換
-        image = image.convert("L")
-        width, height = image.size
-        
-        if filter_enabled:
-            # フィルタの設定を取得
-            config_edge_detection = self.filter_map.get(filter_type, ImageFilter.FIND_EDGES)
-            # フィルタを適用
-            edges = image.filter(config_edge_detection)
-            edge_pixels = np.array(edges, dtype=np.uint8)
-            edge_pixels = (edge_pixels - edge_pixels.min()) / (np.ptp(edge_pixels) + 1e-5) * 255
-        else:
-            edge_pixels = np.full((height, width), edge_threshold)  # 全体を同一値に設定
-
-        if dither_type == 0:
-            # Bayer マトリックスを生成
-            matrix = bayer_matrix(matrix_size) * 255 # 0-255 の範囲にスケール
-        if dither_type == 1:
-            # random マトリックスを生成
-            matrix = random_matrix(matrix_size, random_seed) * 255
-        elif dither_type == 2:
-            # clustered マトリクスを生成
-            matrix = clustered_matrix(matrix_size) * 255
-
-        matrix = np.tile(matrix, (height // matrix_size + 1, width // matrix_size + 1))
-        matrix = matrix[:height, :width]
-
-        # ピクセルデータを取得
-        pixels = np.array(image)
-
-        # ハイブリッドディザリングを適用
-        result = np.zeros_like(pixels, dtype=np.uint8)
-        for y in range(height):
-            for x in range(width):
-                if edge_pixels[y, x] > edge_threshold or filter_enabled == False:  # エッジ部分
-                    result[y, x] = 255 if pixels[y, x] > matrix[y, x] else 0
-                else:  # 無地部分
-                    result[y, x] = 255 if pixels[y, x] > edge_threshold else 0
-
-        # 新しい画像を作成
-        return Image.fromarray(result, mode="L")
-
     def update_preview(self, image=None):
         """
         ラジオボタン、スライダー、チェックボックスの値に基づいて画像を更新します。
@@ -821,67 +890,35 @@ class App(TkinterDnD.Tk):
             if image is None:
                 image = self.original_image.copy()
 
-            # RGBAモードの場合はRGBに変換
-            if image.mode == "RGBA":
-                if self.alpha_channel_enabled.get():
-                    background = Image.new("RGB", image.size, (255, 255, 255))  # 白背景
-                    background.paste(image, mask=image.split()[-1])
-                    image = background
-                image = image.convert("RGB")
-
-            # 画像の幅と高さを取得
-            width, height = image.size
-
-            # 幅がプリンタ画像最大値未満、以上の場合は最大値に拡大
-            if (self.auto_enlarge_enabled.get() and width < self.printer_image_max_width) or width > self.printer_image_max_width: 
-                # プリンタの画像最大幅をセット
-                new_width = self.printer_image_max_width
-                # アスペクト比を計算
-                aspect_ratio = height / width
-                # 高さをアスペクト比に基づいて計算
-                new_height = int(new_width * aspect_ratio)
-                # 画像をリサイズ
-                image = image.resize((new_width, new_height), Image.LANCZOS)
-
-            # コントラスト強調
-            if self.contrast_enabled.get():
-                enhancer = ImageEnhance.Contrast(image)
-                image = enhancer.enhance(2.0)
-            
-            # 反転
-            if self.image_invert_enabled.get():
-                image = ImageOps.invert(image)
-
-            # 明るさ調整
-            image = ImageEnhance.Brightness(image).enhance(self.brightness_slider.get())
-
-            # ディザリング
-            if self.dither_mode.get() == 1:  
-                image = image.convert("1")
-            # 2値化
-            elif self.dither_mode.get() == 2:
-                image = image.convert("L")
-                image = image.point(lambda x: 255 if x > 128 else 0, mode='1')
-            # ハイブリッドディザリング
-            elif self.dither_mode.get() == 3:
-                image = self.hybrid_dithering(image,
-                                              dither_type=self.hybrid_dither_type.get(),
-                                              matrix_size=self.hybrid_matrix_size.get(),
-                                              filter_type=self.hybrid_filter_type.get(),
-                                              filter_enabled=self.hybrid_filter_enabled.get() == 1,
-                                              random_seed=self.hybrid_random_seed.get())
-
-            # 処理後の画像を保持
-            self.processed_image = image
-
-            # Tkinterで表示可能な形式に変換
-            image_tk = ImageTk.PhotoImage(self.processed_image)
-
-            # Canvasをクリアして新しい画像を表示
-            self.picture_canvas.delete("all")
-            self.image_id = self.picture_canvas.create_image(current_x, current_y, anchor="nw", image=image_tk)
-            self.image_tk = image_tk  # 参照を保持
-            self.picture_canvas.config(scrollregion=self.picture_canvas.bbox(self.image_id))
+            # 処理時間の計測（設定で有効な場合のみ）
+            with timing.measure("preview"):
+                # 画像処理（リサイズ・補正・ディザリング）
+                image = process_image(image,
+                                      max_width=self.printer_image_max_width,
+                                      auto_enlarge=self.auto_enlarge_enabled.get(),
+                                      alpha_to_white=self.alpha_channel_enabled.get(),
+                                      contrast=self.contrast_enabled.get(),
+                                      invert=self.image_invert_enabled.get(),
+                                      brightness=self.brightness_slider.get(),
+                                      dither_mode=self.dither_mode.get(),
+                                      dither_type=self.hybrid_dither_type.get(),
+                                      matrix_size=self.hybrid_matrix_size.get(),
+                                      filter_type=self.hybrid_filter_type.get(),
+                                      filter_enabled=self.hybrid_filter_enabled.get() == 1,
+                                      random_seed=self.hybrid_random_seed.get())
+
+                # 処理後の画像を保持
+                self.processed_image = image
+
+                # Tkinterで表示可能な形式に変換
+                with timing.stage("preview_display"):
+                    image_tk = ImageTk.PhotoImage(self.processed_image)
+
+                    # Canvasをクリアして新しい画像を表示
+                    self.picture_canvas.delete("all")
+                    self.image_id = self.picture_canvas.create_image(current_x, current_y, anchor="nw", image=image_tk)
+                    self.image_tk = image_tk  # 参照を保持
+                    self.picture_canvas.config(scrollregion=self.picture_canvas.bbox(self.image_id))
 
             # ドラッグ＆ドロップを有効化
             self.enable_image_drag()
@@ -1329,25 +1366,300 @@ class App(TkinterDnD.Tk):
         self.text_widget.insert("insert", "<ALIGN:RIGHT>\n")  # <ALIGN:RIGHT>タグを挿入
         self.reapply_alignment_tags()
 
+    def get_printer_handler(self):
+        """
+        プリンタを取得（設定が変わらない限り同じものを使い回し、接続を保持します）
+
+        :rtype: PrinterHandler
+        """
+        settings = (self.config.get("printer_ip", ""), int(self.config.get("printer_port", 9100)),
+                    self.config.get("image_max_width", 512), self.config.get("text_render_mode", "native"),
+                    int(self.config.get("printer_keepalive_seconds", connection.CONNECTION_IDLE_TIMEOUT)))
+        if getattr(self, "_printer_settings", None) != settings:
+            printer_ip, port, media_width, render_mode, idle_timeout = settings
+            self.printer_handler = PrinterHandler(ip_address=printer_ip, media_width=media_width, config=self.tm88iv_config,
+                                                  render_mode=render_mode, port=port, idle_timeout=idle_timeout)
+            self._printer_settings = settings
+        return self.printer_handler
+
+    def get_printer_pool(self):
+        """
+        印刷先のプリンタプールを取得（設定が変わらない限り同じものを使い回し、プリンタごとの実績を保持します）\n
+        プリンタプールが未設定の場合は、IPアドレス・ポート番号の設定のプリンタ1台のプールになります。
+
+        :rtype: PrinterPool
+        """
+        endpoints = pool_endpoints(self.config)
+        settings = (tuple((e["ip"], e["port"], e["weight"]) for e in endpoints),
+                    self.config.get("image_max_width", 512), self.config.get("text_render_mode", "native"),
+                    int(self.config.get("printer_keepalive_seconds", connection.CONNECTION_IDLE_TIMEOUT)),
+                    int(self.config.get("printer_status_interval", STATUS_POLL_INTERVAL)))
+        if getattr(self, "_printer_pool_settings", None) != settings:
+            _, media_width, render_mode, idle_timeout, _ = settings
+            members = [PoolMember(PrinterHandler(ip_address=e["ip"], media_width=media_width, config=self.tm88iv_config,
+                                                 render_mode=render_mode, port=e["port"], idle_timeout=idle_timeout),
+                                  weight=e["weight"])
+                       for e in endpoints]
+            self.printer_pool = PrinterPool(members)
+            self._printer_pool_settings = settings
+            self.start_status_monitors(members)
+        return self.printer_pool
+
+    def start_status_monitors(self, members):
+        """
+        プリンタプールの各プリンタの状態監視を開始（以前の監視は停止）
+
+        :param members: プリンタ（PoolMember）のリスト
+        """
+        for monitor in self.status_monitors:
+            monitor.stop()
+        self.status_monitors = []
+        interval = int(self.config.get("printer_status_interval", STATUS_POLL_INTERVAL))
+        if interval <= 0:
+            return  # 状態監視が無効
+        for member in members:
+            monitor = StatusMonitor(member.handler.connection, interval, on_change=self.on_printer_status_change)
+            monitor.start()
+            self.status_monitors.append(monitor)
+
+    def on_printer_status_change(self, monitor, status):
+        """
+        プリンタの状態が変わったときの処理（監視スレッドから呼ばれる）
+
+        印刷できる状態に戻った場合は、再送待ちのジョブをすぐに再送します。
+
+        :param StatusMonitor monitor: 状態が変わったプリンタの監視
+        :param status: 最新の状態（status_monitor.PrinterStatus）
+        """
+        if status.ready:
+            self.print_queue.retry_now()
+        self.queue.put(self.update_tray_status)
+
+    def get_tray_status(self):
+        """
+        タスクトレイに表示するプリンタの状態
+
+        :return: (ツールチップの文字列, 状態の段階（"ok"・"warning"・"error"）)
+        :rtype: tuple[str, str]
+        """
+        level = "ok"
+        problems = []
+        for monitor in self.status_monitors:
+            status = monitor.status
+            if status is None:
+                continue
+            if not status.ready:
+                level = "error"
+            elif status.paper_near_end and level == "ok":
+                level = "warning"
+            if status.describe() != "正常":
+                problems.append(f"{monitor.name}: {status.describe()}")
+        return "\n".join(["MiniCapturePrint"] + problems), level
+
+    def update_tray_status(self):
+        """
+        タスクトレイのアイコン・ツールチップにプリンタの状態を表示（状態が変わったときにメインスレッドで呼び出し）
+        """
+        if self.icon is None or self.icon_image is None:
+            return  # タスクトレイの開始時に表示
+        title, level = self.get_tray_status()
+        self.icon.title = title[:127]  # Windowsのツールチップの文字数上限
+        self.icon.icon = self.create_tray_image(level)
+
+    def create_tray_image(self, level):
+        """
+        状態の段階に応じた印を付けたタスクトレイアイコンを作成
+
+        :param str level: 状態の段階（"ok"・"warning"・"error"）
+        :rtype: Image.Image
+        """
+        if level == "ok":
+            return self.icon_image
+        image = self.icon_image.convert("RGBA")
+        draw = ImageDraw.Draw(image)
+        size = min(image.size) // 2
+        color = "#D32F2F" if level == "error" else "#FBC02D"
+        draw.ellipse((image.width - size, image.height - size, image.width - 1, image.height - 1), fill=color, outline="white")
+        return image
+
     def print(self):
         """
-        サーマルプリンタで印字します。
+        サーマルプリンタで印字します。\n
+        現在の画面の内容を印刷キューに投入し、印刷中も次の編集を続けられます。
         """
         # チェック
+        if not all(endpoint["ip"] for endpoint in pool_endpoints(self.config)):
+            messagebox.showerror("エラー", "プリンターのIPアドレスが設定されていません。")
+            return
+
+        try:
+            # 画面の状態を複製してジョブを作成（解析・コンパイル・送信は作業スレッドで実行）
+            started = time.perf_counter()
+            blocks = TextTagParser(self.text_widget).get_blocks()
+            job = PrintJob(blocks=blocks,
+                           image=self.processed_image,
+                           enable_text_print=self.text_out_enabled.get(),
+                           enable_image_print=self.image_out_enabled.get(),
+                           should_cut_paper=self.paper_cut_enabled.get())
+            if job.timing is not None:
+                job.timing.add("text_widget_blocks", time.perf_counter() - started)  # テキストウィジェットからの取得（Tk）
+            pool = self.get_printer_pool()
+            self.print_queue.resume(pool)  # 起動時に再開できなかったジョブを先に印刷
+            self.print_queue.submit(job, pool)
+        except Exception as e:
+            self.show_error(f"印字中にエラーが発生しました:\n{e}")
+
+    def cancel_print(self):
+        """
+        印刷キューの未完了のジョブをすべて中止します（送信中のジョブは送信を止めてプリンタを初期化）。
+        """
+        self.print_queue.cancel_all()
+
+    def on_print_job_update(self, job):
+        """
+        印刷ジョブの状態を表示（メインスレッドで呼び出し）
+
+        :param PrintJob job: 印刷ジョブ
+        """
+        waiting = self.print_queue.waiting_count
+        if job.state == JOB_FAILED:
+            self.print_status_label.config(text=f"印刷{job.number}: エラー")
+            self.show_error(f"印字中にエラーが発生しました:\n{job.error}")
+        elif job.state == JOB_CANCELLED:
+            self.print_status_label.config(text=f"印刷{job.number}: 中止しました")
+        elif job.state == JOB_WAITING and job.retry_at is not None:
+            self.print_status_label.config(text=f"印刷{job.number}: 送信できないため再送を待っています (残り {waiting}件)")
+        elif not job.finished and job.total_bytes:
+            self.print_status_label.config(text=f"印刷{job.number}: {job.member.name}へ送信中 {job.ratio:.0%} (残り {waiting}件)")
+        elif not job.finished:
+            self.print_status_label.config(text=f"印刷{job.number}: {job.member.name}で準備中 (残り {waiting}件)")
+        elif waiting == 0:
+            self.print_status_label.config(text=f"印刷{job.number}: {job.member.name}で完了")
+
+    def save_template(self):
+        """
+        テキストウィジェットの内容を差し込み印刷用のテンプレートとして保存します。\n
+        {項目名}の部分が印刷時に値へ置き換わります。
+        """
+        dlg = InptDialog(self, title="テンプレート保存", prompt="テンプレート名（英数字・_・-）:")
+        name = dlg.result
+        if not name:
+            return
+        if not re.fullmatch(r"[\w\-]+", name):
+            messagebox.showerror("エラー", "テンプレート名には英数字・_・-のみ使用できます。")
+            return
+        try:
+            blocks = TextTagParser(self.text_widget).get_blocks()
+            template.save_template(template.TEMPLATE_DIR / f"{name}.json", blocks)
+        except Exception as e:
+            self.show_error(f"テンプレートの保存中にエラーが発生しました:\n{e}")
+            return
+        messagebox.showinfo("テンプレート保存", f"テンプレート '{name}' を保存しました。")
+
+    def print_template(self):
+        """
+        保存済みのテンプレートに値を入力して印字します。\n
+        テンプレートのコンパイル結果はキャッシュされ、印刷時は差し込み項目のみを描画します。
+        """
         printer_ip = self.config.get("printer_ip", "")
         if not printer_ip:
             messagebox.showerror("エラー", "プリンターのIPアドレスが設定されていません。")
             return
+        template.TEMPLATE_DIR.mkdir(parents=True, exist_ok=True)
+        path = filedialog.askopenfilename(parent=self, title="テンプレートを選択", initialdir=template.TEMPLATE_DIR.resolve(),
+                                          filetypes=[("テンプレート", "*.json")])
+        if not path:
+            return
 
         try:
-            printer = PrinterHandler(ip_address=printer_ip, media_width=self.config.get("image_max_width", 512), config=self.tm88iv_config)
-            printer.print_text_with_tags(text_widget=self.text_widget,
-                                         image_path=self.processed_image,
-                                         enable_text_print=self.text_out_enabled.get(),
-                                         enable_image_print=self.image_out_enabled.get(),
-                                         should_cut_paper=self.paper_cut_enabled.get())
+            printer = self.get_printer_handler()
+            compiled = template.compile_template(printer, template.load_template(path), name=Path(path).stem,
+                                                 should_cut_paper=self.paper_cut_enabled.get())
+            # 差し込み項目の値を入力
+            values = {}
+            for name in compiled.placeholders:
+                dlg = InptDialog(self, title="差込印刷", prompt=f"{name}:")
+                if dlg.result is None:
+                    return
+                values[name] = dlg.result
+            printer.print_template(compiled, values)
         except Exception as e:
             self.show_error(f"印字中にエラーが発生しました:\n{e}")
+        finally:
+            glyph_cache.shared_cache().save()
+
+    def print_batch(self):
+        """
+        保存済みのテンプレートにCSV/JSONLファイルの各行を差し込み、続けて印字します。\n
+        印字は別スレッドで行い、進捗ウィンドウに処理行数・速度・失敗件数を表示します。
+        """
+        printer_ip = self.config.get("printer_ip", "")
+        if not printer_ip:
+            messagebox.showerror("エラー", "プリンターのIPアドレスが設定されていません。")
+            return
+        if hasattr(self, 'batch_window') and self.batch_window.winfo_exists():
+            # 一括印刷中は進捗ウィンドウを表示
+            self.batch_window.deiconify()
+            self.batch_window.lift()
+            return
+        template.TEMPLATE_DIR.mkdir(parents=True, exist_ok=True)
+        template_path = filedialog.askopenfilename(parent=self, title="テンプレートを選択", initialdir=template.TEMPLATE_DIR.resolve(),
+                                                   filetypes=[("テンプレート", "*.json")])
+        if not template_path:
+            return
+        source_path = filedialog.askopenfilename(parent=self, title="データファイルを選択",
+                                                 filetypes=[("CSV / JSONL", "*.csv *.jsonl *.ndjson"), ("すべてのファイル", "*.*")])
+        if not source_path:
+            return
+
+        try:
+            printer = self.get_printer_handler()
+            compiled = template.compile_template(printer, template.load_template(template_path), name=Path(template_path).stem,
+                                                 should_cut_paper=self.paper_cut_enabled.get())
+        except Exception as e:
+            self.show_error(f"テンプレートの読み込み中にエラーが発生しました:\n{e}")
+            return
+
+        # 進捗ウィンドウ
+        self.batch_window = Toplevel(self)
+        top = self.batch_window
+        top.title("一括印刷")
+        top.geometry("360x110")
+        top.resizable(False, False)
+        cancel_event = threading.Event()
+        top.protocol("WM_DELETE_WINDOW", cancel_event.set)
+        status_label = Label(top, text="準備中...", anchor="w")
+        status_label.place(x=10, y=10, width=340, height=40)
+        Button(top, text="中止", command=cancel_event.set).place(x=270, y=65, width=80, height=30)
+
+        def on_progress(progress):
+            summary = progress.summary()
+            self.queue.put(lambda: status_label.winfo_exists() and status_label.config(text=summary))
+
+        def on_finished(progress):
+            top.destroy()
+            message = f"{progress.summary()}\n経過時間: {progress.elapsed:.1f}秒"
+            if progress.cancelled:
+                message = "中止しました。\n" + message
+            if progress.failures:
+                message += "\n\n失敗した行:\n" + "\n".join(f"{row}行目: {error}" for row, error in progress.failures[:10])
+                if progress.failed > 10:
+                    message += f"\n...他 {progress.failed - 10}件"
+                messagebox.showwarning("一括印刷", message)
+            else:
+                messagebox.showinfo("一括印刷", message)
+
+        def run():
+            try:
+                progress = BatchPrintJob(printer, compiled, source_path, progress_callback=on_progress, cancel_event=cancel_event).run()
+                self.queue.put(lambda: on_finished(progress))
+            except Exception as e:
+                error_message = f"一括印刷中にエラーが発生しました:\n{e}"
+                self.queue.put(lambda: [top.destroy(), self.show_error(error_message)])
+            finally:
+                glyph_cache.shared_cache().save()
+
+        threading.Thread(target=run, daemon=True).start()
 
     def start_thread_tray(self):
         """
@@ -1357,14 +1669,23 @@ class App(TkinterDnD.Tk):
             MenuItem("フォームを表示", lambda: self.after(0, self.deiconify)),
             MenuItem("終了", lambda: self.after(0, self.stop_thread_tray))
         )
-        icon_image = Image.open(self.src_dir / "minicaptureprint.ico")
-        self.icon = Icon("MiniCapturePrint", icon_image, "MiniCapturePrint", menu)
+        self.icon_image = Image.open(self.src_dir / "minicaptureprint.ico")
+        title, level = self.get_tray_status()
+        self.icon = Icon("MiniCapturePrint", self.create_tray_image(level), title[:127], menu)
         self.icon.run()
 
     def stop_thread_tray(self):
         """
         タスクトレイアイコンのスレッドを停止
         """
+        # 印刷中のジョブ・状態監視を中止し、保持しているプリンタとの接続を切断（未送信のジョブはスプールに残して次回再開）
+        self.print_queue.stop()
+        for monitor in self.status_monitors:
+            monitor.stop()
+        connection.close_all()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+
         try:
             # タスクトレイアイコンを停止
             if self.icon:
@@ -1,6 +1,7 @@
 from tkinter import Button, Label, Toplevel, Frame, LabelFrame, Entry, Radiobutton, Checkbutton, BooleanVar, StringVar, messagebox
 import ipaddress
 import re
+from printer_pool import parse_endpoints, format_endpoints # printer_pool.pyからのインポート
 
 class SettingsWindow(Toplevel):
     """
@@ -15,7 +16,7 @@ class SettingsWindow(Toplevel):
         """
         super().__init__(master)
         self.title("設定（※設定内容の反映はアプリ再起動後です）")
-        self.geometry("620x600")
+        self.geometry("620x820")
         self.resizable(False, False)
         # 常に最前面に表示
         self.attributes("-topmost", True)
@@ -28,6 +29,8 @@ class SettingsWindow(Toplevel):
         self.config_data = config
         self.printer_ip = StringVar()
         self.printer_port = StringVar()
+        self.printer_keepalive_seconds = StringVar()
+        self.printer_status_interval = StringVar()
         self.image_max_width = StringVar()
         self.image_max_height = StringVar()
         self.startup_mode = StringVar()
@@ -39,6 +42,10 @@ class SettingsWindow(Toplevel):
         self.printer_emoji_font_size = StringVar()
         self.printer_emoji_font_adjust_x = StringVar()
         self.printer_emoji_font_adjust_y = StringVar()
+        self.glyph_cache_persist_enabled = BooleanVar()
+        self.glyph_cache_max_mb = StringVar()
+        self.text_render_mode = StringVar()
+        self.printer_pool = StringVar()
 
         # ウィジェットの作成
         self.create_widgets()
@@ -46,6 +53,8 @@ class SettingsWindow(Toplevel):
 
         # 初期値の設定
         self.image_max_height.config(state="disabled") # 画像の縦幅はpython-escposにて分割されるため
+        # プリンタごとの実績を定期的に表示
+        self.update_pool_stats()
 
     def on_close(self):
         """
@@ -82,6 +91,16 @@ class SettingsWindow(Toplevel):
         label_image_height.place(x=200, y=55, height=21)
         self.image_max_height = Entry(options_frame1, width=20)
         self.image_max_height.place(x=205, y=80, height=21)
+        # 接続保持(秒)
+        label_keepalive = Label(options_frame1, text="接続保持(秒)")
+        label_keepalive.place(x=340, y=5, height=21)
+        self.printer_keepalive_seconds = Entry(options_frame1, width=14)
+        self.printer_keepalive_seconds.place(x=345, y=30, height=21)
+        # 状態監視(秒)
+        label_status_interval = Label(options_frame1, text="状態監視(秒)")
+        label_status_interval.place(x=340, y=55, height=21)
+        self.printer_status_interval = Entry(options_frame1, width=14)
+        self.printer_status_interval.place(x=345, y=80, height=21)
 
         # ラベルフレーム：基本動作
         options_frame2 = LabelFrame(self, text="基本動作")
@@ -138,6 +157,39 @@ class SettingsWindow(Toplevel):
         self.printer_emoji_font_adjust_y = Entry(options_frame3, width=20)
         self.printer_emoji_font_adjust_y.place(x=205, y=130, height=21)
 
+        # ラベルフレーム：パフォーマンス設定
+        options_frame4 = LabelFrame(self, text="パフォーマンス設定")
+        options_frame4.place(x=10, y=600, width=490, height=80)
+        # グリフキャッシュ永続化
+        label_glyph_cache = Label(options_frame4, text="グリフキャッシュ(絵文字・外字の描画結果)")
+        label_glyph_cache.place(x=5, y=5, height=21)
+        check_glyph_cache_persist = Checkbutton(options_frame4, text="ディスクに保存", variable=self.glyph_cache_persist_enabled)
+        check_glyph_cache_persist.place(x=10, y=30, height=21)
+        # グリフキャッシュ上限(MB)
+        label_glyph_cache_max = Label(options_frame4, text="上限(MB)")
+        label_glyph_cache_max.place(x=200, y=5, height=21)
+        self.glyph_cache_max_mb = Entry(options_frame4, width=20)
+        self.glyph_cache_max_mb.place(x=205, y=30, height=21)
+        # テキスト印字方式(標準/一括ラスター)
+        label_text_render_mode = Label(options_frame4, text="テキスト印字方式")
+        label_text_render_mode.place(x=340, y=5, height=21)
+        radio_text_render_native = Radiobutton(options_frame4, text="標準", variable=self.text_render_mode, value="native")
+        radio_text_render_native.place(x=345, y=30, height=21)
+        radio_text_render_raster = Radiobutton(options_frame4, text="ラスター", variable=self.text_render_mode, value="raster")
+        radio_text_render_raster.place(x=400, y=30, height=21)
+
+        # ラベルフレーム：プリンタプール
+        options_frame5 = LabelFrame(self, text="プリンタプール(複数のプリンタに振り分け)")
+        options_frame5.place(x=10, y=690, width=490, height=120)
+        # プリンタ一覧
+        label_printer_pool = Label(options_frame5, text="IPアドレス:ポート*重み をカンマ区切り(空欄の場合はプリンタ設定の1台のみ)")
+        label_printer_pool.place(x=5, y=5, height=21)
+        self.printer_pool = Entry(options_frame5, width=75)
+        self.printer_pool.place(x=10, y=30, height=21)
+        # プリンタごとの実績
+        self.label_pool_stats = Label(options_frame5, text="", anchor="nw", justify="left")
+        self.label_pool_stats.place(x=10, y=55, width=470, height=42)
+
         # ボタン配置
         Button(self, text="保存", command=self.save_config).place(x=510, y=18, width=100, height=30)
         Button(self, text="キャンセル", command=self.destroy).place(x=510, y=58, width=100, height=30)
@@ -175,6 +227,22 @@ class SettingsWindow(Toplevel):
             messagebox.showwarning("警告", "最大画像幅(縦)が無効です。初期値に値に戻します。")
             self.image_max_height.set("960")
 
+        # 接続保持(秒)
+        self.printer_keepalive_seconds.delete(0, "end")
+        self.printer_keepalive_seconds.insert(0, self.config_data.get("printer_keepalive_seconds", "60"))
+        if self._validate_keepalive_seconds(silent=True) is False:
+            messagebox.showwarning("警告", "接続保持(秒)が無効です。初期値に値に戻します。")
+            self.printer_keepalive_seconds.delete(0, "end")
+            self.printer_keepalive_seconds.insert(0, "60")
+
+        # 状態監視(秒)
+        self.printer_status_interval.delete(0, "end")
+        self.printer_status_interval.insert(0, self.config_data.get("printer_status_interval", "5"))
+        if self._validate_status_interval(silent=True) is False:
+            messagebox.showwarning("警告", "状態監視(秒)が無効です。初期値に値に戻します。")
+            self.printer_status_interval.delete(0, "end")
+            self.printer_status_interval.insert(0, "5")
+
         # 起動モード
         startup_mode = self.config_data.get("startup_mode", "form")
         if startup_mode == "form":
@@ -242,6 +310,33 @@ class SettingsWindow(Toplevel):
             messagebox.showwarning("警告", "絵文字フォント位置調節(Y座標)が無効です。初期値に値に戻します。")
             self.printer_emoji_font_adjust_y.set("0")
 
+        # グリフキャッシュ永続化
+        self.glyph_cache_persist_enabled.set(self.config_data.get("glyph_cache_persist_enabled", True))
+
+        # グリフキャッシュ上限(MB)
+        self.glyph_cache_max_mb.delete(0, "end")
+        self.glyph_cache_max_mb.insert(0, self.config_data.get("glyph_cache_max_mb", "8"))
+        if self._validate_glyph_cache_max_mb(silent=True) is False:
+            messagebox.showwarning("警告", "グリフキャッシュ上限が無効です。初期値に値に戻します。")
+            self.glyph_cache_max_mb.delete(0, "end")
+            self.glyph_cache_max_mb.insert(0, "8")
+
+        # テキスト印字方式
+        self.text_render_mode.set(self.config_data.get("text_render_mode", "native"))
+        if self._validate_text_render_mode(silent=True) is False:
+            messagebox.showwarning("警告", "テキスト印字方式が無効です。初期値に値に戻します。")
+            self.text_render_mode.set("native")
+
+        # プリンタプール
+        self.printer_pool.delete(0, "end")
+        try:
+            self.printer_pool.insert(0, format_endpoints(self.config_data.get("printer_pool", [])))
+        except (KeyError, TypeError, ValueError):
+            pass
+        if self._validate_printer_pool(silent=True) is False:
+            messagebox.showwarning("警告", "プリンタプールが無効です。初期値に値に戻します。")
+            self.printer_pool.delete(0, "end")
+
         # ホットキー組み合わせの有効/無効を切り替え
         self._toggle_hotkey_combination()
         # 絵文字フォント設定の有効/無効を切り替え
@@ -264,6 +359,10 @@ class SettingsWindow(Toplevel):
         self.config_data.set("image_max_width", self.image_max_width.get())
         # 最大画像幅(縦／ピクセル)
         self.config_data.set("image_max_height", self.image_max_height.get())
+        # 接続保持(秒)
+        self.config_data.set("printer_keepalive_seconds", self.printer_keepalive_seconds.get())
+        # 状態監視(秒)
+        self.config_data.set("printer_status_interval", self.printer_status_interval.get())
         # 起動モード
         self.config_data.set("startup_mode", self.startup_mode.get())
         # ホットキー有効化
@@ -282,6 +381,14 @@ class SettingsWindow(Toplevel):
         self.config_data.set("printer_emoji_font_adjust_x", self.printer_emoji_font_adjust_x.get())
         # 絵文字フォント位置調節(Y座標)
         self.config_data.set("printer_emoji_font_adjust_y", self.printer_emoji_font_adjust_y.get())
+        # グリフキャッシュ永続化
+        self.config_data.set("glyph_cache_persist_enabled", self.glyph_cache_persist_enabled.get())
+        # グリフキャッシュ上限(MB)
+        self.config_data.set("glyph_cache_max_mb", self.glyph_cache_max_mb.get())
+        # テキスト印字方式
+        self.config_data.set("text_render_mode", self.text_render_mode.get())
+        # プリンタプール
+        self.config_data.set("printer_pool", parse_endpoints(self.printer_pool.get()))
 
         # 設定を保存
         self.config_data.save_config()
@@ -297,6 +404,8 @@ class SettingsWindow(Toplevel):
             self._validate_port(silent) and
             self._validate_max_image_width(silent) and
             self._validate_max_image_height(silent) and
+            self._validate_keepalive_seconds(silent) and
+            self._validate_status_interval(silent) and
             self._validate_startup_mode(silent) and
             self._validate_hotkey_enabled(silent) and
             self._validate_hotkey_combination(silent) and
@@ -305,7 +414,10 @@ class SettingsWindow(Toplevel):
             self._validate_emoji_font_file(silent) and
             self._validate_emoji_font_size(silent) and
             self._validate_emoji_font_adjust_x(silent) and
-            self._validate_emoji_font_adjust_y(silent)
+            self._validate_emoji_font_adjust_y(silent) and
+            self._validate_glyph_cache_max_mb(silent) and
+            self._validate_text_render_mode(silent) and
+            self._validate_printer_pool(silent)
         )
 
     def _validate_ip(self, silent):
@@ -368,6 +480,30 @@ class SettingsWindow(Toplevel):
             return False
         return True
 
+    def _validate_keepalive_seconds(self, silent):
+        """
+        接続保持(秒)の検証
+
+        :param silent: エラーメッセージを表示しない場合はTrue
+        """
+        if not self.printer_keepalive_seconds.get().isdigit():
+            if not silent:
+                messagebox.showerror("エラー", "接続保持は0以上の整数(秒)で指定してください（0の場合は印刷ごとに切断）", parent=self)
+            return False
+        return True
+
+    def _validate_status_interval(self, silent):
+        """
+        状態監視(秒)の検証
+
+        :param silent: エラーメッセージを表示しない場合はTrue
+        """
+        if not self.printer_status_interval.get().isdigit():
+            if not silent:
+                messagebox.showerror("エラー", "状態監視は0以上の整数(秒)で指定してください（0の場合は監視しない）", parent=self)
+            return False
+        return True
+
     def _validate_startup_mode(self, silent):
         """
         起動モードの検証
@@ -488,6 +624,59 @@ class SettingsWindow(Toplevel):
                 messagebox.showerror("エラー", "絵文字フォント位置調節(Y座標)が不正です", parent=self)
             return False
 
+    def _validate_glyph_cache_max_mb(self, silent):
+        """
+        グリフキャッシュ上限(MB)の検証
+
+        :param silent: エラーメッセージを表示しない場合はTrue
+        """
+        try:
+            max_mb = int(self.glyph_cache_max_mb.get())
+            if max_mb <= 0:
+                raise ValueError
+            return True
+        except ValueError:
+            if not silent:
+                messagebox.showerror("エラー", "グリフキャッシュ上限は正の整数(MB)で指定してください", parent=self)
+            return False
+
+    def _validate_text_render_mode(self, silent):
+        """
+        テキスト印字方式の検証
+
+        :param silent: エラーメッセージを表示しない場合はTrue
+        """
+        if self.text_render_mode.get() not in ["native", "raster"]:
+            if not silent:
+                messagebox.showerror("エラー", "テキスト印字方式の指定が不正です（native または raster）", parent=self)
+            return False
+        return True
+
+    def _validate_printer_pool(self, silent):
+        """
+        プリンタプールの検証
+
+        :param silent: エラーメッセージを表示しない場合はTrue
+        """
+        try:
+            for endpoint in parse_endpoints(self.printer_pool.get()):
+                ipaddress.ip_address(endpoint["ip"])
+            return True
+        except ValueError as e:
+            if not silent:
+                messagebox.showerror("エラー", f"プリンタプールの指定が不正です（例: 192.168.10.21:9100*2, 192.168.10.22）\n{e}", parent=self)
+            return False
+
+    def update_pool_stats(self):
+        """
+        プリンタごとの実績（待ちジョブ数・完了・失敗・送信速度）を表示（1秒ごとに更新）
+        """
+        if not self.winfo_exists():
+            return
+        pool = getattr(self.master, "printer_pool", None)
+        self.label_pool_stats.config(text="\n".join(pool.stats()) if pool is not None else "印刷実績はありません")
+        self.after(1000, self.update_pool_stats)
+
     def _toggle_hotkey_combination(self):
         """
         ホットキー組み合わせの入力欄の有効/無効を切り替えるメソッド